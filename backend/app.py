@@ -1,11 +1,21 @@
-from flask import Flask, request, jsonify, Response, send_file
+import atexit
+import os
+import time
+from functools import partial
+from io import BytesIO
+from flask import Flask, request, jsonify, Response, send_file, stream_with_context
 from flask_cors import CORS
 from pathlib import Path
 from models import parser
 from models.storage import XMLStorage
+from models.sqlite_storage import SQLiteStorage
 from models.domain import Resource, Category, Configuration, ConfigurationResource, Client, Instance
 from models.validators import validate_nit, extract_first_date
 from services.billing import BillingService
+from services.sales import SalesService, iter_sales_json, iter_sales_csv
+from services.report_cache import PDFCache
+from services.report_export import stream_invoice_zip, render_invoice_pdf
+from services.report_jobs import ReportJobQueue
 
 app = Flask(__name__)
 CORS(app)  # Permitir CORS para Django frontend
@@ -13,15 +23,120 @@ CORS(app)  # Permitir CORS para Django frontend
 DATA_DIR = Path(__file__).resolve().parent / 'instance' / 'data'
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 DB_FILE = DATA_DIR / 'db.xml'
+SQLITE_FILE = DATA_DIR / 'db.sqlite3'
+REPORTS_DIR = Path(__file__).resolve().parent / 'instance' / 'reports'
+
+# Backend de almacenamiento: 'xml' (por defecto) o 'sqlite'
+app.config['STORAGE_BACKEND'] = os.environ.get('STORAGE_BACKEND', 'xml')
+# Durabilidad de las escrituras: 'none' (solo reemplazo atomico), 'file' (fsync, por defecto) o 'full' (fsync del directorio)
+app.config['STORAGE_DURABILITY'] = os.environ.get(
+    'STORAGE_DURABILITY', 'file')
+# Copia binaria compacta de db.xml (db.snap) para arrancar sin parsear el XML: '1' (por defecto) o '0'
+app.config['STORAGE_BINARY_SNAPSHOT'] = os.environ.get(
+    'STORAGE_BINARY_SNAPSHOT', '1') != '0'
+# db.snap se regenera tras STORAGE_BINARY_IDLE segundos sin cambios en db.xml o cada STORAGE_BINARY_EVERY versiones
+app.config['STORAGE_BINARY_IDLE'] = float(
+    os.environ.get('STORAGE_BINARY_IDLE', 2.0))
+app.config['STORAGE_BINARY_EVERY'] = int(
+    os.environ.get('STORAGE_BINARY_EVERY', 20))
+# Los XML mas grandes que este limite se procesan en modo streaming, por lotes de UPLOAD_BATCH_SIZE
+app.config['STREAMING_UPLOAD_BYTES'] = int(
+    os.environ.get('STREAMING_UPLOAD_BYTES', 8 * 1024 * 1024))
+app.config['UPLOAD_BATCH_SIZE'] = int(
+    os.environ.get('UPLOAD_BATCH_SIZE', 1000))
+# Procesos para costear clientes en paralelo al facturar (0 = en serie)
+app.config['BILLING_WORKERS'] = int(os.environ.get('BILLING_WORKERS', 0))
+# Tamano maximo de la cache de PDFs de facturas en instance/reports (0 = sin cache)
+app.config['PDF_CACHE_BYTES'] = int(
+    os.environ.get('PDF_CACHE_BYTES', 64 * 1024 * 1024))
+# Procesos para generar los PDFs de la exportacion masiva en ZIP (0 o 1 = en serie)
+app.config['REPORT_WORKERS'] = int(
+    os.environ.get('REPORT_WORKERS', os.cpu_count() or 1))
+# Hilos que generan los reportes encolados y trabajos terminados que se conservan en instance/reports/jobs
+app.config['REPORT_JOB_WORKERS'] = int(
+    os.environ.get('REPORT_JOB_WORKERS', 2))
+app.config['REPORT_JOBS_KEEP'] = int(os.environ.get('REPORT_JOBS_KEEP', 100))
+# Antiguedad maxima (segundos) de un trabajo de reporte terminado antes de borrarlo
+app.config['REPORT_JOBS_MAX_AGE'] = float(
+    os.environ.get('REPORT_JOBS_MAX_AGE', 86400))
 
 # Inicializar almacenamiento y servicios
-storage = XMLStorage(DB_FILE)
-billing_service = BillingService(storage)
+if app.config['STORAGE_BACKEND'] == 'sqlite':
+    storage = SQLiteStorage(
+        SQLITE_FILE, durability=app.config['STORAGE_DURABILITY'])
+    # La primera vez se importan los datos existentes de db.xml
+    if storage.is_empty() and DB_FILE.exists():
+        storage.import_xml(DB_FILE)
+else:
+    storage = XMLStorage(
+        DB_FILE, durability=app.config['STORAGE_DURABILITY'],
+        binary_snapshot=app.config['STORAGE_BINARY_SNAPSHOT'],
+        binary_idle=app.config['STORAGE_BINARY_IDLE'],
+        binary_every=app.config['STORAGE_BINARY_EVERY'])
+    # Al apagar se escribe la copia binaria que quedo pendiente
+    atexit.register(storage.flush_binary)
+billing_service = BillingService(
+    storage, workers=app.config['BILLING_WORKERS'])
+sales_service = SalesService(storage)
+pdf_cache = PDFCache(REPORTS_DIR, app.config['PDF_CACHE_BYTES'])
+report_jobs = ReportJobQueue(REPORTS_DIR / 'jobs', app.config['REPORT_JOB_WORKERS'],
+                             keep=app.config['REPORT_JOBS_KEEP'],
+                             max_age=app.config['REPORT_JOBS_MAX_AGE'])
+
+
+def is_large_upload() -> bool:
+    # Indica si el cuerpo de la peticion debe procesarse en modo streaming
+    length = request.content_length
+    return bool(length) and length > app.config['STREAMING_UPLOAD_BYTES']
+
+
+def store_configuration_stream(stream):
+    # Lee el XML de configuraciones por lotes sin armar el documento completo y luego los almacena
+    # El parseo (que sigue el ritmo de la red) termina antes de tomar el bloqueo de escritura:
+    # bulk_write solo aplica los lotes ya parseados y guarda una sola vez al final
+    batches = list(parser.iter_configurations_xml(
+        stream, app.config['UPLOAD_BATCH_SIZE']))
+    return storage.bulk_write(partial(store_configuration_batches, batches))
+
+
+def store_configuration_batches(batches):
+    counts = {
+        'resources': 0,
+        'categories': 0,
+        'configurations': 0,
+        'clients': 0,
+        'instances': 0,
+    }
+    for kind, items in batches:
+        if kind == 'resources':
+            storage.add_resources(items)
+            counts['resources'] += len(items)
+        elif kind == 'categories':
+            storage.add_categories(items)
+            counts['categories'] += len(items)
+            counts['configurations'] += sum(len(c.configurations)
+                                            for c in items)
+        else:
+            storage.add_clients(items)
+            counts['clients'] += len(items)
+            counts['instances'] += sum(len(c.instances) for c in items)
+    return counts
 
 
 # Endpoint para configuraciones (version completa - XML masivo)
 @app.route('/configuracion', methods=['POST'])
 def upload_configuration_xml():
+    if is_large_upload():
+        try:
+            counts = store_configuration_stream(request.stream)
+            return jsonify({
+                'status': 'ok',
+                'message': f"{counts['resources']} recursos, {counts['categories']} categorías, {counts['configurations']} configuraciones, {counts['clients']} clientes, {counts['instances']} instancias creadas",
+                'counts': counts
+            }), 200
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
     data = request.data
     if not data:
         return jsonify({'error': 'No se proporcionó XML'}), 400
@@ -46,10 +161,55 @@ def upload_configuration_xml():
         return jsonify({'error': str(e)}), 500
 
 
+def store_consumption_stream(records, batch_size: int):
+    # Almacena los consumos ya parseados en lotes de batch_size
+    # Retorna el total almacenado y el tiempo de escritura de cada lote
+    count = 0
+    batches = []
+    batch = []
+    for consumption in records:
+        batch.append({
+            'nit': consumption['nit'],
+            'instance_id': consumption['instance_id'],
+            'time_hours': consumption['time'],
+            'date_time': consumption['date_time']
+        })
+        if len(batch) >= batch_size:
+            batches.append(store_consumption_batch(batch))
+            count += len(batch)
+            batch = []
+    if batch:
+        batches.append(store_consumption_batch(batch))
+        count += len(batch)
+    return count, batches
+
+
+def store_consumption_batch(batch):
+    # Escribe un lote de consumos y mide el tiempo de escritura
+    started = time.perf_counter()
+    storage.add_consumptions(batch)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    return {'count': len(batch), 'elapsed_ms': round(elapsed_ms, 3)}
+
+
 # Endpoint para consumos
 @app.route('/consumo', methods=['POST'])
 @app.route('/api/consumos', methods=['POST'])
 def create_consumptions():
+    if is_large_upload():
+        # Parseo incremental (sin el documento completo en memoria) y un solo lote al terminar:
+        # si el XML tiene un error a mitad del archivo no se guarda ningun consumo y el cliente puede reintentar
+        try:
+            parsed = list(parser.iter_consumptions_xml(request.stream))
+            count, batches = store_consumption_stream(parsed, max(len(parsed), 1))
+            return jsonify({
+                'status': 'ok',
+                'message': f"{count} consumos procesados",
+                'count': count,
+                'batches': batches
+            }), 200
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
 
     data = request.data
     if not data:
@@ -57,19 +217,14 @@ def create_consumptions():
     try:
         parsed = parser.parse_consumptions_xml(data.decode('utf-8'))
 
-        # Almacenar consumos
-        for consumption in parsed:
-            storage.add_consumption(
-                nit=consumption['nit'],
-                instance_id=consumption['instance_id'],
-                time_hours=consumption['time'],
-                date_time=consumption['date_time']
-            )
+        # Almacenar todos los consumos del archivo en un solo lote
+        count, batches = store_consumption_stream(parsed, max(len(parsed), 1))
 
         return jsonify({
             'status': 'ok',
-            'message': f"{len(parsed)} consumos procesados",
-            'count': len(parsed)
+            'message': f"{count} consumos procesados",
+            'count': count,
+            'batches': batches
         }), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -453,23 +608,28 @@ def generate_invoices():
 
         start_date = data['start_date']
         end_date = data['end_date']
+        # Modo incremental: solo revisa consumos nuevos desde la ultima corrida incremental
+        incremental = bool(data.get('incremental', False))
 
         # Generar facturas
-        invoices = billing_service.generate_invoices(start_date, end_date)
+        run = billing_service.run_billing(start_date, end_date, incremental)
+        invoices = run['invoices']
 
         if not invoices:
             return jsonify({
                 'status': 'ok',
                 'message': 'No hay consumos pendientes de facturar en el rango especificado',
                 'invoices': [],
-                'count': 0
+                'count': 0,
+                'stats': run['stats']
             }), 200
 
         return jsonify({
             'status': 'ok',
             'message': f'{len(invoices)} facturas generadas exitosamente',
             'invoices': invoices,
-            'count': len(invoices)
+            'count': len(invoices),
+            'stats': run['stats']
         }), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -535,162 +695,168 @@ def get_summary():
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/reporte/factura/<invoice_id>', methods=['GET'])
-def get_invoice_report(invoice_id):
-
-    try:
-        from services.reports import generate_invoice_detail_pdf
-
-        # Obtener datos de la factura
-        invoices = storage.get_invoices()
-        invoice = None
-        for inv in invoices:
-            if inv.get('invoice_number') == invoice_id:
-                invoice = inv
+def build_invoice_data(invoice_id):
+    # Arma los datos del reporte PDF de una factura (LookupError si falta la factura, el cliente o sus consumos)
+    # Obtener datos de la factura
+    invoices = storage.get_invoices()
+    invoice = None
+    for inv in invoices:
+        if inv.get('invoice_number') == invoice_id:
+            invoice = inv
+            break
+
+    if not invoice:
+        raise LookupError('Factura no encontrada')
+
+    # Obtener datos del cliente (sin get_all_data, que serializa todos los consumos)
+    clients = storage.get_clients()
+    client = None
+    for c in clients:
+        if c.get('nit') == invoice.get('client_nit'):
+            client = c
+            break
+
+    if not client:
+        raise LookupError('Cliente no encontrado')
+
+    # Los consumption_ids de la factura son los IDs estables de los consumos
+    invoice_consumptions = []
+    for consumption in storage.get_consumptions_by_ids(invoice.get('consumption_ids', [])):
+        # Verificar que el consumo pertenece al cliente
+        if consumption.get('nit') == invoice.get('client_nit'):
+            invoice_consumptions.append(consumption)
+
+    if not invoice_consumptions:
+        raise LookupError('No se encontraron consumos para esta factura')
+
+    # Obtener recursos
+    resources = storage.get_resources()
+
+    # Construir datos para el reporte agrupados por instancia
+    instances_data = {}
+    
+    for consumption in invoice_consumptions:
+        instance_id = consumption.get('instance_id')
+        time_hours = float(consumption.get('time_hours', 0))
+        date_time = consumption.get('date_time', 'N/A')
+
+        # Buscar instancia en el cliente
+        instance = None
+        for inst in client.get('instances', []):
+            if str(inst.get('id')) == str(instance_id):
+                instance = inst
                 break
 
-        if not invoice:
-            return jsonify({'error': 'Factura no encontrada'}), 404
+        if not instance:
+            continue
+
+        # Obtener configuración de la instancia
+        config_id = instance.get('configuration_id')
+        config = storage.get_configuration_by_id(int(config_id))
+
+        if not config:
+            continue
+
+        # Si la instancia no está en el diccionario, agregarla
+        if instance_id not in instances_data:
+            instances_data[instance_id] = {
+                'instance_id': instance_id,
+                'instance_name': instance.get('name', f'Instancia {instance_id}'),
+                'config_id': config_id,
+                'config_name': config.get('name', 'N/A'),
+                'consumptions': [],
+                'resources': {},  # Diccionario para consolidar recursos
+                'subtotal': 0.0
+            }
 
-        # Obtener datos del cliente
-        clients = storage.get_all_data().get('clients', [])
-        client = None
-        for c in clients:
-            if c.get('nit') == invoice.get('client_nit'):
-                client = c
-                break
+        # Agregar consumo individual con fecha/hora
+        instances_data[instance_id]['consumptions'].append({
+            'date_time': date_time,
+            'time_hours': time_hours  # Asegurar que sea el nombre correcto
+        })
+
+        # Consolidar recursos por instancia
+        for res_config in config.get('resources', []):
+            resource_id = res_config.get('resource_id')
+            quantity = float(res_config.get('quantity', 0))
+
+            # Buscar recurso
+            resource = None
+            for r in resources:
+                if str(r.get('id')) == str(resource_id):
+                    resource = r
+                    break
 
-        if not client:
-            return jsonify({'error': 'Cliente no encontrado'}), 404
+            if resource:
+                cost_per_hour = float(resource.get('value_per_hour', 0))
+                amount = quantity * cost_per_hour * time_hours
+
+                # Consolidar recurso
+                res_key = resource_id
+                if res_key not in instances_data[instance_id]['resources']:
+                    instances_data[instance_id]['resources'][res_key] = {
+                        'name': resource.get('name', 'N/A'),
+                        'abbreviation': resource.get('abbreviation', ''),
+                        'quantity': quantity,
+                        'cost_per_hour': cost_per_hour,
+                        'hours': 0.0,
+                        'amount': 0.0
+                    }
+                
+                # Sumar horas y monto
+                instances_data[instance_id]['resources'][res_key]['hours'] += time_hours
+                instances_data[instance_id]['resources'][res_key]['amount'] += amount
+                instances_data[instance_id]['subtotal'] += amount
+
+    # Convertir diccionario a lista y convertir recursos de dict a list
+    instances_list = []
+    for inst in instances_data.values():
+        inst['resources'] = list(inst['resources'].values())
+        instances_list.append(inst)
+
+    # Preparar datos para el PDF
+    invoice_data = {
+        'invoice': {
+            'number': invoice.get('invoice_number'),
+            'nit': invoice.get('client_nit'),
+            'date': invoice.get('issue_date'),
+            'total': float(invoice.get('total_amount', 0))
+        },
+        'client': {
+            'name': client.get('name', 'N/A'),
+            'nit': client.get('nit', 'N/A'),
+            'address': client.get('address', 'N/A'),
+            'email': client.get('email', 'N/A')
+        },
+        'instances': instances_list
+    }
+    return invoice_data
 
-        # Obtener todos los consumos del sistema
-        all_data = storage.get_all_data()
-        all_consumptions = all_data.get('consumptions', [])
-        
-        # Los consumption_ids de la factura son índices en el array de consumos
-        invoice_consumptions = []
-        for idx_str in invoice.get('consumption_ids', []):
-            try:
-                idx = int(idx_str)
-                if 0 <= idx < len(all_consumptions):
-                    consumption = all_consumptions[idx]
-                    # Verificar que el consumo pertenece al cliente
-                    if consumption.get('nit') == invoice.get('client_nit'):
-                        invoice_consumptions.append(consumption)
-            except (ValueError, IndexError):
-                continue
-
-        if not invoice_consumptions:
-            return jsonify({'error': 'No se encontraron consumos para esta factura'}), 404
-
-        # Obtener recursos
-        resources = all_data.get('resources', [])
-
-        # Construir datos para el reporte agrupados por instancia
-        instances_data = {}
-        
-        for consumption in invoice_consumptions:
-            instance_id = consumption.get('instance_id')
-            time_hours = float(consumption.get('time_hours', 0))
-            date_time = consumption.get('date_time', 'N/A')
-
-            # Buscar instancia en el cliente
-            instance = None
-            for inst in client.get('instances', []):
-                if str(inst.get('id')) == str(instance_id):
-                    instance = inst
-                    break
 
-            if not instance:
-                continue
-
-            # Obtener configuración de la instancia
-            config_id = instance.get('configuration_id')
-            config = storage.get_configuration_by_id(int(config_id))
-
-            if not config:
-                continue
-
-            # Si la instancia no está en el diccionario, agregarla
-            if instance_id not in instances_data:
-                instances_data[instance_id] = {
-                    'instance_id': instance_id,
-                    'instance_name': instance.get('name', f'Instancia {instance_id}'),
-                    'config_id': config_id,
-                    'config_name': config.get('name', 'N/A'),
-                    'consumptions': [],
-                    'resources': {},  # Diccionario para consolidar recursos
-                    'subtotal': 0.0
-                }
-
-            # Agregar consumo individual con fecha/hora
-            instances_data[instance_id]['consumptions'].append({
-                'date_time': date_time,
-                'time_hours': time_hours  # Asegurar que sea el nombre correcto
-            })
-
-            # Consolidar recursos por instancia
-            for res_config in config.get('resources', []):
-                resource_id = res_config.get('resource_id')
-                quantity = float(res_config.get('quantity', 0))
-
-                # Buscar recurso
-                resource = None
-                for r in resources:
-                    if str(r.get('id')) == str(resource_id):
-                        resource = r
-                        break
-
-                if resource:
-                    cost_per_hour = float(resource.get('value_per_hour', 0))
-                    amount = quantity * cost_per_hour * time_hours
-
-                    # Consolidar recurso
-                    res_key = resource_id
-                    if res_key not in instances_data[instance_id]['resources']:
-                        instances_data[instance_id]['resources'][res_key] = {
-                            'name': resource.get('name', 'N/A'),
-                            'abbreviation': resource.get('abbreviation', ''),
-                            'quantity': quantity,
-                            'cost_per_hour': cost_per_hour,
-                            'hours': 0.0,
-                            'amount': 0.0
-                        }
-                    
-                    # Sumar horas y monto
-                    instances_data[instance_id]['resources'][res_key]['hours'] += time_hours
-                    instances_data[instance_id]['resources'][res_key]['amount'] += amount
-                    instances_data[instance_id]['subtotal'] += amount
-
-        # Convertir diccionario a lista y convertir recursos de dict a list
-        instances_list = []
-        for inst in instances_data.values():
-            inst['resources'] = list(inst['resources'].values())
-            instances_list.append(inst)
-
-        # Preparar datos para el PDF
-        invoice_data = {
-            'invoice': {
-                'number': invoice.get('invoice_number'),
-                'nit': invoice.get('client_nit'),
-                'date': invoice.get('issue_date'),
-                'total': float(invoice.get('total_amount', 0))
-            },
-            'client': {
-                'name': client.get('name', 'N/A'),
-                'nit': client.get('nit', 'N/A'),
-                'address': client.get('address', 'N/A'),
-                'email': client.get('email', 'N/A')
-            },
-            'instances': instances_list
-        }
+@app.route('/reporte/factura/<invoice_id>', methods=['GET'])
+def get_invoice_report(invoice_id):
 
-        # Generar PDF
-        pdf_buffer = generate_invoice_detail_pdf(invoice_data)
+    try:
+        from services.reports import generate_invoice_detail_pdf
+
+        try:
+            # Todas las consultas del reporte leen la misma version de los datos
+            with storage.read_snapshot():
+                invoice_data = build_invoice_data(invoice_id)
+        except LookupError as e:
+            return jsonify({'error': str(e)}), 404
+
+        # Las descargas repetidas se sirven desde la cache mientras los datos no cambien
+        cache_name = pdf_cache.entry_name(invoice_id, invoice_data)
+        pdf = pdf_cache.get(cache_name)
+        if pdf is None:
+            # Generar PDF
+            pdf = generate_invoice_detail_pdf(invoice_data).getvalue()
+            pdf_cache.put(cache_name, pdf)
 
         # Retornar PDF
         return send_file(
-            pdf_buffer,
+            BytesIO(pdf),
             mimetype='application/pdf',
             as_attachment=True,
             download_name=f'factura_{invoice_id}.pdf'
@@ -700,74 +866,135 @@ def get_invoice_report(invoice_id):
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/reporte/facturas/zip', methods=['POST'])
+def export_invoice_reports():
+    # Exporta los PDFs de varias facturas en un ZIP: por numeros de factura o por rango de fechas de emision
+    # Los PDFs se generan en un pool de procesos y el ZIP se envia a medida que se arma
+    try:
+        from datetime import datetime
+
+        data = request.json or {}
+        invoice_numbers = data.get('invoice_numbers')
+        start_date_str = data.get('start_date')
+        end_date_str = data.get('end_date')
+
+        # La seleccion y los datos de todas las facturas salen de la misma version de los datos
+        with storage.read_snapshot():
+            if invoice_numbers:
+                if not isinstance(invoice_numbers, list):
+                    return jsonify({'error': 'invoice_numbers debe ser una lista'}), 400
+                selected = [str(number) for number in invoice_numbers]
+            elif start_date_str and end_date_str:
+                try:
+                    start_date = datetime.strptime(start_date_str, '%d/%m/%Y')
+                    end_date = datetime.strptime(end_date_str, '%d/%m/%Y')
+                except ValueError:
+                    return jsonify({'error': 'Formato de fecha invalido. Use dd/mm/yyyy'}), 400
+
+                selected = []
+                for inv in storage.get_invoices():
+                    try:
+                        issue_date = datetime.strptime(
+                            inv.get('issue_date') or '', '%d/%m/%Y')
+                    except ValueError:
+                        continue
+                    if start_date <= issue_date <= end_date:
+                        selected.append(inv.get('invoice_number'))
+            else:
+                return jsonify({'error': 'Se requiere invoice_numbers o start_date y end_date'}), 400
+
+            # Los datos se arman antes de empezar a enviar, las facturas sin datos se omiten
+            items = []
+            for invoice_number in selected:
+                try:
+                    items.append((invoice_number, build_invoice_data(invoice_number)))
+                except LookupError:
+                    continue
+
+        if not items:
+            return jsonify({'error': 'No hay facturas para exportar'}), 404
+
+        response = Response(
+            stream_with_context(stream_invoice_zip(
+                items, pdf_cache, app.config['REPORT_WORKERS'])),
+            mimetype='application/zip')
+        response.headers['Content-Disposition'] = 'attachment; filename=facturas.zip'
+        return response
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def build_sales_data(analysis_type: str, start_date_str: str, end_date_str: str):
+    # Arma los datos del analisis de ventas del rango (ValueError si las fechas son invalidas, LookupError si no hay facturas)
+    from datetime import datetime
+
+    # Parsear fechas
+    try:
+        start_date = datetime.strptime(start_date_str, '%d/%m/%Y')
+        end_date = datetime.strptime(end_date_str, '%d/%m/%Y')
+    except (TypeError, ValueError):
+        raise ValueError('Formato de fecha invalido. Use dd/mm/yyyy')
+
+    # Analisis por categorias y por recursos de las facturas del rango (una sola pasada)
+    analysis = sales_service.analyze(
+        start_date.toordinal(), end_date.toordinal())
+    if analysis is None:
+        raise LookupError('No hay facturas en el rango de fechas seleccionado')
+
+    # Desglose segun tipo, ya ordenado por ingresos con porcentajes
+    if analysis_type == 'categories':
+        analysis_items = analysis['categories']
+    else:
+        analysis_items = analysis['resources']
+    total_revenue = sum(item['revenue'] for item in analysis_items)
+
+    # Preparar datos para el PDF
+    return {
+        'date_range': {
+            'start': start_date_str,
+            'end': end_date_str
+        },
+        'items': analysis_items,
+        'total_revenue': total_revenue
+    }
+
+
 @app.route('/reporte/ventas', methods=['POST'])
 def get_sales_report():
 
     try:
-        from services.reports import generate_sales_analysis_pdf
-        from datetime import datetime
-
         data = request.json
         analysis_type = data.get('type', 'categories')
         start_date_str = data.get('start_date')
         end_date_str = data.get('end_date')
+        # Formato de salida: 'pdf' (por defecto), 'json' o 'csv'
+        output_format = str(data.get('format') or 'pdf').lower()
 
         if not start_date_str or not end_date_str:
             return jsonify({'error': 'Fechas requeridas'}), 400
+        if output_format not in ('pdf', 'json', 'csv'):
+            return jsonify({'error': 'Formato invalido. Use pdf, json o csv'}), 400
 
-        # Parsear fechas
         try:
-            start_date = datetime.strptime(start_date_str, '%d/%m/%Y')
-            end_date = datetime.strptime(end_date_str, '%d/%m/%Y')
-        except ValueError:
-            return jsonify({'error': 'Formato de fecha invalido. Use dd/mm/yyyy'}), 400
-
-        # Obtener facturas en el rango
-        invoices = storage.get_invoices()
-        filtered_invoices = []
-
-        for invoice in invoices:
-            invoice_date_str = invoice.get('issue_date', '')
-            try:
-                invoice_date = datetime.strptime(invoice_date_str, '%d/%m/%Y')
-                if start_date <= invoice_date <= end_date:
-                    filtered_invoices.append(invoice)
-            except ValueError:
-                continue
-
-        if not filtered_invoices:
-            return jsonify({'error': 'No hay facturas en el rango de fechas seleccionado'}), 404
-
-        # Analizar segun tipo
-        if analysis_type == 'categories':
-            # Analisis por categorias y configuraciones
-            analysis_items = analyze_by_categories(filtered_invoices, storage)
-        else:
-            # Analisis por recursos
-            analysis_items = analyze_by_resources(filtered_invoices, storage)
-
-        # Calcular totales y porcentajes
-        total_revenue = sum(item['revenue'] for item in analysis_items)
-        for item in analysis_items:
-            if total_revenue > 0:
-                item['percentage'] = (item['revenue'] / total_revenue) * 100
-            else:
-                item['percentage'] = 0.0
-
-        # Ordenar por ingresos descendente
-        analysis_items.sort(key=lambda x: x['revenue'], reverse=True)
-
-        # Preparar datos para el PDF
-        analysis_data = {
-            'date_range': {
-                'start': start_date_str,
-                'end': end_date_str
-            },
-            'items': analysis_items,
-            'total_revenue': total_revenue
-        }
+            with storage.read_snapshot():
+                analysis_data = build_sales_data(
+                    analysis_type, start_date_str, end_date_str)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except LookupError as e:
+            return jsonify({'error': str(e)}), 404
+
+        # JSON y CSV se envian directo desde el analisis, sin pasar por reportlab
+        if output_format == 'json':
+            return Response(iter_sales_json(analysis_data, analysis_type), mimetype='application/json')
+        if output_format == 'csv':
+            response = Response(iter_sales_csv(analysis_data), mimetype='text/csv')
+            response.headers['Content-Disposition'] = f'attachment; filename=analisis_ventas_{analysis_type}.csv'
+            return response
 
         # Generar PDF
+        from services.reports import generate_sales_analysis_pdf
         pdf_buffer = generate_sales_analysis_pdf(analysis_data, analysis_type)
 
         # Retornar PDF
@@ -782,179 +1009,122 @@ def get_sales_report():
         return jsonify({'error': str(e)}), 500
 
 
-def analyze_by_categories(invoices, storage):
-    """Analiza ventas por categorias y configuraciones"""
-    category_revenue = {}
+def render_cached_invoice(cache_name: str, invoice_data) -> bytes:
+    # PDF de una factura para un trabajo encolado: desde la cache si existe, si no se genera y se guarda
+    pdf = pdf_cache.get(cache_name)
+    if pdf is None:
+        pdf = render_invoice_pdf(invoice_data)
+        pdf_cache.put(cache_name, pdf)
+    return pdf
 
-    # Obtener todos los datos necesarios
-    all_data = storage.get_all_data()
-    consumptions = all_data.get('consumptions', [])
 
-    for invoice in invoices:
-        # Obtener consumptions usando consumption_ids como indices
-        consumption_ids = invoice.get('consumption_ids', [])
-        
-        for cons_id_str in consumption_ids:
-            try:
-                cons_idx = int(cons_id_str)
-                if 0 <= cons_idx < len(consumptions):
-                    consumption = consumptions[cons_idx]
-                else:
-                    continue
-            except (ValueError, IndexError):
-                continue
-
-            instance_id = consumption.get('instance_id')
-
-            # Buscar cliente e instancia
-            client_nit = invoice.get('client_nit')
-            clients = all_data.get('clients', [])
-            client = None
-            for c in clients:
-                if c.get('nit') == client_nit:
-                    client = c
-                    break
+def render_sales_report(analysis_data, analysis_type: str, output_format: str) -> bytes:
+    # Archivo del analisis de ventas para un trabajo encolado
+    if output_format == 'json':
+        return ''.join(iter_sales_json(analysis_data, analysis_type)).encode('utf-8')
+    if output_format == 'csv':
+        return ''.join(iter_sales_csv(analysis_data)).encode('utf-8')
+    from services.reports import generate_sales_analysis_pdf
+    return generate_sales_analysis_pdf(analysis_data, analysis_type).getvalue()
 
-            if not client:
-                continue
 
-            instance = None
-            for inst in client.get('instances', []):
-                if str(inst.get('id')) == str(instance_id):
-                    instance = inst
-                    break
+def render_invoice_job(invoice_id: str) -> bytes:
+    # Trabajo encolado de una factura: arma los datos con una sola version y genera el PDF
+    # Si falta la factura, el cliente o sus consumos el trabajo termina con ese error
+    with storage.read_snapshot():
+        invoice_data = build_invoice_data(invoice_id)
+    return render_cached_invoice(pdf_cache.entry_name(invoice_id, invoice_data), invoice_data)
+
+
+def render_sales_job(analysis_type: str, start_date_str: str, end_date_str: str, output_format: str) -> bytes:
+    # Trabajo encolado del analisis de ventas: arma el analisis con una sola version y genera el archivo
+    with storage.read_snapshot():
+        analysis_data = build_sales_data(
+            analysis_type, start_date_str, end_date_str)
+    return render_sales_report(analysis_data, analysis_type, output_format)
 
-            if not instance:
-                continue
-
-            # Obtener configuracion
-            config_id = instance.get('configuration_id')
-            config = storage.get_configuration_by_id(config_id)
-
-            if not config:
-                continue
-
-            # Obtener categoria
-            category_id = config.get('category_id')
-            category = storage.get_category_by_id(category_id)
-
-            if not category:
-                continue
-
-            # Calcular ingresos
-            hours = float(consumption.get('time_hours', 0))
-            resources = all_data.get('resources', [])
-            revenue = 0.0
-
-            for res_config in config.get('resources', []):
-                resource_id = res_config.get('resource_id')
-                quantity = float(res_config.get('quantity', 0))
-
-                resource = None
-                for r in resources:
-                    if str(r.get('id')) == str(resource_id):
-                        resource = r
-                        break
-
-                if resource:
-                    value_per_hour = float(resource.get('value_per_hour', 0))
-                    revenue += quantity * value_per_hour * hours
-
-            # Agregar a estadisticas
-            key = f"{category.get('name', 'N/A')} - {config.get('name', 'N/A')}"
-            if key not in category_revenue:
-                category_revenue[key] = {
-                    'name': key,
-                    'description': config.get('description', 'N/A'),
-                    'revenue': 0.0
-                }
-            category_revenue[key]['revenue'] += revenue
-
-    return list(category_revenue.values())
-
-
-def analyze_by_resources(invoices, storage):
-    """Analiza ventas por recursos"""
-    resource_revenue = {}
-
-    # Obtener todos los datos necesarios
-    all_data = storage.get_all_data()
-    consumptions = all_data.get('consumptions', [])
-    resources = all_data.get('resources', [])
-
-    for invoice in invoices:
-        # Obtener consumptions usando consumption_ids como indices
-        consumption_ids = invoice.get('consumption_ids', [])
-        
-        for cons_id_str in consumption_ids:
+
+@app.route('/reporte/trabajos', methods=['POST'])
+def create_report_job():
+    # Encola un reporte y responde de inmediato con el id del trabajo
+    # 'report': 'factura' (invoice_id) o 'ventas' (type, start_date, end_date y format opcional)
+    # Aqui solo se validan los parametros; los datos se arman y el archivo se genera en segundo plano
+    try:
+        from datetime import datetime
+
+        data = request.json or {}
+        report = data.get('report')
+
+        if report == 'factura':
+            invoice_id = data.get('invoice_id')
+            if not invoice_id:
+                return jsonify({'error': 'invoice_id requerido'}), 400
+            invoice_id = str(invoice_id)
+            job = report_jobs.submit('factura', f'factura_{invoice_id}.pdf', 'application/pdf',
+                                     partial(render_invoice_job, invoice_id))
+
+        elif report == 'ventas':
+            analysis_type = data.get('type', 'categories')
+            start_date_str = data.get('start_date')
+            end_date_str = data.get('end_date')
+            output_format = str(data.get('format') or 'pdf').lower()
+
+            if not start_date_str or not end_date_str:
+                return jsonify({'error': 'Fechas requeridas'}), 400
+            if output_format not in ('pdf', 'json', 'csv'):
+                return jsonify({'error': 'Formato invalido. Use pdf, json o csv'}), 400
             try:
-                cons_idx = int(cons_id_str)
-                if 0 <= cons_idx < len(consumptions):
-                    consumption = consumptions[cons_idx]
-                else:
-                    continue
-            except (ValueError, IndexError):
-                continue
-
-            instance_id = consumption.get('instance_id')
-
-            # Buscar cliente e instancia
-            client_nit = invoice.get('client_nit')
-            clients = all_data.get('clients', [])
-            client = None
-            for c in clients:
-                if c.get('nit') == client_nit:
-                    client = c
-                    break
+                datetime.strptime(start_date_str, '%d/%m/%Y')
+                datetime.strptime(end_date_str, '%d/%m/%Y')
+            except (TypeError, ValueError):
+                return jsonify({'error': 'Formato de fecha invalido. Use dd/mm/yyyy'}), 400
+
+            mimetypes = {'pdf': 'application/pdf',
+                         'json': 'application/json', 'csv': 'text/csv'}
+            job = report_jobs.submit('ventas', f'analisis_ventas_{analysis_type}.{output_format}',
+                                     mimetypes[output_format],
+                                     partial(render_sales_job, analysis_type, start_date_str,
+                                             end_date_str, output_format))
 
-            if not client:
-                continue
+        else:
+            return jsonify({'error': "Tipo de reporte invalido. Use 'factura' o 'ventas'"}), 400
 
-            instance = None
-            for inst in client.get('instances', []):
-                if str(inst.get('id')) == str(instance_id):
-                    instance = inst
-                    break
+        return jsonify({'message': 'Reporte encolado', 'job': job}), 202
 
-            if not instance:
-                continue
-
-            # Obtener configuracion
-            config_id = instance.get('configuration_id')
-            config = storage.get_configuration_by_id(config_id)
-
-            if not config:
-                continue
-
-            # Calcular ingresos por recurso
-            hours = float(consumption.get('time_hours', 0))
-
-            for res_config in config.get('resources', []):
-                resource_id = res_config.get('resource_id')
-                quantity = float(res_config.get('quantity', 0))
-
-                # Buscar recurso
-                resource = None
-                for r in resources:
-                    if str(r.get('id')) == str(resource_id):
-                        resource = r
-                        break
-
-                if resource:
-                    value_per_hour = float(resource.get('value_per_hour', 0))
-                    revenue = quantity * value_per_hour * hours
-
-                    # Agregar a estadisticas
-                    key = resource.get('name', 'N/A')
-                    if key not in resource_revenue:
-                        resource_revenue[key] = {
-                            'name': key,
-                            'description': resource.get('type', 'N/A'),
-                            'revenue': 0.0
-                        }
-                    resource_revenue[key]['revenue'] += revenue
-
-    return list(resource_revenue.values())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/reporte/trabajos/<job_id>', methods=['GET'])
+def get_report_job(job_id):
+    # Estado del trabajo: pending, running, done o error
+    job = report_jobs.status(job_id)
+    if job is None:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    return jsonify({'job': job}), 200
+
+
+@app.route('/reporte/trabajos/<job_id>/archivo', methods=['GET'])
+def get_report_job_file(job_id):
+    # Descarga el archivo generado por un trabajo terminado
+    job = report_jobs.status(job_id)
+    if job is None:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    if job['status'] == 'error':
+        return jsonify({'error': job['error'], 'job': job}), 500
+    artifact = report_jobs.artifact(job_id)
+    if artifact is None:
+        return jsonify({'error': 'El reporte aun no esta listo', 'job': job}), 409
+
+    try:
+        return send_file(
+            artifact['path'],
+            mimetype=artifact['mimetype'],
+            as_attachment=True,
+            download_name=artifact['download_name']
+        )
+    except FileNotFoundError:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
 
 
 if __name__ == '__main__':
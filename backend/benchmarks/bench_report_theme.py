@@ -0,0 +1,91 @@
+"""Microbenchmark del tema compartido de reportes PDF.
+
+Mide por separado lo que cada render de factura asignaba antes en estilos
+(hoja de estilos, ParagraphStyle y TableStyle nuevos, mas un ParagraphStyle
+'right' por cada subtotal de instancia) y el render completo con y sin esa
+asignacion. Las variantes se ejecutan intercaladas, ronda por ronda, y se
+reporta la mediana para que el ruido del render no se confunda con el ahorro.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_report_theme [instancias] [rondas]
+"""
+import statistics
+import sys
+import time
+from reportlab.lib.enums import TA_RIGHT
+from reportlab.lib.styles import ParagraphStyle
+from services import reports
+
+
+def sample_invoice(instances: int):
+    # Factura sintetica con varias instancias, consumos y recursos
+    return {
+        'invoice': {'number': 'FAC-000001', 'nit': '1234567-8', 'date': '31/12/2024', 'total': 0.0},
+        'client': {'name': 'Cliente', 'nit': '1234567-8', 'address': 'Ciudad', 'email': 'a@b.com'},
+        'instances': [{
+            'instance_id': str(i),
+            'instance_name': f'Instancia {i}',
+            'config_id': '1',
+            'config_name': 'Configuracion',
+            'consumptions': [{'date_time': '01/12/2024 10:00', 'time_hours': 1.5}] * 3,
+            'resources': [{'name': f'Recurso {r}', 'abbreviation': 'R', 'quantity': 2.0,
+                           'cost_per_hour': 0.5, 'hours': 4.5, 'amount': 4.5} for r in range(3)],
+            'subtotal': 13.5
+        } for i in range(instances)]
+    }
+
+
+def per_render_styles(instances: int):
+    # Estilos que el render de una factura construia antes en cada llamada
+    # ReportTheme tambien arma los estilos de tabla del reporte de ventas: es una cota superior
+    theme = reports.ReportTheme()
+    for _ in range(instances):
+        ParagraphStyle('right', parent=theme.normal, alignment=TA_RIGHT)
+    return theme
+
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    instances = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    invoice_data = sample_invoice(instances)
+    shared = reports.THEME
+
+    def render_before():
+        # Antes: los estilos se construian dentro del render
+        reports.THEME = per_render_styles(instances)
+        try:
+            reports.generate_invoice_detail_pdf(invoice_data)
+        finally:
+            reports.THEME = shared
+
+    def render_after():
+        reports.generate_invoice_detail_pdf(invoice_data)
+
+    print(f'factura con {instances} instancias, {rounds} rondas intercaladas')
+    render_before()  # Calentamiento (fuentes y caches de reportlab)
+    render_after()
+
+    samples = {'estilos por render': [], 'render (antes)': [], 'render (tema compartido)': []}
+    for position in range(rounds):
+        samples['estilos por render'].append(timed(lambda: per_render_styles(instances)))
+        # Se alterna el orden para no favorecer a la variante que corre segunda
+        pair = [('render (antes)', render_before), ('render (tema compartido)', render_after)]
+        for label, render in (pair if position % 2 == 0 else pair[::-1]):
+            samples[label].append(timed(render))
+
+    medians = {label: statistics.median(values) for label, values in samples.items()}
+    for label, value in medians.items():
+        print(f'{label:<28} {value:9.3f} ms (mediana)')
+    before, after = medians['render (antes)'], medians['render (tema compartido)']
+    print(f'diferencia de renders: {before - after:.3f} ms/render; '
+          f'construccion de estilos aislada: {medians["estilos por render"]:.3f} ms/render')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Benchmark del arranque en frio de XMLStorage.
+
+Compara la primera lectura parseando db.xml (y reconstruyendo los indices)
+contra la carga de la copia binaria db.snap, sobre una base sintetica.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_storage_startup [consumos] [repeticiones]
+"""
+import io
+import shutil
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from models.binary_snapshot import dump_binary_snapshot
+from models.storage import XMLStorage
+
+
+def build_database(path: Path, consumptions: int):
+    # Base sintetica: catalogo pequeno, un tercio de los consumos facturados (100 por factura)
+    root = ET.Element('database')
+    resources_node = ET.SubElement(root, 'resources')
+    for r in range(1, 11):
+        res_node = ET.SubElement(resources_node, 'resource', {'id': str(r)})
+        ET.SubElement(res_node, 'name').text = f'Recurso {r}'
+        ET.SubElement(res_node, 'abbreviation').text = f'R{r}'
+        ET.SubElement(res_node, 'metric').text = 'Unidad'
+        ET.SubElement(res_node, 'type').text = 'HARDWARE'
+        ET.SubElement(res_node, 'value_per_hour').text = '10.0'
+    ET.SubElement(root, 'categories')
+    ET.SubElement(root, 'clients')
+
+    consumptions_node = ET.SubElement(root, 'consumptions')
+    invoices_node = ET.SubElement(root, 'invoices')
+    refs = None
+    for i in range(consumptions):
+        cons_node = ET.SubElement(consumptions_node, 'consumption', {
+            'id': str(i), 'nit': f'{i % 200}-K', 'instance_id': str(i % 7)})
+        ET.SubElement(cons_node, 'time_hours').text = '1.5'
+        ET.SubElement(cons_node, 'date_time').text = f'{i % 28 + 1:02d}/{i % 12 + 1:02d}/2024 10:00'
+        if i % 3 == 0:
+            cons_node.set('invoiced', 'true')
+            if refs is None or len(refs) >= 100:
+                invoice_node = ET.SubElement(invoices_node, 'invoice', {
+                    'number': f'FAC-{len(invoices_node):06d}', 'nit': f'{i % 200}-K'})
+                ET.SubElement(invoice_node, 'issue_date').text = '31/12/2024'
+                ET.SubElement(invoice_node, 'total_amount').text = '150.0'
+                refs = ET.SubElement(invoice_node, 'consumptions')
+            ET.SubElement(refs, 'consumption_ref').text = str(i)
+    ET.ElementTree(root).write(path, encoding='utf-8', xml_declaration=True)
+
+
+def cold_start(db_path: Path, binary_snapshot: bool) -> XMLStorage:
+    # Proceso recien iniciado: instancia nueva y primera lectura (arbol e indices listos)
+    storage = XMLStorage(db_path, durability='none',
+                         binary_snapshot=binary_snapshot)
+    storage.snapshot()
+    return storage
+
+
+def bench(label: str, run, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f'{label:<28} {best * 1000:9.1f} ms')
+    return best
+
+
+def main():
+    consumptions = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    work = Path(tempfile.mkdtemp(prefix='bench_storage_'))
+    try:
+        db_path = work / 'db.xml'
+        build_database(db_path, consumptions)
+
+        print(f'{consumptions} consumos, {repeat} repeticiones (mejor tiempo)')
+        # El primer arranque parsea el XML y genera db.snap en segundo plano
+        storage = cold_start(db_path, binary_snapshot=True)
+        storage.flush_binary()
+        snapshot = storage.snapshot()
+        bench('generar db.snap', lambda: dump_binary_snapshot(
+            io.BytesIO(), snapshot.tree.getroot(), snapshot.sizes,
+            snapshot.journal_size, snapshot.index.unbilled_dates, snapshot.stamp[0]), 1)
+        print(f"db.xml  {db_path.stat().st_size / 1e6:8.1f} MB")
+        print(f"db.snap {storage.binary_path.stat().st_size / 1e6:8.1f} MB")
+
+        xml = bench('arranque parseando XML',
+                    lambda: cold_start(db_path, binary_snapshot=False), repeat)
+        binary = bench('arranque desde db.snap',
+                       lambda: cold_start(db_path, binary_snapshot=True), repeat)
+        print(f'mejora: {xml / binary:.1f}x')
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
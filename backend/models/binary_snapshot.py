@@ -0,0 +1,148 @@
+import marshal
+import struct
+import xml.etree.ElementTree as ET
+from typing import List, Mapping, Optional, Tuple
+
+
+# Copia binaria compacta del XML para arrancar rapido; el XML sigue siendo el formato de intercambio
+# Archivo: SNAPSHOT_MAGIC, largo del encabezado (uint32), encabezado marshal (formato, firma del XML) y cuerpo marshal:
+# el XML sin los consumos (se parsea con expat) mas los consumos en columnas con el ordinal de su fecha,
+# asi los indices se restauran sin volver a interpretar las fechas
+SNAPSHOT_MAGIC = b'TCSNAP\n'
+HEADER_LENGTH = struct.Struct('<I')
+SNAPSHOT_FORMAT = 1
+CONSUMPTION_ATTRIBUTES = (['id', 'nit', 'instance_id'],
+                          ['id', 'nit', 'instance_id', 'invoiced'])
+
+
+def is_plain_consumption(cons_node: ET.Element) -> bool:
+    # Consumo con la forma que crea append_consumption_node (el resto se guarda como XML)
+    if cons_node.text is not None or cons_node.tail is not None or len(cons_node) != 2:
+        return False
+    keys = list(cons_node.attrib)
+    if keys not in CONSUMPTION_ATTRIBUTES or cons_node.get('invoiced', 'true') != 'true':
+        return False
+    time_node, date_node = cons_node
+    return (time_node.tag == 'time_hours' and date_node.tag == 'date_time'
+            and not time_node.attrib and not date_node.attrib
+            and len(time_node) == 0 and len(date_node) == 0
+            and time_node.tail is None and date_node.tail is None)
+
+
+def dump_binary_snapshot(f, root: ET.Element, sizes: Mapping[str, int], journal_size: int,
+                         unbilled_dates: Mapping[str, Tuple[int, int, str]], xml_stamp):
+    # Escribe en f la copia binaria del XML con firma xml_stamp
+    # root es un arbol ya indexado (IDs normalizados); de las secciones que solo crecen (sizes) se toman sus primeros
+    # sizes[nombre] hijos, las versiones siguientes agregan al final de la misma seccion
+    # Los ultimos journal_size consumos vienen del diario y no se incluyen: al cargar se vuelven a aplicar desde el diario
+    section = root.find('consumptions')
+    nodes = section[:sizes.get('consumptions', len(section)) - journal_size] if section is not None else []
+
+    # Raiz con las mismas secciones salvo la de consumos, que queda vacia
+    shell = ET.Element(root.tag, dict(root.attrib))
+    shell.text = root.text
+    for child in root:
+        if child is section:
+            placeholder = ET.SubElement(
+                shell, section.tag, dict(section.attrib))
+            placeholder.text = section.text
+            placeholder.tail = section.tail
+        elif child.tag in sizes:
+            bounded = ET.SubElement(shell, child.tag, dict(child.attrib))
+            bounded.text = child.text
+            bounded.tail = child.tail
+            bounded.extend(child[:sizes[child.tag]])
+        else:
+            shell.append(child)
+
+    # Los valores repetidos (NIT, instancia, horas) se guardan una vez y marshal referencia la misma cadena
+    shared = {}.setdefault
+    ids, nits, instance_ids, times, dates, ordinals = [], [], [], [], [], []
+    invoiced = bytearray(len(nodes))
+    extra = {}
+    for position, cons_node in enumerate(nodes):
+        key = cons_node.get('id')
+        if cons_node.get('invoiced') == 'true':
+            invoiced[position] = 1
+            ordinals.append(None)
+        else:
+            entry = unbilled_dates.get(key)
+            ordinals.append(entry[0] if entry is not None else None)
+
+        if is_plain_consumption(cons_node):
+            ids.append(key)
+            nit = cons_node.get('nit')
+            instance_id = cons_node.get('instance_id')
+            time_text = cons_node[0].text
+            date_text = cons_node[1].text
+            nits.append(shared(nit, nit))
+            instance_ids.append(shared(instance_id, instance_id))
+            times.append(shared(time_text, time_text))
+            dates.append(shared(date_text, date_text))
+        else:
+            # fromstring no conserva el texto que sigue al nodo (tail), se guarda aparte
+            extra[position] = (ET.tostring(
+                cons_node, encoding='utf-8'), cons_node.tail)
+            ids.append(None)
+            nits.append(None)
+            instance_ids.append(None)
+            times.append(None)
+            dates.append(None)
+
+    header = marshal.dumps(
+        {'format': SNAPSHOT_FORMAT, 'xml_stamp': xml_stamp})
+    f.write(SNAPSHOT_MAGIC)
+    f.write(HEADER_LENGTH.pack(len(header)))
+    f.write(header)
+    # marshal.loads sobre los bytes completos es mucho mas rapido que marshal.load sobre el archivo
+    f.write(marshal.dumps({
+        'shell': ET.tostring(shell, encoding='utf-8'),
+        'consumptions': (ids, nits, instance_ids, bytes(invoiced), times, dates),
+        'ordinals': ordinals,
+        'extra': extra
+    }))
+
+
+def load_binary_snapshot(path, xml_stamp) -> Optional[Tuple[ET.ElementTree, List[Optional[int]]]]:
+    # Arbol de la copia binaria y ordinales de fecha de sus consumos (para StorageIndex)
+    # None si no existe, esta danada o no corresponde al XML con firma xml_stamp
+    try:
+        with open(path, 'rb') as f:
+            if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+                return None
+            size, = HEADER_LENGTH.unpack(f.read(HEADER_LENGTH.size))
+            header = marshal.loads(f.read(size))
+            if header.get('format') != SNAPSHOT_FORMAT or header.get('xml_stamp') != xml_stamp:
+                return None
+            body = marshal.loads(f.read())
+
+        root = ET.fromstring(body['shell'])
+        ids, nits, instance_ids, invoiced, times, dates = body['consumptions']
+        extra = body['extra']
+        element = ET.Element
+        nodes = []
+        append = nodes.append
+        for key, nit, instance_id, is_invoiced, time_text, date_text in zip(
+                ids, nits, instance_ids, invoiced, times, dates):
+            if key is None:
+                xml, tail = extra[len(nodes)]
+                cons_node = ET.fromstring(xml)
+                cons_node.tail = tail
+                append(cons_node)
+                continue
+            attrib = {'id': key, 'nit': nit, 'instance_id': instance_id}
+            if is_invoiced:
+                attrib['invoiced'] = 'true'
+            cons_node = element('consumption', attrib)
+            time_node = element('time_hours')
+            time_node.text = time_text
+            date_node = element('date_time')
+            date_node.text = date_text
+            cons_node.extend((time_node, date_node))
+            append(cons_node)
+
+        if nodes:
+            root.find('consumptions').extend(nodes)
+        return ET.ElementTree(root), body['ordinals']
+    except (OSError, EOFError, struct.error, ValueError, TypeError, KeyError, IndexError, AttributeError, ET.ParseError):
+        return None
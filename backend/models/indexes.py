@@ -0,0 +1,372 @@
+import xml.etree.ElementTree as ET
+from bisect import bisect_left, bisect_right, insort
+from datetime import date
+from functools import lru_cache
+from math import isqrt
+from operator import itemgetter
+from typing import Dict, Iterator, List, Optional, Tuple
+from .rates import RateTable
+from .revenue import RevenueCube
+from .validators import parse_date_ordinal
+
+
+def consumption_key(cons_id) -> Optional[str]:
+    # Normaliza el ID de un consumo ('07' y 7 son el mismo consumo)
+    try:
+        return str(int(cons_id))
+    except (TypeError, ValueError):
+        return None
+
+
+# Marca de llave borrada en los cambios de un ForkableDict
+_DELETED = object()
+_MISSING = object()
+
+
+class ForkableDict:
+    # Diccionario que se bifurca sin copiarse: una base compartida que nadie modifica mas los cambios propios
+    # Cada version de los indices bifurca el de la anterior en O(cambios), no en O(llaves)
+    # Cuando los cambios pasan de ~4 * raiz(llaves) se aplanan en una base nueva al bifurcar (costo amortizado)
+    # Se recorre en orden de insercion; una llave de la base borrada y vuelta a agregar conserva su posicion
+    __slots__ = ('base', 'changes', 'size')
+
+    def __init__(self, base: Optional[Dict] = None):
+        # base pasa a pertenecer al ForkableDict, quien la entrega no debe volver a modificarla
+        self.base = base if base is not None else {}
+        self.changes = {}
+        self.size = len(self.base)
+
+    def fork(self) -> 'ForkableDict':
+        forked = ForkableDict.__new__(ForkableDict)
+        forked.size = self.size
+        if len(self.changes) > max(64, 4 * isqrt(len(self.base))):
+            forked.base = dict(self.items())
+            forked.changes = {}
+        else:
+            forked.base = self.base
+            forked.changes = dict(self.changes)
+        return forked
+
+    def get(self, key, default=None):
+        value = self.changes.get(key, _MISSING)
+        if value is _MISSING:
+            return self.base.get(key, default)
+        return default if value is _DELETED else value
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key) -> bool:
+        value = self.changes.get(key, _MISSING)
+        if value is _MISSING:
+            return key in self.base
+        return value is not _DELETED
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            self.size += 1
+        self.changes[key] = value
+
+    def setdefault(self, key, value):
+        current = self.get(key, _MISSING)
+        if current is _MISSING:
+            self[key] = value
+            return value
+        return current
+
+    def pop(self, key, default=_MISSING):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            if default is _MISSING:
+                raise KeyError(key)
+            return default
+        if key in self.base:
+            self.changes[key] = _DELETED
+        else:
+            del self.changes[key]
+        self.size -= 1
+        return value
+
+    def __delitem__(self, key):
+        self.pop(key)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def items(self) -> Iterator[Tuple]:
+        changes = self.changes
+        if not changes:
+            yield from self.base.items()
+            return
+        for key, value in self.base.items():
+            change = changes.get(key, _MISSING)
+            if change is _MISSING:
+                yield key, value
+            elif change is not _DELETED:
+                yield key, change
+        base = self.base
+        for key, value in changes.items():
+            if value is not _DELETED and key not in base:
+                yield key, value
+
+    def keys(self) -> Iterator:
+        return (key for key, _ in self.items())
+
+    def values(self) -> Iterator:
+        return (value for _, value in self.items())
+
+    def __iter__(self) -> Iterator:
+        return self.keys()
+
+
+@lru_cache(maxsize=None)
+def month_of(ordinal: int) -> int:
+    # Mes de un ordinal de fecha como anio * 12 + mes - 1 (balde del indice por fecha)
+    day = date.fromordinal(ordinal)
+    return day.year * 12 + day.month - 1
+
+
+def month_bounds(month: int) -> Tuple[int, int]:
+    # Ordinales del primer y ultimo dia de un mes (anio * 12 + mes - 1)
+    year, month_index = divmod(month, 12)
+    first = date(year, month_index + 1, 1).toordinal()
+    if month_index == 11:
+        return first, date(year, 12, 31).toordinal()
+    return first, date(year, month_index + 2, 1).toordinal() - 1
+
+
+class StorageIndex:
+    # Indices hash por llave primaria sobre la copia residente del XML
+    def __init__(self, root: ET.Element, restored: Optional[List[Optional[int]]] = None):
+        # restored: ordinales de fecha de los primeros consumos cuando el arbol viene de la copia binaria
+        self.root = root
+        self.resources: Dict[str, ET.Element] = {}
+        self.categories: Dict[str, ET.Element] = {}
+        # id configuracion -> (nodo configuracion, id categoria)
+        self.configurations: Dict[str, Tuple[ET.Element, str]] = {}
+        self.clients: Dict[str, ET.Element] = {}
+        # (nit, id instancia) -> nodo instancia
+        self.instances: Dict[Tuple[str, str], ET.Element] = {}
+        # id consumo -> nodo consumo, y consumos sin facturar en orden de ingreso
+        # Todos los diccionarios se arman como dict y al terminar (built) pasan a ForkableDict (fork barato por lote)
+        self.built = False
+        self.consumptions: Dict[str, ET.Element] = {}
+        self.unbilled: Dict[str, ET.Element] = {}
+        self.next_consumption_id = 0
+        # Consumos sin facturar por fecha: (ordinal, orden de ingreso, id) en baldes por mes, mas los meses ordenados
+        # Agregar o quitar un consumo es O(1); un rango solo recorre sus meses
+        # Los consumos con fecha invalida no entran, nunca quedan dentro de un rango
+        self.unbilled_by_month: Dict[int, ForkableDict] = {}
+        self.unbilled_months: List[int] = []
+        self.unbilled_dates: Dict[str, Tuple[int, int, str]] = {}
+        self.sequence = 0
+        # Tarifas por hora, se construyen al primer uso y se descartan al cambiar el catalogo
+        self.rates: Optional[RateTable] = None
+        # Cubo de ingresos por facturas, se construye al primer reporte y se actualiza al guardar facturas
+        # revenue_shared: el cubo es de la version anterior y se copia antes de actualizarlo (writable_revenue)
+        self.revenue: Optional[RevenueCube] = None
+        self.revenue_shared = False
+
+        resources_node = root.find('resources')
+        if resources_node is not None:
+            for res_node in resources_node.findall('resource'):
+                self.resources.setdefault(res_node.get('id'), res_node)
+
+        self.index_categories()
+
+        for client_node in root.findall('.//clients/client'):
+            self.index_client(client_node)
+
+        self.index_consumptions(restored)
+
+        self.resources = ForkableDict(self.resources)
+        self.clients = ForkableDict(self.clients)
+        self.instances = ForkableDict(self.instances)
+        self.consumptions = ForkableDict(self.consumptions)
+        self.unbilled = ForkableDict(self.unbilled)
+        self.unbilled_dates = ForkableDict(self.unbilled_dates)
+        self.unbilled_by_month = {month: ForkableDict(bucket)
+                                  for month, bucket in self.unbilled_by_month.items()}
+        self.built = True
+
+    def fork(self, root: ET.Element) -> 'StorageIndex':
+        # Indices para la version de trabajo de un escritor: comparten con esta version lo que no cambian
+        # Los diccionarios se bifurcan (solo se copian sus cambios), los baldes por mes tambien
+        # Las tarifas se comparten (no se modifican) y el cubo de ingresos se copia al actualizarlo
+        index = StorageIndex.__new__(StorageIndex)
+        index.__dict__.update(self.__dict__)
+        index.root = root
+        index.resources = self.resources.fork()
+        index.categories = self.categories.fork()
+        index.configurations = self.configurations.fork()
+        index.clients = self.clients.fork()
+        index.instances = self.instances.fork()
+        index.consumptions = self.consumptions.fork()
+        index.unbilled = self.unbilled.fork()
+        index.unbilled_by_month = {month: bucket.fork()
+                                   for month, bucket in self.unbilled_by_month.items()}
+        index.unbilled_months = list(self.unbilled_months)
+        index.unbilled_dates = self.unbilled_dates.fork()
+        index.revenue_shared = self.revenue is not None
+        return index
+
+    def writable_revenue(self) -> Optional[RevenueCube]:
+        # Cubo de ingresos que el escritor puede actualizar en el lugar; el de la version publicada no cambia
+        if self.revenue is not None and self.revenue_shared:
+            self.revenue = self.revenue.copy()
+        self.revenue_shared = False
+        return self.revenue
+
+    def remap_section(self, name: str, memo: Dict[int, ET.Element]):
+        # Apunta los indices de una seccion copiada (copy.deepcopy con memo) a los nodos de la copia
+        def moved(node):
+            return memo.get(id(node), node)
+
+        if name == 'resources':
+            self.resources = ForkableDict({key: moved(node)
+                                           for key, node in self.resources.items()})
+        elif name == 'categories':
+            self.categories = ForkableDict({key: moved(node)
+                                            for key, node in self.categories.items()})
+            self.configurations = ForkableDict({key: (moved(node), cat_id)
+                                                for key, (node, cat_id) in self.configurations.items()})
+        elif name == 'clients':
+            self.clients = ForkableDict({key: moved(node)
+                                         for key, node in self.clients.items()})
+            self.instances = ForkableDict({key: moved(node)
+                                           for key, node in self.instances.items()})
+
+    def index_categories(self):
+        # Reconstruye categorias y configuraciones (la primera configuracion con un ID gana, igual que la busqueda en orden)
+        categories = {}
+        configurations = {}
+        self.rates = None
+        self.revenue = None
+        for cat_node in self.root.findall('.//categories/category'):
+            cat_id = cat_node.get('id')
+            categories.setdefault(cat_id, cat_node)
+            for config_node in cat_node.findall('.//configurations/configuration'):
+                configurations.setdefault(
+                    config_node.get('id'), (config_node, cat_id))
+        self.categories = ForkableDict(categories)
+        self.configurations = ForkableDict(configurations)
+
+    def index_consumptions(self, restored: Optional[List[Optional[int]]] = None):
+        # Indexa los consumos por su ID estable
+        # Los consumos anteriores a los IDs reciben su posicion, que es el ID que usan las facturas existentes
+        nodes = self.root.findall('.//consumptions/consumption')
+        start = 0
+        if restored is not None:
+            start = self.restore_consumptions(nodes, restored)
+
+        pending = []
+        for position, cons_node in enumerate(nodes[start:], start):
+            key = consumption_key(cons_node.get('id'))
+            if key is None:
+                key = str(position)
+            if key in self.consumptions:
+                pending.append(cons_node)
+                continue
+            cons_node.set('id', key)
+            self.index_consumption(cons_node, key)
+
+        for cons_node in pending:
+            cons_node.set('id', str(self.next_consumption_id))
+            self.index_consumption(cons_node, cons_node.get('id'))
+
+    def restore_consumptions(self, nodes: List[ET.Element], ordinals: List[Optional[int]]) -> int:
+        # Indexa los consumos de la copia binaria: ya tienen IDs unicos y el ordinal de su fecha calculado
+        # Retorna cuantos consumos quedaron indexados
+        restored = nodes[:len(ordinals)]
+        keys = [cons_node.get('id') for cons_node in restored]
+        self.consumptions.update(zip(keys, restored))
+        for key, cons_node, ordinal in zip(keys, restored, ordinals):
+            if cons_node.get('invoiced') != 'true':
+                self.unbilled[key] = cons_node
+                if ordinal is not None:
+                    self.add_unbilled_date((ordinal, self.sequence, key))
+                self.sequence += 1
+        if keys:
+            self.next_consumption_id = max(
+                self.next_consumption_id, max(map(int, keys)) + 1)
+        return len(restored)
+
+    def index_consumption(self, cons_node: ET.Element, key: str):
+        # Registra un consumo y lo agrega a los pendientes si no esta facturado
+        self.consumptions[key] = cons_node
+        if cons_node.get('invoiced') != 'true':
+            self.unbilled[key] = cons_node
+            date_node = cons_node.find('date_time')
+            ordinal = parse_date_ordinal(
+                date_node.text if date_node is not None else None)
+            if ordinal is not None:
+                self.add_unbilled_date((ordinal, self.sequence, key))
+            self.sequence += 1
+        self.next_consumption_id = max(self.next_consumption_id, int(key) + 1)
+
+    def add_unbilled_date(self, entry: Tuple[int, int, str]):
+        # Agrega un consumo sin facturar al balde de su mes (los meses nuevos se insertan ordenados)
+        month = month_of(entry[0])
+        bucket = self.unbilled_by_month.get(month)
+        if bucket is None:
+            bucket = self.unbilled_by_month[month] = ForkableDict() if self.built else {}
+            insort(self.unbilled_months, month)
+        bucket[entry[2]] = entry
+        self.unbilled_dates[entry[2]] = entry
+
+    def mark_invoiced(self, cons_id) -> bool:
+        # Marca un consumo como facturado en O(1)
+        key = consumption_key(cons_id)
+        cons_node = self.consumptions.get(key)
+        if cons_node is None:
+            return False
+        cons_node.set('invoiced', 'true')
+        self.unbilled.pop(key, None)
+        entry = self.unbilled_dates.pop(key, None)
+        if entry is not None:
+            del self.unbilled_by_month[month_of(entry[0])][key]
+        return True
+
+    def unbilled_in_range(self, start_ordinal: int, end_ordinal: int) -> List[ET.Element]:
+        # Consumos sin facturar con fecha en [inicio, fin]: solo se recorren los baldes de los meses del rango
+        # Los meses completos se toman enteros, los de los extremos se filtran por fecha
+        # Se devuelven en orden de ingreso, igual que unbilled
+        start_ordinal = max(start_ordinal, 1)
+        end_ordinal = min(end_ordinal, date.max.toordinal())
+        if start_ordinal > end_ordinal:
+            return []
+        low = bisect_left(self.unbilled_months, month_of(start_ordinal))
+        high = bisect_right(self.unbilled_months, month_of(end_ordinal))
+        entries = []
+        for month in self.unbilled_months[low:high]:
+            bucket = self.unbilled_by_month[month].values()
+            first, last = month_bounds(month)
+            if start_ordinal <= first and last <= end_ordinal:
+                entries.extend(bucket)
+            else:
+                entries.extend(entry for entry in bucket
+                               if start_ordinal <= entry[0] <= end_ordinal)
+        entries.sort(key=itemgetter(1))
+        return [self.unbilled[key] for _, _, key in entries]
+
+    def index_client(self, client_node: ET.Element):
+        # Registra un cliente y sus instancias
+        nit = client_node.get('nit')
+        if nit in self.clients:
+            return
+        self.clients[nit] = client_node
+        for inst_node in client_node.findall('.//instances/instance'):
+            self.instances.setdefault((nit, inst_node.get('id')), inst_node)
+
+    def unindex_client(self, nit: str):
+        # Elimina un cliente y sus instancias de los indices
+        client_node = self.clients.pop(nit, None)
+        if client_node is None:
+            return
+        for inst_node in client_node.findall('.//instances/instance'):
+            key = (nit, inst_node.get('id'))
+            if self.instances.get(key) is inst_node:
+                del self.instances[key]
@@ -0,0 +1,92 @@
+import functools
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos, solo dentro del proceso
+    fcntl = None
+
+
+class FileLock:
+    # Bloqueo consultivo (flock) sobre un archivo .lock junto a la base de datos
+    # Cada adquisicion abre su propio descriptor, asi que tambien excluye a otros hilos del mismo proceso
+    def __init__(self, path: Path):
+        self.path = path
+
+    @contextmanager
+    def shared(self):
+        # Lecturas del archivo: varias a la vez, ninguna durante una escritura
+        with self.hold(fcntl.LOCK_SH if fcntl else None):
+            yield
+
+    @contextmanager
+    def exclusive(self):
+        # Escrituras: un solo escritor entre todos los procesos
+        with self.hold(fcntl.LOCK_EX if fcntl else None):
+            yield
+
+    @contextmanager
+    def hold(self, mode):
+        if mode is None:
+            yield
+            return
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, mode)
+            yield
+        finally:
+            os.close(fd)  # Cerrar el descriptor libera el bloqueo
+
+
+class WriteQueue:
+    # Cola de escrituras del proceso: las mutaciones que llegan mientras otra se guarda esperan juntas
+    # y el primer hilo libre las aplica todas como lider con una sola escritura (run_batch)
+    def __init__(self, run_batch: Callable[[List[Dict]], None]):
+        self.run_batch = run_batch
+        self.condition = threading.Condition()
+        self.pending: List[Dict] = []
+        self.leader = None
+
+    def submit(self, fn: Callable):
+        # Encola la mutacion y espera a que su lote se guarde; retorna su resultado o relanza su error
+        if self.leader == threading.get_ident():
+            return fn()  # Mutacion anidada dentro del lote en curso
+
+        item = {'fn': fn, 'done': False, 'result': None, 'error': None}
+        with self.condition:
+            self.pending.append(item)
+            while not item['done']:
+                if self.leader is None:
+                    batch, self.pending = self.pending, []
+                    self.leader = threading.get_ident()
+                    self.condition.release()
+                    try:
+                        self.run_batch(batch)
+                    except Exception as e:
+                        for entry in batch:
+                            if entry['error'] is None:
+                                entry['error'] = e
+                    finally:
+                        self.condition.acquire()
+                        for entry in batch:
+                            entry['done'] = True
+                        self.leader = None
+                        self.condition.notify_all()
+                else:
+                    self.condition.wait()
+
+        if item['error'] is not None:
+            raise item['error']
+        return item['result']
+
+
+def queued_write(method):
+    # Ejecuta un metodo de escritura del almacenamiento a traves de su cola de escrituras
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        return self.writes.submit(lambda: method(self, *args, **kwargs))
+    return wrapper
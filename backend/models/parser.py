@@ -1,10 +1,86 @@
 import re
 import xml.etree.ElementTree as ET
-from typing import Dict, List, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
 from .domain import Resource, Configuration, ConfigurationResource, Category, Instance, Client
 from .validators import extract_first_date, extract_first_datetime, validate_nit
 
 
+def parse_resource_node(res_node: ET.Element) -> Resource:
+    # Convierte un nodo <recurso> de listaRecursos en Resource
+    return Resource(
+        id=int(res_node.get('id', '0')),
+        name=res_node.findtext('nombre', ''),
+        abbreviation=res_node.findtext('abreviatura', ''),
+        metric=res_node.findtext('metrica', ''),
+        type=res_node.findtext('tipo', 'Hardware'),
+        value_per_hour=float(res_node.findtext('valorXhora', '0'))
+    )
+
+
+def parse_category_node(cat_node: ET.Element) -> Category:
+    # Convierte un nodo <categoria> con sus configuraciones en Category
+    configurations = []
+    config_list_node = cat_node.find('listaConfiguraciones')
+    if config_list_node is not None:
+        for config_node in config_list_node.findall('configuracion'):
+            config_resources = []
+            resources_node = config_node.find('recursosConfiguracion')
+            if resources_node is not None:
+                for res_node in resources_node.findall('recurso'):
+                    config_resources.append(ConfigurationResource(
+                        resource_id=int(res_node.get('id', '0')),
+                        quantity=float(res_node.text or '0')
+                    ))
+
+            configurations.append(Configuration(
+                id=int(config_node.get('id', '0')),
+                name=config_node.findtext('nombre', ''),
+                description=config_node.findtext('descripcion', ''),
+                resources=config_resources
+            ))
+
+    return Category(
+        id=int(cat_node.get('id', '0')),
+        name=cat_node.findtext('nombre', ''),
+        description=cat_node.findtext('descripcion', ''),
+        workload=cat_node.findtext('cargaTrabajo', ''),
+        configurations=configurations
+    )
+
+
+def parse_client_node(client_node: ET.Element) -> Optional[Client]:
+    # Convierte un nodo <cliente> con sus instancias en Client, None si el NIT es invalido
+    nit = client_node.get('nit', '')
+    if not validate_nit(nit):
+        return None
+
+    instances = []
+    instance_list_node = client_node.find('listaInstancias')
+    if instance_list_node is not None:
+        for inst_node in instance_list_node.findall('instancia'):
+            start_date_text = inst_node.findtext('fechaInicio', '')
+            end_date_text = inst_node.findtext('fechaFinal', '')
+            instances.append(Instance(
+                id=int(inst_node.get('id', '0')),
+                configuration_id=int(inst_node.findtext('idConfiguracion', '0')),
+                name=inst_node.findtext('nombre', ''),
+                start_date=extract_first_date(start_date_text),
+                status=inst_node.findtext('estado', 'Vigente'),
+                end_date=extract_first_date(
+                    end_date_text) if end_date_text else None
+            ))
+
+    return Client(
+        nit=nit,
+        name=client_node.findtext('nombre', ''),
+        username=client_node.findtext('usuario', ''),
+        password=client_node.findtext('clave', ''),
+        address=client_node.findtext('direccion', ''),
+        email=client_node.findtext('correoElectronico', ''),
+        instances=instances
+    )
+
+
 def parse_configurations_xml(xml_text: str) -> Tuple[List[Resource], List[Category], List[Client], Dict[str, int]]:
     # Parsea el XML de configuraciones y retorna listas de recursos, categorias y clientes junto con conteos
     root = ET.fromstring(xml_text)
@@ -25,65 +101,14 @@ def parse_configurations_xml(xml_text: str) -> Tuple[List[Resource], List[Catego
     resource_list_node = root.find('listaRecursos')
     if resource_list_node is not None:
         for res_node in resource_list_node.findall('recurso'):
-            res_id = int(res_node.get('id', '0'))
-            name = res_node.findtext('nombre', '')
-            abbr = res_node.findtext('abreviatura', '')
-            metric = res_node.findtext('metrica', '')
-            res_type = res_node.findtext('tipo', 'Hardware')
-            value_per_hour = float(res_node.findtext('valorXhora', '0'))
-
-            resources.append(Resource(
-                id=res_id,
-                name=name,
-                abbreviation=abbr,
-                metric=metric,
-                type=res_type,
-                value_per_hour=value_per_hour
-            ))
+            resources.append(parse_resource_node(res_node))
         counts['resources'] = len(resources)
 
     # Parsear categorias con configuraciones
     category_list_node = root.find('listaCategorias')
     if category_list_node is not None:
         for cat_node in category_list_node.findall('categoria'):
-            cat_id = int(cat_node.get('id', '0'))
-            cat_name = cat_node.findtext('nombre', '')
-            cat_desc = cat_node.findtext('descripcion', '')
-            cat_workload = cat_node.findtext('cargaTrabajo', '')
-
-            configurations = []
-            config_list_node = cat_node.find('listaConfiguraciones')
-            if config_list_node is not None:
-                for config_node in config_list_node.findall('configuracion'):
-                    config_id = int(config_node.get('id', '0'))
-                    config_name = config_node.findtext('nombre', '')
-                    config_desc = config_node.findtext('descripcion', '')
-
-                    config_resources = []
-                    resources_node = config_node.find('recursosConfiguracion')
-                    if resources_node is not None:
-                        for res_node in resources_node.findall('recurso'):
-                            res_id = int(res_node.get('id', '0'))
-                            quantity = float(res_node.text or '0')
-                            config_resources.append(ConfigurationResource(
-                                resource_id=res_id,
-                                quantity=quantity
-                            ))
-
-                    configurations.append(Configuration(
-                        id=config_id,
-                        name=config_name,
-                        description=config_desc,
-                        resources=config_resources
-                    ))
-
-            categories.append(Category(
-                id=cat_id,
-                name=cat_name,
-                description=cat_desc,
-                workload=cat_workload,
-                configurations=configurations
-            ))
+            categories.append(parse_category_node(cat_node))
         counts['categories'] = len(categories)
         counts['configurations'] = sum(
             len(c.configurations) for c in categories)
@@ -92,86 +117,127 @@ def parse_configurations_xml(xml_text: str) -> Tuple[List[Resource], List[Catego
     client_list_node = root.find('listaClientes')
     if client_list_node is not None:
         for client_node in client_list_node.findall('cliente'):
-            nit = client_node.get('nit', '')
-            if not validate_nit(nit):
+            client = parse_client_node(client_node)
+            if client is None:
                 continue  # Saltar NIT invalido
-
-            name = client_node.findtext('nombre', '')
-            username = client_node.findtext('usuario', '')
-            password = client_node.findtext('clave', '')
-            address = client_node.findtext('direccion', '')
-            email = client_node.findtext('correoElectronico', '')
-
-            instances = []
-            instance_list_node = client_node.find('listaInstancias')
-            if instance_list_node is not None:
-                for inst_node in instance_list_node.findall('instancia'):
-                    inst_id = int(inst_node.get('id', '0'))
-                    config_id = int(inst_node.findtext('idConfiguracion', '0'))
-                    inst_name = inst_node.findtext('nombre', '')
-                    start_date_text = inst_node.findtext('fechaInicio', '')
-                    start_date = extract_first_date(start_date_text)
-                    status = inst_node.findtext('estado', 'Vigente')
-                    end_date_text = inst_node.findtext('fechaFinal', '')
-                    end_date = extract_first_date(
-                        end_date_text) if end_date_text else None
-
-                    instances.append(Instance(
-                        id=inst_id,
-                        configuration_id=config_id,
-                        name=inst_name,
-                        start_date=start_date,
-                        status=status,
-                        end_date=end_date
-                    ))
-
-            clients.append(Client(
-                nit=nit,
-                name=name,
-                username=username,
-                password=password,
-                address=address,
-                email=email,
-                instances=instances
-            ))
+            clients.append(client)
         counts['clients'] = len(clients)
         counts['instances'] = sum(len(c.instances) for c in clients)
 
     return resources, categories, clients, counts
 
 
+# Elementos de primer nivel que procesa el modo streaming: (lista, elemento) -> (tipo de lote, conversor)
+CONFIGURATION_STREAM_HANDLERS = {
+    ('listaRecursos', 'recurso'): ('resources', parse_resource_node),
+    ('listaCategorias', 'categoria'): ('categories', parse_category_node),
+    ('listaClientes', 'cliente'): ('clients', parse_client_node),
+}
+
+
+def iter_configurations_xml(source, batch_size: int = 500) -> Iterator[Tuple[str, list]]:
+    # Lee el XML de configuraciones de forma incremental (iterparse) y produce lotes acotados
+    # ('resources' | 'categories' | 'clients', elementos); cada elemento se libera al procesarlo
+    # Igual que parse_configurations_xml (root.find) solo se procesa la primera lista de cada tipo
+    path = []
+    first_lists = {}
+    batch_kind = None
+    batch = []
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            path.append(elem)
+            if len(path) == 2:
+                first_lists.setdefault(elem.tag, elem)
+            continue
+
+        path.pop()
+        if len(path) != 2:
+            continue
+        if first_lists[path[1].tag] is not path[1]:
+            path[1].remove(elem)  # Lista repetida: se descarta sin acumularla
+            continue
+        handler = CONFIGURATION_STREAM_HANDLERS.get((path[1].tag, elem.tag))
+        if handler is None:
+            continue
+
+        kind, parse_node = handler
+        item = parse_node(elem)
+        path[1].remove(elem)
+        if item is None:
+            continue  # Saltar NIT invalido
+
+        if batch and kind != batch_kind:
+            yield batch_kind, batch
+            batch = []
+        batch_kind = kind
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch_kind, batch
+            batch = []
+
+    if batch:
+        yield batch_kind, batch
+
+
+def parse_consumption_node(consumption: ET.Element) -> Optional[Dict[str, str]]:
+    # Convierte un nodo <consumo> en diccionario validado; None si el NIT es invalido
+    nit = consumption.get('nitCliente') or consumption.get('nit') or ''
+    if not validate_nit(nit):
+        return None
+
+    instance_id = consumption.get(
+        'idInstancia') or consumption.get('id') or ''
+    time_value = None
+    date_time_str = None
+
+    time_node = consumption.find('tiempo')
+    if time_node is not None:
+        time_value = time_node.text
+
+    datetime_node = consumption.find('fechaHora')
+    if datetime_node is not None:
+        dt_text = datetime_node.text
+        dt_extracted = extract_first_datetime(dt_text)
+        if dt_extracted:
+            date_part, time_part = dt_extracted
+            date_time_str = f"{date_part} {time_part}"
+        else:
+            date_time_str = dt_text
+
+    return {
+        'nit': nit,
+        'instance_id': instance_id,
+        'time': time_value or '0',
+        'date_time': date_time_str or ''
+    }
+
+
 def parse_consumptions_xml(xml_text: str) -> List[Dict[str, str]]:
     # Parsea el XML de consumos y retorna una lista de diccionarios con datos validados
     root = ET.fromstring(xml_text)
     result = []
     for consumption in root.findall('consumo'):
-        nit = consumption.get('nitCliente') or consumption.get('nit') or ''
-        if not validate_nit(nit):
+        item = parse_consumption_node(consumption)
+        if item is None:
             continue  # Saltar NIT invalido
-
-        instance_id = consumption.get(
-            'idInstancia') or consumption.get('id') or ''
-        time_value = None
-        date_time_str = None
-
-        time_node = consumption.find('tiempo')
-        if time_node is not None:
-            time_value = time_node.text
-
-        datetime_node = consumption.find('fechaHora')
-        if datetime_node is not None:
-            dt_text = datetime_node.text
-            dt_extracted = extract_first_datetime(dt_text)
-            if dt_extracted:
-                date_part, time_part = dt_extracted
-                date_time_str = f"{date_part} {time_part}"
-            else:
-                date_time_str = dt_text
-
-        result.append({
-            'nit': nit,
-            'instance_id': instance_id,
-            'time': time_value or '0',
-            'date_time': date_time_str or ''
-        })
+        result.append(item)
     return result
+
+
+def iter_consumptions_xml(source) -> Iterator[Dict[str, str]]:
+    # Version generadora de parse_consumptions_xml: lee el XML de forma incremental (iterparse)
+    # y produce cada consumo validado sin mantener el documento ni la lista completa en memoria
+    path = []
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            path.append(elem)
+            continue
+
+        path.pop()
+        if len(path) != 1 or elem.tag != 'consumo':
+            continue
+
+        item = parse_consumption_node(elem)
+        path[0].remove(elem)
+        if item is not None:
+            yield item
@@ -0,0 +1,54 @@
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+
+class ResourceRate(NamedTuple):
+    # Aporte de un recurso a la tarifa por hora de una configuracion
+    resource_id: str
+    name: str
+    quantity: float
+    cost_per_hour: float
+    rate: float  # cantidad x valor por hora
+
+
+class RateTable:
+    # Tarifa por hora precalculada de cada configuracion: id -> (tarifa total, desglose por recurso)
+    # Solo cambia cuando cambian recursos o configuraciones, el almacenamiento la descarta en esos casos
+    def __init__(self):
+        self.rates: Dict[str, Tuple[float, List[ResourceRate]]] = {}
+
+    @classmethod
+    def build(cls, config_ids: Iterable[str], get_configuration: Callable[[str], Optional[Dict]],
+              get_resource: Callable[[str], Optional[Dict]]) -> 'RateTable':
+        # Construye la tabla con los getters por ID del almacenamiento
+        table = cls()
+        resources = {}
+        for config_id in config_ids:
+            config = get_configuration(config_id)
+            if config is None:
+                continue
+
+            breakdown = []
+            for config_res in config['resources']:
+                resource_id = str(config_res['resource_id'])
+                if resource_id not in resources:
+                    resources[resource_id] = get_resource(resource_id)
+                resource = resources[resource_id]
+                if resource is None:
+                    continue  # Recurso inexistente, no aporta al costo
+                quantity = config_res['quantity']
+                cost_per_hour = resource['value_per_hour']
+                breakdown.append(ResourceRate(
+                    resource['id'], resource['name'], quantity, cost_per_hour, quantity * cost_per_hour))
+
+            table.rates[str(config_id)] = (
+                sum(res.rate for res in breakdown), breakdown)
+        return table
+
+    def get(self, config_id) -> Optional[Tuple[float, List[ResourceRate]]]:
+        # Tarifa total y desglose de una configuracion, None si no existe
+        return self.rates.get(str(config_id))
+
+    def hourly_rate(self, config_id) -> float:
+        # Tarifa total por hora de una configuracion (0 si no existe)
+        entry = self.rates.get(str(config_id))
+        return entry[0] if entry is not None else 0.0
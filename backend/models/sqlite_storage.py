@@ -0,0 +1,837 @@
+import sqlite3
+import xml.etree.ElementTree as ET
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+from .domain import Resource, Configuration, Category, Client
+from .indexes import consumption_key
+from .rates import RateTable
+from .revenue import CatalogResolver, RevenueCube
+from .storage import XMLStorage
+from .validators import parse_date_ordinal
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS resources (
+    id TEXT NOT NULL UNIQUE,
+    name TEXT,
+    abbreviation TEXT,
+    metric TEXT,
+    type TEXT,
+    value_per_hour TEXT
+);
+CREATE TABLE IF NOT EXISTS categories (
+    pk INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    name TEXT,
+    description TEXT,
+    workload TEXT
+);
+CREATE TABLE IF NOT EXISTS configurations (
+    pk INTEGER PRIMARY KEY,
+    id TEXT NOT NULL,
+    category_pk INTEGER NOT NULL REFERENCES categories(pk) ON DELETE CASCADE,
+    name TEXT,
+    description TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_configurations_id ON configurations(id);
+CREATE INDEX IF NOT EXISTS idx_configurations_category ON configurations(category_pk);
+CREATE TABLE IF NOT EXISTS configuration_resources (
+    configuration_pk INTEGER NOT NULL REFERENCES configurations(pk) ON DELETE CASCADE,
+    resource_id TEXT,
+    quantity TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_configuration_resources_configuration ON configuration_resources(configuration_pk);
+CREATE TABLE IF NOT EXISTS clients (
+    pk INTEGER PRIMARY KEY,
+    nit TEXT NOT NULL UNIQUE,
+    name TEXT,
+    username TEXT,
+    password TEXT,
+    address TEXT,
+    email TEXT
+);
+CREATE TABLE IF NOT EXISTS instances (
+    client_pk INTEGER NOT NULL REFERENCES clients(pk) ON DELETE CASCADE,
+    nit TEXT NOT NULL,
+    id TEXT NOT NULL,
+    configuration_id TEXT,
+    name TEXT,
+    start_date TEXT,
+    status TEXT,
+    end_date TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_instances_nit_id ON instances(nit, id);
+CREATE INDEX IF NOT EXISTS idx_instances_client ON instances(client_pk);
+CREATE TABLE IF NOT EXISTS consumptions (
+    id INTEGER PRIMARY KEY,
+    nit TEXT,
+    instance_id TEXT,
+    time_hours TEXT,
+    date_time TEXT,
+    date_ordinal INTEGER,
+    invoiced INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_consumptions_nit ON consumptions(nit);
+CREATE INDEX IF NOT EXISTS idx_consumptions_instance ON consumptions(instance_id);
+CREATE INDEX IF NOT EXISTS idx_consumptions_date ON consumptions(date_ordinal);
+CREATE INDEX IF NOT EXISTS idx_consumptions_unbilled ON consumptions(invoiced, date_ordinal);
+CREATE TABLE IF NOT EXISTS invoices (
+    pk INTEGER PRIMARY KEY,
+    number TEXT NOT NULL,
+    nit TEXT,
+    issue_date TEXT,
+    total_amount TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_invoices_nit ON invoices(nit);
+CREATE TABLE IF NOT EXISTS invoice_consumptions (
+    invoice_pk INTEGER NOT NULL REFERENCES invoices(pk) ON DELETE CASCADE,
+    consumption_ref TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_invoice_consumptions_invoice ON invoice_consumptions(invoice_pk);
+CREATE TABLE IF NOT EXISTS billing_state (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS storage_versions (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def text_value(value: Optional[str]) -> Optional[str]:
+    # Igual que el texto de un nodo XML: un valor vacio se lee como None
+    return value if value else None
+
+
+class SQLiteStorage:
+    # Almacenamiento en SQLite con los mismos metodos publicos que XMLStorage
+    # PRAGMA synchronous por nivel de durabilidad (mismos niveles que XMLStorage)
+    SYNCHRONOUS = {'none': 'OFF', 'file': 'FULL', 'full': 'EXTRA'}
+
+    def __init__(self, db_path: Path, durability: str = 'file'):
+        if durability not in self.SYNCHRONOUS:
+            raise ValueError(
+                f"Durabilidad invalida: {durability}. Use {', '.join(self.SYNCHRONOUS)}")
+        self.db_path = db_path
+        self.durability = durability
+        # Tarifas por hora, se construyen al primer uso y se descartan al cambiar el catalogo
+        self._rates: Optional[RateTable] = None
+        # Cubo de ingresos por facturas, se construye al primer reporte y se actualiza al guardar facturas
+        self._revenue: Optional[RevenueCube] = None
+        # Versiones (storage_versions) con las que se construyeron; si otro proceso cambia la base no coinciden
+        self._rates_version = None
+        self._revenue_version = None
+        self.ensure_db()
+
+    @contextmanager
+    def connect(self, immediate: bool = False):
+        # Abre una conexion por operacion, el bloque completo es una transaccion
+        # immediate: toma el bloqueo de escritura al empezar (BEGIN IMMEDIATE), para escrituras
+        # que dependen de lo que leen (MAX(id), consumos sin facturar) con otros escritores a la vez
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA foreign_keys = ON')
+        conn.execute(
+            f'PRAGMA synchronous = {self.SYNCHRONOUS[self.durability]}')
+        try:
+            with conn:
+                if immediate:
+                    conn.execute('BEGIN IMMEDIATE')
+                yield conn
+        finally:
+            conn.close()
+
+    def bump_versions(self, conn: sqlite3.Connection, *names: str):
+        # Registra un cambio en la misma transaccion que lo hace:
+        # 'catalog' (recursos y configuraciones) invalida tarifas y cubo, 'revenue' (clientes y facturas) solo el cubo
+        conn.executemany(
+            'INSERT INTO storage_versions (name, value) VALUES (?, 1) '
+            'ON CONFLICT(name) DO UPDATE SET value = value + 1', [(name,) for name in names])
+
+    def read_versions(self, conn: sqlite3.Connection) -> Tuple[int, int]:
+        # Versiones vigentes (catalog, revenue) guardadas en la base
+        versions = dict(conn.execute(
+            'SELECT name, value FROM storage_versions').fetchall())
+        return versions.get('catalog', 0), versions.get('revenue', 0)
+
+    def ensure_db(self):
+        # Crear tablas e indices si no existen
+        # WAL (persistente en el archivo): las lecturas no bloquean a la escritura ni al reves
+        with self.connect() as conn:
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def read_snapshot(self):
+        # Mismo contrato que XMLStorage.read_snapshot; cada consulta usa su propia conexion,
+        # asi que cada una ve la ultima transaccion confirmada (sin vista fija entre consultas)
+        yield
+
+    def is_empty(self) -> bool:
+        # Indica si la base de datos no tiene ningun registro
+        with self.connect() as conn:
+            for table in ('resources', 'categories', 'clients', 'consumptions', 'invoices'):
+                if conn.execute(f'SELECT 1 FROM {table} LIMIT 1').fetchone():
+                    return False
+        return True
+
+    def insert_category(self, conn: sqlite3.Connection, category_id: str, name, description, workload) -> int:
+        # Inserta una categoria y retorna su pk
+        cursor = conn.execute(
+            'INSERT INTO categories (id, name, description, workload) VALUES (?, ?, ?, ?)',
+            (category_id, name, description, workload))
+        return cursor.lastrowid
+
+    def insert_configuration(self, conn: sqlite3.Connection, category_pk: int, config_id: str, name, description, resources) -> int:
+        # Inserta una configuracion con sus recursos (pares resource_id, quantity)
+        cursor = conn.execute(
+            'INSERT INTO configurations (id, category_pk, name, description) VALUES (?, ?, ?, ?)',
+            (config_id, category_pk, name, description))
+        config_pk = cursor.lastrowid
+        conn.executemany(
+            'INSERT INTO configuration_resources (configuration_pk, resource_id, quantity) VALUES (?, ?, ?)',
+            [(config_pk, resource_id, quantity) for resource_id, quantity in resources])
+        return config_pk
+
+    def insert_client(self, conn: sqlite3.Connection, nit: str, name, username, password, address, email, instances) -> int:
+        # Inserta un cliente con sus instancias (tuplas id, configuration_id, name, start_date, status, end_date)
+        cursor = conn.execute(
+            'INSERT INTO clients (nit, name, username, password, address, email) VALUES (?, ?, ?, ?, ?, ?)',
+            (nit, name, username, password, address, email))
+        client_pk = cursor.lastrowid
+        conn.executemany(
+            'INSERT INTO instances (client_pk, nit, id, configuration_id, name, start_date, status, end_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            [(client_pk, nit) + tuple(instance) for instance in instances])
+        return client_pk
+
+    def insert_invoice(self, conn: sqlite3.Connection, invoice_number: str, client_nit: str, issue_date, total_amount, consumption_ids: List[str]) -> int:
+        # Inserta una factura con las referencias a sus consumos
+        cursor = conn.execute(
+            'INSERT INTO invoices (number, nit, issue_date, total_amount) VALUES (?, ?, ?, ?)',
+            (invoice_number, client_nit, issue_date, total_amount))
+        invoice_pk = cursor.lastrowid
+        conn.executemany(
+            'INSERT INTO invoice_consumptions (invoice_pk, consumption_ref) VALUES (?, ?)',
+            [(invoice_pk, cons_id) for cons_id in consumption_ids])
+        return invoice_pk
+
+    def bulk_write(self, write: Callable):
+        # Mismo contrato que XMLStorage.bulk_write; cada mutacion ya es su propia transaccion
+        return write()
+
+    def add_resources(self, resources: List[Resource]):
+        # Agregar recursos a la base de datos (reemplaza los existentes con el mismo ID)
+        with self.connect() as conn:
+            self.bump_versions(conn, 'catalog')
+            for res in resources:
+                conn.execute('DELETE FROM resources WHERE id = ?', (str(res.id),))
+                conn.execute(
+                    'INSERT INTO resources (id, name, abbreviation, metric, type, value_per_hour) VALUES (?, ?, ?, ?, ?, ?)',
+                    (str(res.id), text_value(res.name), text_value(res.abbreviation), text_value(res.metric),
+                     text_value(res.type), str(res.value_per_hour)))
+
+    def add_categories(self, categories: List[Category]):
+        # Agregar categorias con configuraciones a la base de datos
+        with self.connect() as conn:
+            self.bump_versions(conn, 'catalog')
+            for cat in categories:
+                conn.execute('DELETE FROM categories WHERE id = ?', (str(cat.id),))
+                cat_pk = self.insert_category(
+                    conn, str(cat.id), text_value(cat.name), text_value(cat.description), text_value(cat.workload))
+                for config in cat.configurations:
+                    self.insert_configuration(
+                        conn, cat_pk, str(config.id), text_value(config.name), text_value(config.description),
+                        [(str(res.resource_id), str(res.quantity)) for res in config.resources])
+
+    def add_configuration_to_category(self, category_id: int, configuration: Configuration):
+        # Agrega una configuracion a una categoria existente
+        with self.connect() as conn:
+            self.bump_versions(conn, 'catalog')
+            cat_row = conn.execute(
+                'SELECT pk FROM categories WHERE id = ?', (str(category_id),)).fetchone()
+            if cat_row is None:
+                raise ValueError(f'Categoria con ID {category_id} no encontrada')
+
+            existing = conn.execute(
+                'SELECT 1 FROM configurations WHERE category_pk = ? AND id = ?',
+                (cat_row['pk'], str(configuration.id))).fetchone()
+            if existing is not None:
+                raise ValueError(
+                    f'Ya existe una configuración con ID {configuration.id} en esta categoría')
+
+            self.insert_configuration(
+                conn, cat_row['pk'], str(configuration.id), text_value(configuration.name),
+                text_value(configuration.description),
+                [(str(res.resource_id), str(res.quantity)) for res in configuration.resources])
+
+    def add_clients(self, clients: List[Client]):
+        # Agregar clientes con instancias a la base de datos
+        # Las instancias definen la configuracion de cada consumo facturado
+        with self.connect() as conn:
+            self.bump_versions(conn, 'revenue')
+            for client in clients:
+                conn.execute('DELETE FROM clients WHERE nit = ?', (client.nit,))
+                self.insert_client(
+                    conn, client.nit, text_value(client.name), text_value(client.username),
+                    text_value(client.password), text_value(client.address), text_value(client.email),
+                    [(str(inst.id), str(inst.configuration_id), text_value(inst.name), text_value(inst.start_date),
+                      text_value(inst.status), text_value(inst.end_date)) for inst in client.instances])
+
+    def add_consumption(self, nit: str, instance_id: str, time_hours: str, date_time: str):
+        # Agregar consumo a la base de datos
+        self.add_consumptions([{
+            'nit': nit,
+            'instance_id': instance_id,
+            'time_hours': time_hours,
+            'date_time': date_time
+        }])
+
+    def add_consumptions(self, consumptions: List[Dict[str, str]]) -> int:
+        # Agrega un lote de consumos en una sola transaccion
+        if not consumptions:
+            return 0
+
+        # El siguiente ID se lee dentro de la transaccion de escritura, asi dos lotes no toman los mismos IDs
+        with self.connect(immediate=True) as conn:
+            next_id = conn.execute(
+                'SELECT COALESCE(MAX(id) + 1, 0) FROM consumptions').fetchone()[0]
+            conn.executemany(
+                'INSERT INTO consumptions (id, nit, instance_id, time_hours, date_time, date_ordinal) VALUES (?, ?, ?, ?, ?, ?)',
+                [(next_id + offset, cons['nit'], cons['instance_id'], text_value(cons['time_hours']),
+                  text_value(cons['date_time']), parse_date_ordinal(cons['date_time']))
+                 for offset, cons in enumerate(consumptions)])
+        return len(consumptions)
+
+    def get_summary(self) -> Dict[str, int]:
+        # Obtener conteos de entidades
+        with self.connect() as conn:
+            def count(table):
+                return conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+            return {
+                'resources': count('resources'),
+                'categories': count('categories'),
+                'configurations': count('configurations'),
+                'clients': count('clients'),
+                'instances': count('instances'),
+                'consumptions': count('consumptions')
+            }
+
+    def delete_all(self, conn: sqlite3.Connection):
+        # Borra todas las tablas dentro de la transaccion de conn
+        self.bump_versions(conn, 'catalog', 'revenue')
+        for table in ('billing_state', 'invoice_consumptions', 'invoices', 'consumptions', 'instances', 'clients',
+                      'configuration_resources', 'configurations', 'categories', 'resources'):
+            conn.execute(f'DELETE FROM {table}')
+
+    def clear_all(self):
+        # Limpia todos los datos de la base de datos
+        with self.connect() as conn:
+            self.delete_all(conn)
+
+    def fetch_categories(self, conn: sqlite3.Connection) -> List[Dict]:
+        # Categorias con configuraciones y recursos en el formato de get_all_data
+        categories = []
+        configs_by_category = {}
+        resources_by_config = {}
+        for row in conn.execute('SELECT configuration_pk, resource_id, quantity FROM configuration_resources ORDER BY rowid'):
+            resources_by_config.setdefault(row['configuration_pk'], []).append({
+                'resource_id': row['resource_id'],
+                'quantity': row['quantity']
+            })
+        for row in conn.execute('SELECT pk, id, category_pk, name, description FROM configurations ORDER BY pk'):
+            configs_by_category.setdefault(row['category_pk'], []).append({
+                'id': row['id'],
+                'name': row['name'],
+                'description': row['description'],
+                'resources': resources_by_config.get(row['pk'], [])
+            })
+        for row in conn.execute('SELECT pk, id, name, description, workload FROM categories ORDER BY pk'):
+            categories.append({
+                'id': row['id'],
+                'name': row['name'],
+                'description': row['description'],
+                'workload': row['workload'],
+                'configurations': configs_by_category.get(row['pk'], [])
+            })
+        return categories
+
+    def fetch_clients(self, conn: sqlite3.Connection, with_password: bool) -> List[Dict]:
+        # Clientes con sus instancias
+        instances_by_client = {}
+        for row in conn.execute('SELECT client_pk, id, configuration_id, name, start_date, status, end_date FROM instances ORDER BY rowid'):
+            instances_by_client.setdefault(row['client_pk'], []).append({
+                'id': row['id'],
+                'configuration_id': row['configuration_id'],
+                'name': row['name'],
+                'start_date': row['start_date'],
+                'status': row['status'],
+                'end_date': row['end_date']
+            })
+
+        clients = []
+        for row in conn.execute('SELECT pk, nit, name, username, password, address, email FROM clients ORDER BY pk'):
+            client = {
+                'nit': row['nit'],
+                'name': row['name'],
+                'username': row['username']
+            }
+            if with_password:
+                client['password'] = row['password']
+                client['address'] = row['address']
+                client['email'] = row['email']
+            else:
+                client['email'] = row['email']
+                client['address'] = row['address']
+            client['instances'] = instances_by_client.get(row['pk'], [])
+            clients.append(client)
+        return clients
+
+    def get_all_data(self) -> Dict:
+        # Obtiene todos los datos almacenados en formato estructurado
+        with self.connect() as conn:
+            consumptions = [{
+                'id': str(row['id']),
+                'nit': row['nit'],
+                'instance_id': row['instance_id'],
+                'time_hours': row['time_hours'],
+                'date_time': row['date_time']
+            } for row in conn.execute('SELECT id, nit, instance_id, time_hours, date_time FROM consumptions ORDER BY id')]
+
+            data = {
+                'resources': self.get_resources(),
+                'categories': self.fetch_categories(conn),
+                'clients': self.fetch_clients(conn, with_password=True),
+                'consumptions': consumptions
+            }
+        data['summary'] = self.get_summary()
+        return data
+
+    def add_invoice(self, invoice_number: str, client_nit: str, issue_date: str, total_amount: float, consumption_ids: List[str]):
+        # Agrega una factura y marca sus consumos como facturados
+        self.add_invoices([{
+            'invoice_number': invoice_number,
+            'client_nit': client_nit,
+            'issue_date': issue_date,
+            'total_amount': total_amount,
+            'consumption_ids': consumption_ids
+        }])
+
+    def add_invoices(self, invoices: List[Dict], billing_state: Dict = None) -> List[Dict]:
+        # Agrega todas las facturas de una corrida en una sola transaccion
+        # billing_state (marca de agua de facturacion incremental) se guarda en la misma transaccion
+        # Igual que XMLStorage.add_invoices: dentro de la transaccion se descartan las facturas con algun consumo
+        # ya facturado y se numeran las que quedan; retorna las facturas guardadas
+        if not invoices and billing_state is None:
+            return []
+
+        with self.connect(immediate=True) as conn:
+            versions = self.read_versions(conn)
+            self.bump_versions(conn, 'revenue')
+            unbilled = self.unbilled_keys(conn, [cons_id for invoice in invoices
+                                                 for cons_id in invoice['consumption_ids']])
+            next_invoice_number = conn.execute('SELECT COUNT(*) FROM invoices').fetchone()[0] + 1
+            stored = []
+            for invoice in invoices:
+                keys = [consumption_key(cons_id) for cons_id in invoice['consumption_ids']]
+                if len(set(keys)) != len(keys) or not all(key in unbilled for key in keys):
+                    continue
+                if invoice['invoice_number'] is None:
+                    invoice = dict(invoice, invoice_number=f"FAC-{next_invoice_number:06d}")
+                    next_invoice_number += 1
+                stored.append(invoice)
+
+                self.insert_invoice(conn, invoice['invoice_number'], invoice['client_nit'],
+                                    text_value(invoice['issue_date']), str(invoice['total_amount']),
+                                    invoice['consumption_ids'])
+                unbilled.difference_update(keys)
+                conn.executemany(
+                    'UPDATE consumptions SET invoiced = 1 WHERE id = ?',
+                    [(int(key),) for key in keys])
+            if billing_state is not None:
+                self.write_billing_state(conn, billing_state)
+
+        # El cubo se actualiza en el lugar solo si estaba al dia antes de esta corrida
+        if self._revenue is not None and self._revenue_version == versions:
+            self._revenue_version = (versions[0], versions[1] + 1)
+            self.update_revenue_cube(stored)
+        else:
+            self._revenue = None
+        return stored
+
+    def unbilled_keys(self, conn: sqlite3.Connection, consumption_ids: List[str]) -> set:
+        # Claves (texto) de los consumos indicados que existen y siguen sin facturar
+        keys = [int(key) for key in map(consumption_key, consumption_ids) if key is not None]
+        unbilled = set()
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ', '.join('?' * len(chunk))
+            unbilled.update(str(row['id']) for row in conn.execute(
+                f'SELECT id FROM consumptions WHERE invoiced = 0 AND id IN ({placeholders})', chunk))
+        return unbilled
+
+    def get_revenue_cube(self) -> RevenueCube:
+        # Cubo de ingresos de todas las facturas, se construye una vez y luego se actualiza con cada corrida
+        # Se reconstruye tambien si otro proceso cambio el catalogo, los clientes o las facturas
+        with self.connect() as conn:
+            versions = self.read_versions(conn)
+        if self._revenue is None or self._revenue_version != versions:
+            cube = RevenueCube()
+            resolver = CatalogResolver(self, self.get_rate_table())
+            for invoice in self.get_invoices():
+                cube.add_invoice(invoice, self.get_consumptions_by_ids(
+                    invoice['consumption_ids']), resolver)
+            self._revenue = cube
+            self._revenue_version = versions
+        return self._revenue
+
+    def update_revenue_cube(self, invoices: List[Dict]):
+        # Agrega al cubo las facturas recien guardadas; si falla se descarta y se reconstruye al siguiente uso
+        try:
+            resolver = CatalogResolver(self, self.get_rate_table())
+            for invoice in invoices:
+                self._revenue.add_invoice(invoice, self.get_consumptions_by_ids(
+                    invoice['consumption_ids']), resolver)
+        except Exception:
+            self._revenue = None
+
+    def write_billing_state(self, conn: sqlite3.Connection, billing_state: Dict):
+        # Guarda la marca de agua de la facturacion incremental (y borra el arrastre de versiones anteriores)
+        conn.execute(
+            'INSERT OR REPLACE INTO billing_state (name, value) VALUES (?, ?)',
+            ('watermark', str(billing_state['watermark'])))
+        conn.execute("DELETE FROM billing_state WHERE name = 'carry_over'")
+
+    def get_billing_state(self) -> Dict:
+        # Marca de agua de la facturacion incremental: ultimo ID de consumo revisado
+        with self.connect() as conn:
+            values = dict(conn.execute(
+                'SELECT name, value FROM billing_state').fetchall())
+        return {'watermark': int(values.get('watermark', '-1'))}
+
+    def count_unbilled_consumptions(self) -> int:
+        # Cantidad de consumos sin facturar
+        with self.connect() as conn:
+            return conn.execute('SELECT COUNT(*) FROM consumptions WHERE invoiced = 0').fetchone()[0]
+
+    def get_unbilled_consumptions_since(self, watermark: int):
+        # Consumos sin facturar con ID mayor a la marca de agua, ordenados por ID
+        # Retorna (consumos, ultimo ID asignado)
+        with self.connect() as conn:
+            rows = conn.execute(
+                'SELECT id, nit, instance_id, time_hours, date_time FROM consumptions '
+                'WHERE invoiced = 0 AND id > ? ORDER BY id', (watermark,)).fetchall()
+            last_id = conn.execute(
+                'SELECT COALESCE(MAX(id), -1) FROM consumptions').fetchone()[0]
+        return [self.consumption_dict(row) for row in rows], last_id
+
+    def get_unbilled_consumptions(self):
+        # Obtiene todos los consumos que no han sido facturados
+        with self.connect() as conn:
+            rows = conn.execute(
+                'SELECT id, nit, instance_id, time_hours, date_time FROM consumptions WHERE invoiced = 0 ORDER BY id')
+            return [self.consumption_dict(row) for row in rows]
+
+    def get_unbilled_consumptions_in_range(self, start_ordinal: int, end_ordinal: int):
+        # Consumos no facturados con fecha dentro del rango (ordinales de fecha, usa el indice invoiced, date_ordinal)
+        with self.connect() as conn:
+            rows = conn.execute(
+                'SELECT id, nit, instance_id, time_hours, date_time FROM consumptions '
+                'WHERE invoiced = 0 AND date_ordinal BETWEEN ? AND ? ORDER BY id', (start_ordinal, end_ordinal))
+            return [self.consumption_dict(row) for row in rows]
+
+    def get_consumptions_by_ids(self, consumption_ids: List[str]):
+        # Obtiene los consumos con los IDs indicados (en el mismo orden), ignora los que no existen
+        keys = [int(key) for key in map(consumption_key, consumption_ids) if key is not None]
+        with self.connect() as conn:
+            rows = {}
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ', '.join('?' * len(chunk))
+                for row in conn.execute(
+                        f'SELECT id, nit, instance_id, time_hours, date_time FROM consumptions WHERE id IN ({placeholders})', chunk):
+                    rows[row['id']] = row
+        return [self.consumption_dict(rows[key]) for key in keys if key in rows]
+
+    def consumption_dict(self, row: sqlite3.Row) -> Dict:
+        return {
+            'id': str(row['id']),
+            'nit': row['nit'],
+            'instance_id': row['instance_id'],
+            'time_hours': row['time_hours'],
+            'date_time': row['date_time']
+        }
+
+    def get_resources(self):
+        # Obtiene todos los recursos del sistema
+        with self.connect() as conn:
+            return [{
+                'id': row['id'],
+                'name': row['name'],
+                'abbreviation': row['abbreviation'],
+                'metric': row['metric'],
+                'type': row['type'],
+                'value_per_hour': row['value_per_hour']
+            } for row in conn.execute('SELECT * FROM resources ORDER BY rowid')]
+
+    def get_clients(self):
+        # Obtiene todos los clientes con sus instancias
+        with self.connect() as conn:
+            return self.fetch_clients(conn, with_password=False)
+
+    def get_invoices(self):
+        # Obtiene todas las facturas registradas
+        with self.connect() as conn:
+            refs = {}
+            for row in conn.execute('SELECT invoice_pk, consumption_ref FROM invoice_consumptions ORDER BY rowid'):
+                if row['consumption_ref']:
+                    refs.setdefault(row['invoice_pk'], []).append(
+                        row['consumption_ref'])
+            return [{
+                'invoice_number': row['number'],
+                'client_nit': row['nit'],
+                'issue_date': row['issue_date'],
+                'total_amount': row['total_amount'],
+                'consumption_ids': refs.get(row['pk'], [])
+            } for row in conn.execute('SELECT pk, number, nit, issue_date, total_amount FROM invoices ORDER BY pk')]
+
+    def cancel_instance(self, client_nit: str, instance_id: str, end_date: str):
+        # Cancela una instancia especifica de un cliente
+        with self.connect() as conn:
+            if conn.execute('SELECT 1 FROM clients WHERE nit = ?', (client_nit,)).fetchone() is None:
+                raise ValueError(f"Cliente con NIT {client_nit} no encontrado")
+
+            row = conn.execute(
+                'SELECT rowid FROM instances WHERE nit = ? AND id = ? ORDER BY rowid LIMIT 1',
+                (client_nit, str(instance_id))).fetchone()
+            if row is None:
+                raise ValueError(
+                    f"Instancia {instance_id} no encontrada para cliente {client_nit}")
+
+            conn.execute(
+                "UPDATE instances SET status = 'Cancelada', end_date = ? WHERE rowid = ?",
+                (text_value(end_date), row['rowid']))
+
+    def get_rate_table(self) -> RateTable:
+        # Tarifas por hora de todas las configuraciones, se calculan una vez por version del catalogo
+        # (la version guardada en la base, asi un cambio de precio en otro proceso tambien se ve aqui)
+        with self.connect() as conn:
+            version = self.read_versions(conn)[0]
+            if self._rates is not None and self._rates_version == version:
+                return self._rates
+            config_ids = [row['id'] for row in conn.execute(
+                'SELECT DISTINCT id FROM configurations')]
+        self._rates = RateTable.build(
+            config_ids, self.get_configuration_by_id, self.get_resource_by_id)
+        self._rates_version = version
+        return self._rates
+
+    def get_resource_by_id(self, resource_id: str):
+        # Obtiene un recurso por su ID
+        with self.connect() as conn:
+            row = conn.execute(
+                'SELECT * FROM resources WHERE id = ?', (str(resource_id),)).fetchone()
+        if row is None:
+            return None
+
+        value_per_hour = float(row['value_per_hour'])
+        return {
+            'id': row['id'],
+            'name': row['name'],
+            'abbreviation': row['abbreviation'],
+            'metric': row['metric'],
+            'type': row['type'],
+            'value_per_hour': value_per_hour,
+            'cost_per_hour': value_per_hour
+        }
+
+    def get_configuration_by_id(self, config_id: str):
+        # Obtiene una configuracion por su ID (la primera en orden de categorias)
+        with self.connect() as conn:
+            row = conn.execute(
+                'SELECT c.pk, c.id, c.name, c.description, k.id AS category_id FROM configurations c '
+                'JOIN categories k ON k.pk = c.category_pk WHERE c.id = ? ORDER BY k.pk, c.pk LIMIT 1',
+                (str(config_id),)).fetchone()
+            if row is None:
+                return None
+            resources = [{
+                'resource_id': res['resource_id'],
+                'quantity': float(res['quantity']) if res['quantity'] else 0.0
+            } for res in conn.execute(
+                'SELECT resource_id, quantity FROM configuration_resources WHERE configuration_pk = ? ORDER BY rowid',
+                (row['pk'],))]
+
+        return {
+            'id': row['id'],
+            'name': row['name'],
+            'description': row['description'],
+            'resources': resources,
+            'category_id': row['category_id']
+        }
+
+    def get_category_by_id(self, category_id: str):
+        # Obtiene una categoria por su ID
+        with self.connect() as conn:
+            row = conn.execute(
+                'SELECT id, name, description, workload FROM categories WHERE id = ?',
+                (str(category_id),)).fetchone()
+        if row is None:
+            return None
+        return dict(row)
+
+    def get_instance_by_id(self, client_nit: str, instance_id: str):
+        # Obtiene una instancia especifica de un cliente
+        with self.connect() as conn:
+            row = conn.execute(
+                'SELECT id, configuration_id, name, start_date, status, end_date FROM instances '
+                'WHERE nit = ? AND id = ? ORDER BY rowid LIMIT 1',
+                (client_nit, str(instance_id))).fetchone()
+        if row is None:
+            return None
+        return dict(row)
+
+    def import_xml(self, xml_path: Path):
+        # Reemplaza el contenido con el de un db.xml (incluye los consumos del diario)
+        # Lectura de una sola vez: sin copia binaria junto al XML importado
+        source = XMLStorage(xml_path, binary_snapshot=False)
+        root = source.load_tree().getroot()
+        # El indice asigna IDs estables a los consumos que aun no los tienen
+        source_index = source.get_index()
+
+        def text(node, tag):
+            child = node.find(tag)
+            return child.text if child is not None else ''
+
+        # Borrado e importacion en una sola transaccion: si la importacion falla no se pierde el contenido anterior
+        # Con IDs repetidos gana el primero, igual que los indices de XMLStorage
+        with self.connect(immediate=True) as conn:
+            self.delete_all(conn)
+            resources_node = root.find('resources')
+            if resources_node is not None:
+                for res_node in resources_node.findall('resource'):
+                    conn.execute(
+                        'INSERT OR IGNORE INTO resources (id, name, abbreviation, metric, type, value_per_hour) VALUES (?, ?, ?, ?, ?, ?)',
+                        (res_node.get('id'), text(res_node, 'name'), text(res_node, 'abbreviation'),
+                         text(res_node, 'metric'), text(res_node, 'type'), text(res_node, 'value_per_hour')))
+
+            category_pks = {}
+            for cat_node in root.findall('.//categories/category'):
+                cat_id = cat_node.get('id')
+                # Las configuraciones de una categoria repetida quedan en la primera, con el mismo ID de categoria
+                cat_pk = category_pks.get(cat_id)
+                if cat_pk is None:
+                    cat_pk = category_pks[cat_id] = self.insert_category(
+                        conn, cat_id, text(cat_node, 'name'), text(cat_node, 'description'),
+                        text(cat_node, 'workload'))
+                for config_node in cat_node.findall('.//configurations/configuration'):
+                    self.insert_configuration(
+                        conn, cat_pk, config_node.get('id'), text(config_node, 'name'),
+                        text(config_node, 'description'),
+                        [(res_node.get('id'), res_node.text) for res_node in config_node.findall('./resources/resource')])
+
+            client_nits = set()
+            for client_node in root.findall('.//clients/client'):
+                if client_node.get('nit') in client_nits:
+                    continue
+                client_nits.add(client_node.get('nit'))
+                self.insert_client(
+                    conn, client_node.get('nit'), text(client_node, 'name'), text(client_node, 'username'),
+                    text(client_node, 'password'), text(client_node, 'address'), text(client_node, 'email'),
+                    [(inst_node.get('id'), text(inst_node, 'configuration_id'), text(inst_node, 'name'),
+                      text(inst_node, 'start_date'), text(inst_node, 'status'), text(inst_node, 'end_date'))
+                     for inst_node in client_node.findall('.//instances/instance')])
+
+            conn.executemany(
+                'INSERT INTO consumptions (id, nit, instance_id, time_hours, date_time, date_ordinal, invoiced) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [(int(key), cons_node.get('nit'), cons_node.get('instance_id'), text(cons_node, 'time_hours'),
+                  text(cons_node, 'date_time'), parse_date_ordinal(text(cons_node, 'date_time')),
+                  1 if cons_node.get('invoiced') == 'true' else 0)
+                 for key, cons_node in source_index.consumptions.items()])
+
+            for inv_node in root.findall('.//invoices/invoice'):
+                self.insert_invoice(
+                    conn, inv_node.get('number'), inv_node.get('nit'), text(inv_node, 'issue_date'),
+                    text(inv_node, 'total_amount'),
+                    [ref.text for ref in inv_node.findall('.//consumptions/consumption_ref')])
+
+            billing_state = source.get_billing_state()
+            if billing_state['watermark'] >= 0:
+                self.write_billing_state(conn, billing_state)
+
+    def export_xml(self, xml_path: Path):
+        # Escribe el contenido en el formato de db.xml
+        root = ET.Element('database')
+        resources_node = ET.SubElement(root, 'resources')
+        categories_node = ET.SubElement(root, 'categories')
+        clients_node = ET.SubElement(root, 'clients')
+        consumptions_node = ET.SubElement(root, 'consumptions')
+        invoices_node = ET.SubElement(root, 'invoices')
+
+        def add_fields(node, record, fields):
+            for field in fields:
+                ET.SubElement(node, field).text = record[field]
+
+        data = self.get_all_data()
+        for res in data['resources']:
+            res_node = ET.SubElement(resources_node, 'resource')
+            res_node.set('id', res['id'])
+            add_fields(res_node, res, ('name', 'abbreviation',
+                       'metric', 'type', 'value_per_hour'))
+
+        for cat in data['categories']:
+            cat_node = ET.SubElement(categories_node, 'category')
+            cat_node.set('id', cat['id'])
+            add_fields(cat_node, cat, ('name', 'description', 'workload'))
+            configs_node = ET.SubElement(cat_node, 'configurations')
+            for config in cat['configurations']:
+                config_node = ET.SubElement(configs_node, 'configuration')
+                config_node.set('id', config['id'])
+                add_fields(config_node, config, ('name', 'description'))
+                config_resources_node = ET.SubElement(config_node, 'resources')
+                for config_res in config['resources']:
+                    res_node = ET.SubElement(config_resources_node, 'resource')
+                    res_node.set('id', config_res['resource_id'])
+                    res_node.text = config_res['quantity']
+
+        for client in data['clients']:
+            client_node = ET.SubElement(clients_node, 'client')
+            client_node.set('nit', client['nit'])
+            add_fields(client_node, client, ('name', 'username',
+                       'password', 'address', 'email'))
+            instances_node = ET.SubElement(client_node, 'instances')
+            for instance in client['instances']:
+                inst_node = ET.SubElement(instances_node, 'instance')
+                inst_node.set('id', instance['id'])
+                add_fields(inst_node, instance, ('configuration_id',
+                           'name', 'start_date', 'status', 'end_date'))
+
+        with self.connect() as conn:
+            for row in conn.execute('SELECT id, nit, instance_id, time_hours, date_time, invoiced FROM consumptions ORDER BY id'):
+                cons_node = ET.SubElement(consumptions_node, 'consumption')
+                cons_node.set('id', str(row['id']))
+                cons_node.set('nit', row['nit'])
+                cons_node.set('instance_id', row['instance_id'])
+                if row['invoiced']:
+                    cons_node.set('invoiced', 'true')
+                add_fields(cons_node, row, ('time_hours', 'date_time'))
+
+        for invoice in self.get_invoices():
+            invoice_node = ET.SubElement(invoices_node, 'invoice')
+            invoice_node.set('number', invoice['invoice_number'])
+            invoice_node.set('nit', invoice['client_nit'])
+            ET.SubElement(invoice_node, 'issue_date').text = invoice['issue_date']
+            ET.SubElement(
+                invoice_node, 'total_amount').text = invoice['total_amount']
+            refs_node = ET.SubElement(invoice_node, 'consumptions')
+            for cons_id in invoice['consumption_ids']:
+                ET.SubElement(refs_node, 'consumption_ref').text = cons_id
+
+        billing_state = self.get_billing_state()
+        if billing_state['watermark'] >= 0:
+            state_node = ET.SubElement(root, 'billing_state')
+            state_node.set('watermark', str(billing_state['watermark']))
+
+        ET.ElementTree(root).write(
+            xml_path, encoding='utf-8', xml_declaration=True)
@@ -1,18 +1,106 @@
+import copy
+import json
+import os
+import threading
+import time
+import weakref
 import xml.etree.ElementTree as ET
 from pathlib import Path
-from typing import Dict, List
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, List
+from .binary_snapshot import dump_binary_snapshot, load_binary_snapshot
 from .domain import Resource, Configuration, ConfigurationResource, Category, Instance, Client
+from .indexes import StorageIndex, consumption_key
+from .locking import FileLock, WriteQueue, queued_write
+from .rates import RateTable
+from .revenue import CatalogResolver, RevenueCube
 from .validators import validate_nit, extract_first_date
 
 
+# Niveles de durabilidad de las escrituras:
+# 'none' solo reemplaza atomicamente, 'file' ademas hace fsync del archivo, 'full' tambien del directorio
+DURABILITY_LEVELS = ('none', 'file', 'full')
+# Secciones que solo crecen: las versiones sucesivas comparten su lista de hijos y el escritor agrega al final
+APPEND_ONLY_SECTIONS = ('consumptions', 'invoices')
+
+
+class StorageSnapshot:
+    # Version publicada del XML: arbol, indices y firma de los archivos; nadie la modifica despues de publicarla
+    def __init__(self, tree: ET.ElementTree, index: StorageIndex, stamp, generation: int, journal_size: int):
+        self.tree = tree
+        self.index = index
+        self.stamp = stamp
+        # Generacion del diario que corresponde al XML y registros del diario aplicados al arbol
+        self.generation = generation
+        self.journal_size = journal_size
+        # Hijos de cada seccion que solo crece que pertenecen a esta version (las siguientes agregan al final)
+        root = tree.getroot()
+        self.sizes = {}
+        for name in APPEND_ONLY_SECTIONS:
+            node = root.find(name)
+            self.sizes[name] = len(node) if node is not None else 0
+
+
 class XMLStorage:
-    def __init__(self, db_path: Path):
+    def __init__(self, db_path: Path, journal_limit: int = 5000, durability: str = 'file',
+                 binary_snapshot: bool = True, binary_idle: float = 2.0, binary_every: int = 20):
+        if durability not in DURABILITY_LEVELS:
+            raise ValueError(
+                f"Durabilidad invalida: {durability}. Use {', '.join(DURABILITY_LEVELS)}")
         self.db_path = db_path
+        self.durability = durability
+        # Diario de consumos (una linea JSON por consumo), se compacta en el XML al llegar a journal_limit registros
+        self.journal_path = db_path.with_name(
+            f'{db_path.stem}_consumptions.jsonl')
+        self.journal_limit = journal_limit
+        # Copia binaria compacta del XML (db.snap): al arrancar se carga en lugar del XML si corresponde a el
+        # Se regenera en segundo plano cuando el XML cambio y lleva binary_idle segundos sin cambiar,
+        # o sin esperar cada binary_every versiones nuevas del XML; flush_binary la escribe al apagar
+        # None si esta desactivada
+        self.binary_path = db_path.with_suffix(
+            '.snap') if binary_snapshot else None
+        self.binary_idle = binary_idle
+        self.binary_every = binary_every
+        self._binary_stamp = None
+        self._binary_pending = None
+        self._binary_due = 0.0
+        self._binary_changes = 0
+        self._binary_thread = None
+        self._binary_guard = threading.Condition()
+        # Version publicada que leen todos los hilos sin bloqueo; _stale obliga a volver a parsear el archivo
+        self._snapshot = None
+        self._stale = False
+        # Version fijada por read_snapshot para las lecturas de cada hilo
+        self._local = threading.local()
+        # Arbol de cada version publicada -> version, para leer solo los hijos propios de las secciones compartidas
+        self._published = weakref.WeakKeyDictionary()
+        self.metrics = {'parses': 0, 'cache_hits': 0,
+                        'journal_appends': 0, 'compactions': 0,
+                        'saves': 0, 'fsyncs': 0, 'fsync_ms': 0.0,
+                        'write_batches': 0, 'coalesced_writes': 0,
+                        'published': 0, 'binary_loads': 0, 'binary_writes': 0}
+        # Coordinacion entre procesos (flock sobre db.xml.lock) y cola de escrituras del proceso
+        self.file_lock = FileLock(db_path.with_name(f'{db_path.name}.lock'))
+        self.writes = WriteQueue(self.run_write_batch)
+        # Hilo que aplica el lote en curso con el bloqueo exclusivo y su version de trabajo (copia por secciones)
+        # Sus save_tree se difieren al final del lote, que publica la version nueva de una sola vez
+        self._writer = None
+        self._working = None
+        self._working_index = None
+        self._copied = set()
+        self._positions = None
+        self._generation = 0
+        self._journal_size = 0
+        self._defer_save = False
+        self._pending_save = False
+        self._deferred = False
         self.ensure_db()
 
     def ensure_db(self):
         # Crear archivo si no existe
-        if not self.db_path.exists():
+        with self.file_lock.exclusive():
+            if self.db_path.exists():
+                return
             root = ET.Element('database')
             ET.SubElement(root, 'resources')
             ET.SubElement(root, 'categories')
@@ -20,27 +108,483 @@ class XMLStorage:
             ET.SubElement(root, 'consumptions')
             ET.SubElement(root, 'invoices')
             tree = ET.ElementTree(root)
-            tree.write(self.db_path, encoding='utf-8', xml_declaration=True)
+            self.write_atomic(self.db_path, lambda f: tree.write(
+                f, encoding='utf-8', xml_declaration=True))
+
+    def read_lock(self):
+        # Bloqueo compartido para leer los archivos; el escritor en curso ya tiene el exclusivo
+        if self._writer == threading.get_ident():
+            return nullcontext()
+        return self.file_lock.shared()
+
+    def run_write_batch(self, batch: List[Dict]):
+        # Aplica un lote de mutaciones de la cola con el bloqueo exclusivo y guarda el XML una sola vez al final
+        # Con el bloqueo tomado, load_tree vuelve a leer lo que otros procesos hayan escrito antes
+        # Los lectores siguen usando la version publicada hasta que el lote publica la siguiente
+        with self.file_lock.exclusive():
+            self._writer = threading.get_ident()
+            self._defer_save = True
+            self._pending_save = False
+            try:
+                unsaved = []
+                for item in batch:
+                    self.apply_write(item)
+                    if item['error'] is None:
+                        if item['deferred']:
+                            unsaved.append(item)
+                    elif self._working is None and unsaved:
+                        # La mutacion fallida descarto la version de trabajo junto con los cambios
+                        # aun no guardados de las anteriores: se vuelven a aplicar sobre el arbol recargado
+                        for earlier in unsaved:
+                            self.apply_write(earlier)
+                        unsaved = [earlier for earlier in unsaved
+                                   if earlier['error'] is None and earlier['deferred']]
+
+                self._defer_save = False
+                if self._pending_save:
+                    self.save_tree(self._working)
+                if self._working is not None and any(item['error'] is None for item in batch):
+                    self.publish()
+            finally:
+                self._defer_save = False
+                self._pending_save = False
+                self._working = None
+                self._working_index = None
+                self._writer = None
+        self.metrics['write_batches'] += 1
+        self.metrics['coalesced_writes'] += len(batch) - 1
+
+    def apply_write(self, item: Dict):
+        self._deferred = False
+        try:
+            item['result'] = item['fn']()
+            item['error'] = None
+        except Exception as e:
+            item['error'] = e
+        item['deferred'] = self._deferred
+
+    def fsync(self, fd: int):
+        # fsync midiendo su costo en las metricas
+        start = time.perf_counter()
+        os.fsync(fd)
+        self.metrics['fsyncs'] += 1
+        self.metrics['fsync_ms'] += (time.perf_counter() - start) * 1000
+
+    def write_atomic(self, path: Path, write):
+        # Escribe con write(archivo) en un temporal del mismo directorio y lo reemplaza atomicamente
+        # Un lector nunca ve el archivo a medio escribir: ve la version anterior o la nueva completa
+        temp_path = path.with_name(
+            f'.{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        try:
+            with open(temp_path, 'wb') as f:
+                write(f)
+                if self.durability != 'none':
+                    f.flush()
+                    self.fsync(f.fileno())
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                temp_path.unlink()
+            except FileNotFoundError:
+                pass
+            raise
+
+        # El rename queda en disco solo despues del fsync del directorio
+        if self.durability == 'full':
+            try:
+                dir_fd = os.open(path.parent, os.O_RDONLY)
+            except OSError:
+                return  # Sistemas sin fsync de directorios (Windows)
+            try:
+                self.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+
+    def file_stamp(self):
+        # Firma de los archivos en disco para detectar cambios hechos por otro proceso
+        stamp = []
+        for path in (self.db_path, self.journal_path):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                stamp.append(None)
+                continue
+            stamp.append((stat.st_mtime_ns, stat.st_size))
+        return tuple(stamp)
+
+    def snapshot(self) -> StorageSnapshot:
+        # Version publicada vigente, sin bloqueo; solo se vuelve a parsear si el archivo cambio en disco
+        # Mientras otro hilo del proceso escribe se usa la version publicada, el escritor publicara la siguiente
+        pinned = getattr(self._local, 'snapshot', None)
+        if pinned is not None:
+            return pinned
+        return self.latest_snapshot()
+
+    def latest_snapshot(self) -> StorageSnapshot:
+        # Ultima version publicada aunque el hilo tenga una fijada (el escritor parte siempre de la ultima)
+        snapshot = self._snapshot
+        if snapshot is not None and self._writer not in (None, threading.get_ident()):
+            self.metrics['cache_hits'] += 1
+            return snapshot
+        if snapshot is not None and not self._stale:
+            stamp = self.file_stamp()
+            # Si un escritor publico mientras se leia la firma, la version nueva ya corresponde a los archivos
+            for candidate in (snapshot, self._snapshot):
+                if candidate is not None and candidate.stamp == stamp:
+                    self.metrics['cache_hits'] += 1
+                    return candidate
+
+        with self.read_lock():
+            stamp = self.file_stamp()
+            loaded = self.load_binary(stamp[0])
+            if loaded is not None:
+                tree, restored = loaded
+            else:
+                tree, restored = ET.parse(self.db_path), None
+            generation, journal_size = self.replay_journal(tree)
+        snapshot = StorageSnapshot(tree, StorageIndex(
+            tree.getroot(), restored), stamp, generation, journal_size)
+        self._snapshot = snapshot
+        self._published[tree] = snapshot
+        self._stale = False
+        if loaded is not None:
+            self.metrics['binary_loads'] += 1
+        else:
+            self.metrics['parses'] += 1
+            self.schedule_binary(snapshot)
+        return snapshot
+
+    def load_binary(self, xml_stamp):
+        # Arbol y ordinales de la copia binaria si corresponde al XML actual (firma xml_stamp)
+        if self.binary_path is None or xml_stamp is None:
+            return None
+        loaded = load_binary_snapshot(self.binary_path, xml_stamp)
+        if loaded is not None:
+            self._binary_stamp = xml_stamp
+        return loaded
+
+    def schedule_binary(self, snapshot: StorageSnapshot):
+        # Programa la copia binaria de una version publicada (no cambia, no requiere bloqueo)
+        # Se escribe cuando el XML queda binary_idle segundos sin cambiar o al acumular binary_every versiones;
+        # de las versiones que llegan mientras tanto solo se escribe la ultima
+        if self.binary_path is None or snapshot.stamp[0] in (None, self._binary_stamp):
+            return
+        with self._binary_guard:
+            pending = self._binary_pending
+            if pending is None or pending.stamp[0] != snapshot.stamp[0]:
+                self._binary_changes += 1
+            self._binary_pending = snapshot
+            self._binary_due = time.monotonic() + self.binary_idle
+            if self._binary_changes >= self.binary_every:
+                self._binary_due = 0.0
+            self._binary_guard.notify_all()
+            if self._binary_thread is not None:
+                return
+            self._binary_thread = threading.Thread(
+                target=self.write_binary_pending, name='storage-snapshot', daemon=True)
+            self._binary_thread.start()
+
+    def write_binary_pending(self):
+        while True:
+            with self._binary_guard:
+                snapshot = self._binary_pending
+                if snapshot is None:
+                    self._binary_thread = None
+                    return
+                delay = self._binary_due - time.monotonic()
+                if delay > 0:
+                    self._binary_guard.wait(delay)
+                    continue
+                self._binary_pending = None
+                self._binary_changes = 0
+            try:
+                self.write_binary(snapshot)
+            except Exception:
+                pass  # La copia binaria es prescindible, el siguiente arranque parsea el XML
+
+    def write_binary(self, snapshot: StorageSnapshot):
+        # Escribe la copia binaria de una version publicada; se omite si el XML ya cambio despues de ella
+        xml_stamp = snapshot.stamp[0]
+        if xml_stamp == self._binary_stamp or self.file_stamp()[0] != xml_stamp:
+            return
+        self.write_atomic(self.binary_path, lambda f: dump_binary_snapshot(
+            f, snapshot.tree.getroot(), snapshot.sizes, snapshot.journal_size,
+            snapshot.index.unbilled_dates, xml_stamp))
+        self._binary_stamp = xml_stamp
+        self.metrics['binary_writes'] += 1
+
+    def flush_binary(self):
+        # Escribe ahora la copia binaria pendiente sin esperar a que el XML quede inactivo (apagado, benchmarks)
+        if self.binary_path is None:
+            return
+        with self._binary_guard:
+            self._binary_due = 0.0
+            self._binary_guard.notify_all()
+            thread = self._binary_thread
+        if thread is not None:
+            thread.join()
+
+    @contextmanager
+    def read_snapshot(self):
+        # Fija la version publicada para todas las lecturas del hilo dentro del bloque (vista consistente)
+        # Pensado para reportes con varias consultas mientras otros hilos siguen escribiendo
+        if getattr(self._local, 'snapshot', None) is not None:
+            yield
+            return
+        self._local.snapshot = self.snapshot()
+        try:
+            yield
+        finally:
+            self._local.snapshot = None
 
     def load_tree(self) -> ET.ElementTree:
-        # Cargar XML desde archivo
-        return ET.parse(self.db_path)
+        # Arbol de la version publicada; el escritor en curso recibe su version de trabajo
+        if self._writer == threading.get_ident():
+            return self.working_tree()
+        return self.snapshot().tree
+
+    def working_tree(self) -> ET.ElementTree:
+        # Version de trabajo del escritor: raiz nueva que comparte las secciones con la version publicada
+        # Cada mutador pide con writable_section las secciones que modifica y solo esas se copian
+        if self._working is None:
+            base = self.latest_snapshot()
+            base_root = base.tree.getroot()
+            root = ET.Element(base_root.tag, dict(base_root.attrib))
+            root.text = base_root.text
+            root.extend(list(base_root))
+            # Las secciones que solo crecen se comparten: se quitan los hijos que un lote fallido dejo al final,
+            # que no pertenecen a ninguna version publicada
+            for name, size in base.sizes.items():
+                node = root.find(name)
+                if node is not None:
+                    del node[size:]
+            self._working = ET.ElementTree(root)
+            self._working_index = base.index.fork(root)
+            self._copied = set()
+            self._positions = None
+            self._generation = base.generation
+            self._journal_size = base.journal_size
+        return self._working
+
+    def writable_section(self, tree: ET.ElementTree, name: str) -> ET.Element:
+        # Seccion del arbol que el escritor puede modificar (se crea si no existe)
+        # La primera vez en el lote se copia, asi la version publicada que leen otros hilos no cambia
+        root = tree.getroot()
+        node = root.find(name)
+        if node is None:
+            return ET.SubElement(root, name)
+        if tree is not self._working or name in self._copied:
+            return node
+
+        index = self.get_index(tree)
+        if name in APPEND_ONLY_SECTIONS:
+            # Secciones grandes que solo crecen: copia superficial; los consumos existentes
+            # se copian uno a uno al modificarlos (writable_consumption)
+            # Los mutadores que solo agregan usan appendable_section y no copian
+            section = ET.Element(node.tag, dict(node.attrib))
+            section.text = node.text
+            section.tail = node.tail
+            section.extend(list(node))
+        else:
+            memo = {}
+            section = copy.deepcopy(node, memo)
+            index.remap_section(name, memo)
+        root[list(root).index(node)] = section
+        self._copied.add(name)
+        return section
+
+    def appendable_section(self, tree: ET.ElementTree, name: str) -> ET.Element:
+        # Seccion que solo crece (consumos, facturas) a la que el escritor solo agrega al final (se crea si no existe)
+        # No se copia: la version publicada comparte la lista de hijos y solo lee sus primeros sizes[name]
+        root = tree.getroot()
+        node = root.find(name)
+        if node is None:
+            return ET.SubElement(root, name)
+        return node
+
+    def section_nodes(self, tree: ET.ElementTree, name: str) -> List[ET.Element]:
+        # Hijos de una seccion que pertenecen a la version de tree (todos en la version de trabajo)
+        node = tree.getroot().find(name)
+        if node is None:
+            return []
+        snapshot = self._published.get(tree)
+        if snapshot is not None and name in snapshot.sizes:
+            return node[:snapshot.sizes[name]]
+        return list(node)
+
+    def writable_consumption(self, tree: ET.ElementTree, cons_id) -> None:
+        # Copia el nodo de un consumo dentro de la version de trabajo antes de modificarlo
+        section = self.writable_section(tree, 'consumptions')
+        if tree is not self._working:
+            return
+        index = self.get_index(tree)
+        key = consumption_key(cons_id)
+        cons_node = index.consumptions.get(key)
+        if cons_node is None:
+            return
+
+        if self._positions is None:
+            self._positions = {id(child): position for position,
+                               child in enumerate(section)}
+        position = self._positions.pop(id(cons_node), None)
+        if position is None or section[position] is not cons_node:
+            return  # Consumo agregado o ya copiado en este lote
+
+        cons_copy = copy.deepcopy(cons_node)
+        section[position] = cons_copy
+        index.consumptions[key] = cons_copy
+        if key in index.unbilled:
+            index.unbilled[key] = cons_copy
+
+    def publish(self):
+        # Publica la version de trabajo como la nueva version que leen todos los hilos (cambio atomico)
+        index = self._working_index
+        if index is None or index.root is not self._working.getroot():
+            index = StorageIndex(self._working.getroot())
+        self._snapshot = StorageSnapshot(self._working, index, self.file_stamp(),
+                                         self._generation, self._journal_size)
+        self._published[self._working] = self._snapshot
+        self._stale = False
+        self.metrics['published'] += 1
+        self.schedule_binary(self._snapshot)
+
+    def replay_journal(self, tree: ET.ElementTree):
+        # Aplica al arbol los consumos del diario que aun no fueron compactados en el XML
+        # Retorna la generacion del XML y la cantidad de registros aplicados
+        root = tree.getroot()
+        generation = int(root.get('journal_generation', '0'))
+        journal_size = 0
+        if not self.journal_path.exists():
+            return generation, journal_size
+
+        with open(self.journal_path, encoding='utf-8') as journal:
+            try:
+                header = json.loads(journal.readline())
+            except ValueError:
+                return generation, journal_size
+            # Un diario de otra generacion ya fue compactado en el XML
+            if header.get('generation') != generation:
+                return generation, journal_size
+
+            consumptions_node = root.find('consumptions')
+            if consumptions_node is None:
+                consumptions_node = ET.SubElement(root, 'consumptions')
+            for line in journal:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # Linea incompleta por una escritura interrumpida
+                self.append_consumption_node(consumptions_node, record)
+                journal_size += 1
+        return generation, journal_size
+
+    def reset_journal(self, generation: int):
+        # Deja el diario vacio con el encabezado de la generacion indicada
+        header = (json.dumps({'generation': generation}) + '\n').encode('utf-8')
+        self.write_atomic(self.journal_path, lambda f: f.write(header))
+
+    def journal_generation(self):
+        # Generacion del encabezado del diario, None si no existe o el encabezado esta danado
+        try:
+            with open(self.journal_path, encoding='utf-8') as journal:
+                return json.loads(journal.readline()).get('generation')
+        except (OSError, ValueError, AttributeError):
+            return None
 
-    def save_tree(self, tree: ET.ElementTree):
-        # Guardar XML en archivo
-        tree.write(self.db_path, encoding='utf-8', xml_declaration=True)
+    def append_journal(self, records: List[Dict[str, str]]):
+        # Agrega registros al final del diario con un solo fsync por lote
+        # Un diario de otra generacion (corte entre guardar el XML y reiniciarlo) ya esta compactado en el XML
+        # y replay_journal lo ignora: se reinicia antes de agregar, si no los registros nuevos se perderian
+        # Se llama desde el lote de escrituras, con el bloqueo exclusivo tomado
+        if self.journal_generation() != self._generation:
+            self.reset_journal(self._generation)
+
+        data = ''.join(json.dumps(record, ensure_ascii=False) +
+                       '\n' for record in records).encode('utf-8')
+        with open(self.journal_path, 'a+b') as journal:
+            # Cerrar una linea incompleta dejada por una escritura interrumpida
+            journal.seek(-1, os.SEEK_END)
+            if journal.read(1) != b'\n':
+                data = b'\n' + data
+            journal.write(data)
+            journal.flush()
+            if self.durability != 'none':
+                self.fsync(journal.fileno())
+        self.metrics['journal_appends'] += 1
+
+    def invalidate(self):
+        # Descarta la version de trabajo; la siguiente lectura vuelve a parsear el archivo
+        self._working = None
+        self._working_index = None
+        self._pending_save = False
+        self._stale = True
+
+    def get_index(self, tree: ET.ElementTree = None) -> StorageIndex:
+        # Indices por llave primaria de la version publicada (o de la version de trabajo del escritor)
+        if self._writer == threading.get_ident() and (tree is None or tree is self._working):
+            tree = self.load_tree()
+            if self._working_index is None or self._working_index.root is not tree.getroot():
+                self._working_index = StorageIndex(tree.getroot())
+            return self._working_index
+
+        snapshot = self.snapshot()
+        if tree is None or tree is snapshot.tree:
+            return snapshot.index
+        # Arbol de una version anterior a la vigente: sus indices ya respetan los tamanos de esa version
+        published = self._published.get(tree)
+        if published is not None:
+            return published.index
+        return StorageIndex(tree.getroot())
 
+    def save_tree(self, tree: ET.ElementTree):
+        # Guardar XML en archivo y dejarlo como copia residente
+        # El arbol ya contiene los consumos del diario, por lo que guardar tambien compacta el diario
+        if self._defer_save:
+            # Dentro de un lote de la cola se guarda una sola vez al terminar el lote
+            if tree is not self._working:
+                self._working = tree
+                self._working_index = None
+            self._pending_save = True
+            self._deferred = True
+            return
+        root = tree.getroot()
+        generation = max(self._generation, int(
+            root.get('journal_generation', '0'))) + 1
+        root.set('journal_generation', str(generation))
+        try:
+            self.write_atomic(self.db_path, lambda f: tree.write(
+                f, encoding='utf-8', xml_declaration=True))
+            self.reset_journal(generation)
+        except Exception:
+            self.invalidate()
+            raise
+        self.metrics['saves'] += 1
+        self._generation = generation
+        if self._journal_size:
+            self.metrics['compactions'] += 1
+        self._journal_size = 0
+
+    @queued_write
+    def bulk_write(self, write: Callable):
+        # Ejecuta write() (varias mutaciones seguidas) como una sola escritura de la cola
+        # Las mutaciones anidadas se aplican dentro del mismo lote y el XML se guarda una sola vez al final
+        return write()
+
+    @queued_write
+    def compact(self):
+        # Compacta el diario de consumos dentro del XML
+        self.save_tree(self.load_tree())
+
+    @queued_write
     def add_resources(self, resources: List[Resource]):
         # Agregar recursos a la base de datos
         tree = self.load_tree()
-        root = tree.getroot()
-        resources_node = root.find('resources')
-        if resources_node is None:
-            resources_node = ET.SubElement(root, 'resources')
+        resources_node = self.writable_section(tree, 'resources')
+        index = self.get_index(tree)
 
         for res in resources:
             # Verificar si ya existe
-            existing = resources_node.find(f".//resource[@id='{res.id}']")
+            existing = index.resources.pop(str(res.id), None)
             if existing is not None:
                 resources_node.remove(existing)
 
@@ -52,20 +596,22 @@ class XMLStorage:
             ET.SubElement(res_node, 'type').text = res.type
             ET.SubElement(res_node, 'value_per_hour').text = str(
                 res.value_per_hour)
+            index.resources[str(res.id)] = res_node
 
+        index.rates = None
+        index.revenue = None
         self.save_tree(tree)
 
+    @queued_write
     def add_categories(self, categories: List[Category]):
         # Agregar categorias con configuraciones a la base de datos
         tree = self.load_tree()
-        root = tree.getroot()
-        categories_node = root.find('categories')
-        if categories_node is None:
-            categories_node = ET.SubElement(root, 'categories')
+        categories_node = self.writable_section(tree, 'categories')
+        index = self.get_index(tree)
 
         for cat in categories:
             # Verificar si ya existe
-            existing = categories_node.find(f".//category[@id='{cat.id}']")
+            existing = index.categories.pop(str(cat.id), None)
             if existing is not None:
                 categories_node.remove(existing)
 
@@ -88,18 +634,22 @@ class XMLStorage:
                     res_node = ET.SubElement(resources_node, 'resource')
                     res_node.set('id', str(config_res.resource_id))
                     res_node.text = str(config_res.quantity)
+            index.categories[str(cat.id)] = cat_node
 
+        index.index_categories()
         self.save_tree(tree)
 
+    @queued_write
     def add_configuration_to_category(self, category_id: int, configuration: Configuration):
 
         # Agrega una configuracion a una categoria existente
 
         tree = self.load_tree()
-        root = tree.getroot()
+        self.writable_section(tree, 'categories')
+        index = self.get_index(tree)
 
         # Buscar la categoria
-        cat_node = root.find(f".//categories/category[@id='{category_id}']")
+        cat_node = index.categories.get(str(category_id))
         if cat_node is None:
             raise ValueError(f'Categoria con ID {category_id} no encontrada')
 
@@ -129,20 +679,21 @@ class XMLStorage:
             res_node.set('id', str(config_res.resource_id))
             res_node.text = str(config_res.quantity)
 
+        index.index_categories()
         self.save_tree(tree)
 
+    @queued_write
     def add_clients(self, clients: List[Client]):
         # Agregar clientes con instancias a la base de datos
         tree = self.load_tree()
-        root = tree.getroot()
-        clients_node = root.find('clients')
-        if clients_node is None:
-            clients_node = ET.SubElement(root, 'clients')
+        clients_node = self.writable_section(tree, 'clients')
+        index = self.get_index(tree)
 
         for client in clients:
             # Verificar si ya existe
-            existing = clients_node.find(f".//client[@nit='{client.nit}']")
+            existing = index.clients.get(client.nit)
             if existing is not None:
+                index.unindex_client(client.nit)
                 clients_node.remove(existing)
 
             client_node = ET.SubElement(clients_node, 'client')
@@ -165,24 +716,67 @@ class XMLStorage:
                 ET.SubElement(inst_node, 'status').text = instance.status
                 ET.SubElement(
                     inst_node, 'end_date').text = instance.end_date or ''
+            index.index_client(client_node)
 
+        # Las instancias definen la configuracion de cada consumo facturado
+        index.revenue = None
         self.save_tree(tree)
 
     def add_consumption(self, nit: str, instance_id: str, time_hours: str, date_time: str):
         # Agregar consumo a la base de datos
-        tree = self.load_tree()
-        root = tree.getroot()
-        consumptions_node = root.find('consumptions')
-        if consumptions_node is None:
-            consumptions_node = ET.SubElement(root, 'consumptions')
-
+        self.add_consumptions([{
+            'nit': nit,
+            'instance_id': instance_id,
+            'time_hours': time_hours,
+            'date_time': date_time
+        }])
+
+    def append_consumption_node(self, consumptions_node: ET.Element, record: Dict[str, str]) -> ET.Element:
+        # Crea el nodo de un consumo dentro de la seccion de consumos
         cons_node = ET.SubElement(consumptions_node, 'consumption')
-        cons_node.set('nit', nit)
-        cons_node.set('instance_id', instance_id)
-        ET.SubElement(cons_node, 'time_hours').text = time_hours
-        ET.SubElement(cons_node, 'date_time').text = date_time
+        if record.get('id') is not None:
+            cons_node.set('id', record['id'])
+        cons_node.set('nit', record['nit'])
+        cons_node.set('instance_id', record['instance_id'])
+        ET.SubElement(cons_node, 'time_hours').text = record['time_hours']
+        ET.SubElement(cons_node, 'date_time').text = record['date_time']
+        return cons_node
+
+    @queued_write
+    def add_consumptions(self, consumptions: List[Dict[str, str]]) -> int:
+        # Agrega un lote de consumos al diario (sin reescribir el XML) y a la copia residente
+        if not consumptions:
+            return 0
 
-        self.save_tree(tree)
+        tree = self.load_tree()
+        consumptions_node = self.appendable_section(tree, 'consumptions')
+        index = self.get_index(tree)
+
+        records = []
+        for consumption in consumptions:
+            # Cada consumo recibe un ID estable al ingresar
+            record = {
+                'id': str(index.next_consumption_id),
+                'nit': consumption['nit'],
+                'instance_id': consumption['instance_id'],
+                'time_hours': consumption['time_hours'],
+                'date_time': consumption['date_time']
+            }
+            cons_node = self.append_consumption_node(
+                consumptions_node, record)
+            index.index_consumption(cons_node, record['id'])
+            records.append(record)
+
+        try:
+            self.append_journal(records)
+        except Exception:
+            self.invalidate()
+            raise
+        self._journal_size += len(records)
+
+        if self._journal_size >= self.journal_limit:
+            self.save_tree(tree)
+        return len(records)
 
     def get_summary(self) -> Dict[str, int]:
         # Obtener conteos de entidades
@@ -200,7 +794,8 @@ class XMLStorage:
         clients_count = len(root.findall('.//clients/client'))
         instances_count = len(root.findall(
             './/clients/client/instances/instance'))
-        consumptions_count = len(root.findall('.//consumptions/consumption'))
+        consumptions_count = sum(1 for cons_node in self.section_nodes(tree, 'consumptions')
+                                 if cons_node.tag == 'consumption')
 
         return {
             'resources': resources_count,
@@ -211,6 +806,7 @@ class XMLStorage:
             'consumptions': consumptions_count
         }
 
+    @queued_write
     def clear_all(self):
 
         # Limpia todos los datos de la base de datos y reinicia la estructura XML a su estado inicial
@@ -222,158 +818,266 @@ class XMLStorage:
         ET.SubElement(root, 'consumptions')
         ET.SubElement(root, 'invoices')
         tree = ET.ElementTree(root)
-        tree.write(self.db_path, encoding='utf-8', xml_declaration=True)
+        self.save_tree(tree)
 
     def get_all_data(self) -> Dict:
 
         # Obtiene todos los datos almacenados en formato estructurado retorna diccionario con recursos, categorías, clientes, consumos
 
-        tree = self.load_tree()
-        root = tree.getroot()
-
-        # Obtener recursos (solo del nivel raíz, no de configuraciones)
-        resources = []
-        resources_node = root.find('resources')
-        if resources_node is not None:
-            for res_node in resources_node.findall('resource'):
-                resources.append({
-                    'id': res_node.get('id'),
-                    'name': res_node.find('name').text if res_node.find('name') is not None else '',
-                    'abbreviation': res_node.find('abbreviation').text if res_node.find('abbreviation') is not None else '',
-                    'metric': res_node.find('metric').text if res_node.find('metric') is not None else '',
-                    'type': res_node.find('type').text if res_node.find('type') is not None else '',
-                    'value_per_hour': res_node.find('value_per_hour').text if res_node.find('value_per_hour') is not None else ''
-                })
+        # Todas las secciones y el resumen se leen de la misma version publicada
+        with self.read_snapshot():
+            tree = self.load_tree()
+            root = tree.getroot()
+
+            # Obtener recursos (solo del nivel raíz, no de configuraciones)
+            resources = []
+            resources_node = root.find('resources')
+            if resources_node is not None:
+                for res_node in resources_node.findall('resource'):
+                    resources.append({
+                        'id': res_node.get('id'),
+                        'name': res_node.find('name').text if res_node.find('name') is not None else '',
+                        'abbreviation': res_node.find('abbreviation').text if res_node.find('abbreviation') is not None else '',
+                        'metric': res_node.find('metric').text if res_node.find('metric') is not None else '',
+                        'type': res_node.find('type').text if res_node.find('type') is not None else '',
+                        'value_per_hour': res_node.find('value_per_hour').text if res_node.find('value_per_hour') is not None else ''
+                    })
 
-        # Obtener categorías con configuraciones
-        categories = []
-        for cat_node in root.findall('.//categories/category'):
-            configurations = []
-            for config_node in cat_node.findall('.//configurations/configuration'):
-                config_resources = []
-                for res_node in config_node.findall('./resources/resource'):
-                    config_resources.append({
-                        'resource_id': res_node.get('id'),
-                        'quantity': res_node.text
+            # Obtener categorías con configuraciones
+            categories = []
+            for cat_node in root.findall('.//categories/category'):
+                configurations = []
+                for config_node in cat_node.findall('.//configurations/configuration'):
+                    config_resources = []
+                    for res_node in config_node.findall('./resources/resource'):
+                        config_resources.append({
+                            'resource_id': res_node.get('id'),
+                            'quantity': res_node.text
+                        })
+
+                    configurations.append({
+                        'id': config_node.get('id'),
+                        'name': config_node.find('name').text if config_node.find('name') is not None else '',
+                        'description': config_node.find('description').text if config_node.find('description') is not None else '',
+                        'resources': config_resources
                     })
 
-                configurations.append({
-                    'id': config_node.get('id'),
-                    'name': config_node.find('name').text if config_node.find('name') is not None else '',
-                    'description': config_node.find('description').text if config_node.find('description') is not None else '',
-                    'resources': config_resources
+                categories.append({
+                    'id': cat_node.get('id'),
+                    'name': cat_node.find('name').text if cat_node.find('name') is not None else '',
+                    'description': cat_node.find('description').text if cat_node.find('description') is not None else '',
+                    'workload': cat_node.find('workload').text if cat_node.find('workload') is not None else '',
+                    'configurations': configurations
                 })
 
-            categories.append({
-                'id': cat_node.get('id'),
-                'name': cat_node.find('name').text if cat_node.find('name') is not None else '',
-                'description': cat_node.find('description').text if cat_node.find('description') is not None else '',
-                'workload': cat_node.find('workload').text if cat_node.find('workload') is not None else '',
-                'configurations': configurations
-            })
+            # Obtener clientes con instancias
+            clients = []
+            for client_node in root.findall('.//clients/client'):
+                instances = []
+                for inst_node in client_node.findall('.//instances/instance'):
+                    instances.append({
+                        'id': inst_node.get('id'),
+                        'configuration_id': inst_node.find('configuration_id').text if inst_node.find('configuration_id') is not None else '',
+                        'name': inst_node.find('name').text if inst_node.find('name') is not None else '',
+                        'start_date': inst_node.find('start_date').text if inst_node.find('start_date') is not None else '',
+                        'status': inst_node.find('status').text if inst_node.find('status') is not None else '',
+                        'end_date': inst_node.find('end_date').text if inst_node.find('end_date') is not None else ''
+                    })
 
-        # Obtener clientes con instancias
-        clients = []
-        for client_node in root.findall('.//clients/client'):
-            instances = []
-            for inst_node in client_node.findall('.//instances/instance'):
-                instances.append({
-                    'id': inst_node.get('id'),
-                    'configuration_id': inst_node.find('configuration_id').text if inst_node.find('configuration_id') is not None else '',
-                    'name': inst_node.find('name').text if inst_node.find('name') is not None else '',
-                    'start_date': inst_node.find('start_date').text if inst_node.find('start_date') is not None else '',
-                    'status': inst_node.find('status').text if inst_node.find('status') is not None else '',
-                    'end_date': inst_node.find('end_date').text if inst_node.find('end_date') is not None else ''
+                clients.append({
+                    'nit': client_node.get('nit'),
+                    'name': client_node.find('name').text if client_node.find('name') is not None else '',
+                    'username': client_node.find('username').text if client_node.find('username') is not None else '',
+                    'password': client_node.find('password').text if client_node.find('password') is not None else '',
+                    'address': client_node.find('address').text if client_node.find('address') is not None else '',
+                    'email': client_node.find('email').text if client_node.find('email') is not None else '',
+                    'instances': instances
                 })
 
-            clients.append({
-                'nit': client_node.get('nit'),
-                'name': client_node.find('name').text if client_node.find('name') is not None else '',
-                'username': client_node.find('username').text if client_node.find('username') is not None else '',
-                'password': client_node.find('password').text if client_node.find('password') is not None else '',
-                'address': client_node.find('address').text if client_node.find('address') is not None else '',
-                'email': client_node.find('email').text if client_node.find('email') is not None else '',
-                'instances': instances
-            })
-
-        # Obtener consumos
-        consumptions = []
-        for cons_node in root.findall('.//consumptions/consumption'):
-            consumptions.append({
-                'nit': cons_node.get('nit'),
-                'instance_id': cons_node.get('instance_id'),
-                'time_hours': cons_node.find('time_hours').text if cons_node.find('time_hours') is not None else '',
-                'date_time': cons_node.find('date_time').text if cons_node.find('date_time') is not None else ''
-            })
+            # Obtener consumos
+            consumptions = []
+            for cons_node in self.get_index(tree).consumptions.values():
+                consumptions.append({
+                    'id': cons_node.get('id'),
+                    'nit': cons_node.get('nit'),
+                    'instance_id': cons_node.get('instance_id'),
+                    'time_hours': cons_node.find('time_hours').text if cons_node.find('time_hours') is not None else '',
+                    'date_time': cons_node.find('date_time').text if cons_node.find('date_time') is not None else ''
+                })
 
-        return {
-            'resources': resources,
-            'categories': categories,
-            'clients': clients,
-            'consumptions': consumptions,
-            'summary': self.get_summary()
-        }
+            return {
+                'resources': resources,
+                'categories': categories,
+                'clients': clients,
+                'consumptions': consumptions,
+                'summary': self.get_summary()
+            }
 
     def add_invoice(self, invoice_number: str, client_nit: str, issue_date: str, total_amount: float, consumption_ids: List[str]):
 
         # Agrega una factura a la base de datos
         # Marca los consumos como facturados
 
+        self.add_invoices([{
+            'invoice_number': invoice_number,
+            'client_nit': client_nit,
+            'issue_date': issue_date,
+            'total_amount': total_amount,
+            'consumption_ids': consumption_ids
+        }])
+
+    @queued_write
+    def add_invoices(self, invoices: List[Dict], billing_state: Dict = None) -> List[Dict]:
+        # Agrega todas las facturas de una corrida y marca sus consumos como facturados en una sola escritura
+        # Si algo falla antes de guardar se descarta la copia residente: no quedan consumos facturados a medias
+        # billing_state (marca de agua de facturacion incremental) se guarda en la misma escritura
+        # La corrida se armo fuera de la escritura: aqui se descartan las facturas con algun consumo ya
+        # facturado (otra corrida concurrente) y se numeran las que quedan (invoice_number None = siguiente numero)
+        # Retorna las facturas guardadas, con su numero
+        if not invoices and billing_state is None:
+            return []
+
         tree = self.load_tree()
-        root = tree.getroot()
-        invoices_node = root.find('invoices')
-        if invoices_node is None:
-            invoices_node = ET.SubElement(root, 'invoices')
-
-        # Crear nodo de factura
-        invoice_node = ET.SubElement(invoices_node, 'invoice')
-        invoice_node.set('number', invoice_number)
-        invoice_node.set('nit', client_nit)
-        ET.SubElement(invoice_node, 'issue_date').text = issue_date
-        ET.SubElement(invoice_node, 'total_amount').text = str(total_amount)
-
-        # Agregar IDs de consumos
-        consumptions_node = ET.SubElement(invoice_node, 'consumptions')
-        for cons_id in consumption_ids:
-            cons_ref = ET.SubElement(consumptions_node, 'consumption_ref')
-            cons_ref.text = cons_id
-
-        # Marcar consumos como facturados
-        consumptions_node = root.find('consumptions')
-        if consumptions_node is not None:
-            for cons_id in consumption_ids:
-                # Buscar el consumo por índice o algún identificador único
-                # En este caso, usamos la posición como ID
-                consumptions = list(consumptions_node.findall('consumption'))
-                try:
-                    idx = int(cons_id)
-                    if idx < len(consumptions):
-                        consumptions[idx].set('invoiced', 'true')
-                except (ValueError, IndexError):
-                    pass
+        try:
+            invoices_node = self.appendable_section(tree, 'invoices')
+            index = self.get_index(tree)
+            root = tree.getroot()
+            next_invoice_number = len(invoices_node.findall('invoice')) + 1
+            stored = []
+
+            for invoice in invoices:
+                keys = [consumption_key(cons_id) for cons_id in invoice['consumption_ids']]
+                if len(set(keys)) != len(keys) or not all(key in index.unbilled for key in keys):
+                    continue
+                if invoice['invoice_number'] is None:
+                    invoice = dict(invoice, invoice_number=f"FAC-{next_invoice_number:06d}")
+                    next_invoice_number += 1
+                stored.append(invoice)
+
+                # Crear nodo de factura
+                invoice_node = ET.SubElement(invoices_node, 'invoice')
+                invoice_node.set('number', invoice['invoice_number'])
+                invoice_node.set('nit', invoice['client_nit'])
+                ET.SubElement(
+                    invoice_node, 'issue_date').text = invoice['issue_date']
+                ET.SubElement(invoice_node, 'total_amount').text = str(
+                    invoice['total_amount'])
+
+                # Agregar IDs de consumos
+                consumptions_node = ET.SubElement(invoice_node, 'consumptions')
+                for cons_id in invoice['consumption_ids']:
+                    cons_ref = ET.SubElement(consumptions_node, 'consumption_ref')
+                    cons_ref.text = cons_id
+
+                # Marcar consumos como facturados usando el indice por ID
+                for cons_id in invoice['consumption_ids']:
+                    self.writable_consumption(tree, cons_id)
+                    index.mark_invoiced(cons_id)
+
+            if billing_state is not None:
+                self.set_billing_state_node(root, billing_state)
+        except Exception:
+            self.invalidate()
+            raise
 
         self.save_tree(tree)
+        if index.revenue is not None:
+            self.update_revenue_cube(index, stored)
+        return stored
+
+    def get_revenue_cube(self) -> RevenueCube:
+        # Cubo de ingresos de todas las facturas, se construye una vez y luego se actualiza con cada corrida
+        index = self.get_index()
+        if index.revenue is None:
+            cube = RevenueCube()
+            resolver = CatalogResolver(self, self.get_rate_table())
+            for invoice in self.get_invoices():
+                cube.add_invoice(invoice, self.get_consumptions_by_ids(
+                    invoice['consumption_ids']), resolver)
+            index.revenue = cube
+        return index.revenue
+
+    def update_revenue_cube(self, index: StorageIndex, invoices: List[Dict]):
+        # Agrega al cubo las facturas recien guardadas; si falla se descarta y se reconstruye al siguiente uso
+        try:
+            resolver = CatalogResolver(self, self.get_rate_table())
+            cube = index.writable_revenue()
+            for invoice in invoices:
+                cube.add_invoice(invoice, self.get_consumptions_by_ids(
+                    invoice['consumption_ids']), resolver)
+        except Exception:
+            index.revenue = None
 
     def get_unbilled_consumptions(self):
 
         # Obtiene todos los consumos que no han sido facturados
 
-        tree = self.load_tree()
-        root = tree.getroot()
+        return [self.consumption_dict(cons_node) for cons_node in self.get_index().unbilled.values()]
+
+    def count_unbilled_consumptions(self) -> int:
+        # Cantidad de consumos sin facturar
+        return len(self.get_index().unbilled)
+
+    def get_unbilled_consumptions_since(self, watermark: int):
+
+        # Consumos sin facturar con ID mayor a la marca de agua, ordenados por ID
+        # Retorna (consumos, ultimo ID asignado)
 
+        index = self.get_index()
         consumptions = []
-        for idx, cons_node in enumerate(root.findall('.//consumptions/consumption')):
-            if cons_node.get('invoiced') != 'true':
-                consumptions.append({
-                    'id': str(idx),
-                    'nit': cons_node.get('nit'),
-                    'instance_id': cons_node.get('instance_id'),
-                    'time_hours': cons_node.find('time_hours').text if cons_node.find('time_hours') is not None else '',
-                    'date_time': cons_node.find('date_time').text if cons_node.find('date_time') is not None else ''
-                })
+        for cons_id in range(max(watermark + 1, 0), index.next_consumption_id):
+            cons_node = index.unbilled.get(str(cons_id))
+            if cons_node is not None:
+                consumptions.append(self.consumption_dict(cons_node))
+        return consumptions, index.next_consumption_id - 1
+
+    def get_billing_state(self) -> Dict:
+        # Marca de agua de la facturacion incremental: ultimo ID de consumo revisado
+        state_node = self.load_tree().getroot().find('billing_state')
+        if state_node is None:
+            return {'watermark': -1}
+        return {'watermark': int(state_node.get('watermark', '-1'))}
+
+    def set_billing_state_node(self, root: ET.Element, billing_state: Dict):
+        # Reemplaza el nodo de estado de facturacion en el arbol (se guarda con la siguiente escritura)
+        # Se crea un nodo nuevo en lugar de modificar el anterior, que puede pertenecer a la version publicada
+        state_node = ET.Element('billing_state')
+        state_node.set('watermark', str(billing_state['watermark']))
+        previous = root.find('billing_state')
+        if previous is None:
+            root.append(state_node)
+        else:
+            state_node.tail = previous.tail
+            root[list(root).index(previous)] = state_node
+
+    def get_unbilled_consumptions_in_range(self, start_ordinal: int, end_ordinal: int):
 
+        # Consumos no facturados con fecha dentro del rango (ordinales de fecha, usa el indice por fecha)
+
+        return [self.consumption_dict(cons_node)
+                for cons_node in self.get_index().unbilled_in_range(start_ordinal, end_ordinal)]
+
+    def get_consumptions_by_ids(self, consumption_ids: List[str]):
+
+        # Obtiene los consumos con los IDs indicados (en el mismo orden), ignora los que no existen
+
+        index = self.get_index()
+        consumptions = []
+        for cons_id in consumption_ids:
+            cons_node = index.consumptions.get(consumption_key(cons_id))
+            if cons_node is not None:
+                consumptions.append(self.consumption_dict(cons_node))
         return consumptions
 
+    def consumption_dict(self, cons_node: ET.Element) -> Dict:
+        return {
+            'id': cons_node.get('id'),
+            'nit': cons_node.get('nit'),
+            'instance_id': cons_node.get('instance_id'),
+            'time_hours': cons_node.find('time_hours').text if cons_node.find('time_hours') is not None else '',
+            'date_time': cons_node.find('date_time').text if cons_node.find('date_time') is not None else ''
+        }
+
     def get_resources(self):
 
         # Obtiene todos los recursos del sistema
@@ -432,10 +1136,11 @@ class XMLStorage:
         # Obtiene todas las facturas registradas
 
         tree = self.load_tree()
-        root = tree.getroot()
 
         invoices = []
-        for inv_node in root.findall('.//invoices/invoice'):
+        for inv_node in self.section_nodes(tree, 'invoices'):
+            if inv_node.tag != 'invoice':
+                continue
             consumption_ids = []
             for cons_ref in inv_node.findall('.//consumptions/consumption_ref'):
                 if cons_ref.text:
@@ -451,22 +1156,22 @@ class XMLStorage:
 
         return invoices
 
+    @queued_write
     def cancel_instance(self, client_nit: str, instance_id: str, end_date: str):
 
         # Cancela una instancia específica de un cliente
         # Cambia el estado a 'Cancelada' y establece la fecha final
 
         tree = self.load_tree()
-        root = tree.getroot()
+        self.writable_section(tree, 'clients')
+        index = self.get_index(tree)
 
         # Buscar el cliente
-        client_node = root.find(f".//clients/client[@nit='{client_nit}']")
-        if client_node is None:
+        if client_nit not in index.clients:
             raise ValueError(f"Cliente con NIT {client_nit} no encontrado")
 
         # Buscar la instancia
-        instance_node = client_node.find(
-            f".//instances/instance[@id='{instance_id}']")
+        instance_node = index.instances.get((client_nit, str(instance_id)))
         if instance_node is None:
             raise ValueError(
                 f"Instancia {instance_id} no encontrada para cliente {client_nit}")
@@ -487,14 +1192,19 @@ class XMLStorage:
 
         self.save_tree(tree)
 
+    def get_rate_table(self) -> RateTable:
+        # Tarifas por hora de todas las configuraciones, se calculan una vez por version del catalogo
+        index = self.get_index()
+        if index.rates is None:
+            index.rates = RateTable.build(
+                list(index.configurations), self.get_configuration_by_id, self.get_resource_by_id)
+        return index.rates
+
     def get_resource_by_id(self, resource_id: str):
 
         # Obtiene un recurso por su ID
 
-        tree = self.load_tree()
-        root = tree.getroot()
-
-        res_node = root.find(f".//resources/resource[@id='{resource_id}']")
+        res_node = self.get_index().resources.get(str(resource_id))
         if res_node is None:
             return None
 
@@ -512,39 +1222,32 @@ class XMLStorage:
 
         # Obtiene una configuración por su ID (buscando en todas las categorías)
 
-        tree = self.load_tree()
-        root = tree.getroot()
-
-        for cat_node in root.findall('.//categories/category'):
-            config_node = cat_node.find(
-                f".//configurations/configuration[@id='{config_id}']")
-            if config_node is not None:
-                config_resources = []
-                for res_node in config_node.findall('.//resources/resource'):
-                    config_resources.append({
-                        # Cambio de 'id' a 'resource_id'
-                        'resource_id': res_node.get('id'),
-                        'quantity': float(res_node.text) if res_node.text else 0.0
-                    })
+        entry = self.get_index().configurations.get(str(config_id))
+        if entry is None:
+            return None
 
-                return {
-                    'id': config_node.get('id'),
-                    'name': config_node.find('name').text if config_node.find('name') is not None else '',
-                    'description': config_node.find('description').text if config_node.find('description') is not None else '',
-                    'resources': config_resources,
-                    'category_id': cat_node.get('id')
-                }
+        config_node, category_id = entry
+        config_resources = []
+        for res_node in config_node.findall('.//resources/resource'):
+            config_resources.append({
+                # Cambio de 'id' a 'resource_id'
+                'resource_id': res_node.get('id'),
+                'quantity': float(res_node.text) if res_node.text else 0.0
+            })
 
-        return None
+        return {
+            'id': config_node.get('id'),
+            'name': config_node.find('name').text if config_node.find('name') is not None else '',
+            'description': config_node.find('description').text if config_node.find('description') is not None else '',
+            'resources': config_resources,
+            'category_id': category_id
+        }
 
     def get_category_by_id(self, category_id: str):
 
         # Obtiene una categoria por su ID
 
-        tree = self.load_tree()
-        root = tree.getroot()
-
-        cat_node = root.find(f".//categories/category[@id='{category_id}']")
+        cat_node = self.get_index().categories.get(str(category_id))
         if cat_node is None:
             return None
 
@@ -559,15 +1262,8 @@ class XMLStorage:
 
         # Obtiene una instancia específica de un cliente
 
-        tree = self.load_tree()
-        root = tree.getroot()
-
-        client_node = root.find(f".//clients/client[@nit='{client_nit}']")
-        if client_node is None:
-            return None
-
-        instance_node = client_node.find(
-            f".//instances/instance[@id='{instance_id}']")
+        instance_node = self.get_index().instances.get(
+            (client_nit, str(instance_id)))
         if instance_node is None:
             return None
 
@@ -1,4 +1,5 @@
 import re
+from datetime import datetime
 from typing import Optional, Tuple
 
 
@@ -55,3 +56,17 @@ def extract_first_datetime(text: str) -> Optional[Tuple[str, str]]:
         return (date_only, "00:00")
 
     return None
+
+
+def parse_date_ordinal(text: str) -> Optional[int]:
+    # Retorna el ordinal de la fecha dd/mm/yyyy (admite hora al final) o None si no es valida
+    if not text:
+        return None
+    text = text.strip()
+    try:
+        return datetime.strptime(text, '%d/%m/%Y').toordinal()
+    except ValueError:
+        try:
+            return datetime.strptime(text.split(' ')[0], '%d/%m/%Y').toordinal()
+        except ValueError:
+            return None
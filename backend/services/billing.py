@@ -1,11 +1,87 @@
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
+from models.rates import RateTable, ResourceRate
 from models.storage import XMLStorage
+from models.validators import parse_date_ordinal
+
+
+def invalid_hours_error(consumption: Dict) -> ValueError:
+    # Error de validacion de un consumo cuyas horas no son numericas
+    return ValueError(f"Horas invalidas en el consumo {consumption.get('id')}: {consumption['time_hours']!r}")
+
+
+def consumption_hours(consumption: Dict) -> float:
+    # Horas de un consumo como numero
+    try:
+        return float(consumption['time_hours'])
+    except (TypeError, ValueError):
+        raise invalid_hours_error(consumption) from None
+
+
+def resource_details(breakdown: Optional[List[ResourceRate]], time_hours: float) -> Dict:
+    # Detalle por recurso de un consumo a partir del desglose de la tarifa
+    details = {}
+    for res in breakdown or []:
+        details[res.resource_id] = {
+            'name': res.name,
+            'quantity': res.quantity,
+            'cost_per_hour': res.cost_per_hour,
+            'time_hours': time_hours,
+            'total_cost': res.rate * time_hours
+        }
+    return details
+
+
+def cost_client_consumptions(consumptions: List[Dict], rates: RateTable,
+                             instance_configs: Dict[Tuple[str, str], Optional[str]]) -> Tuple[float, List[str], List[Dict]]:
+    # Costea los consumos de un cliente: (total, IDs de consumos, detalle por consumo)
+    # No usa el almacenamiento, por lo que puede ejecutarse en otro proceso
+    total_amount = 0.0
+    consumption_ids = []
+    details = []
+    for cons in consumptions:
+        config_id = instance_configs.get((cons['nit'], cons['instance_id']))
+        entry = rates.get(config_id) if config_id is not None else None
+        if entry is None:
+            cost, cons_resources = 0.0, {}
+        else:
+            hourly_rate, breakdown = entry
+            time_hours = consumption_hours(cons)
+            cost = hourly_rate * time_hours
+            cons_resources = resource_details(breakdown, time_hours)
+
+        total_amount += cost
+        consumption_ids.append(cons['id'])
+        details.append({
+            'consumption_id': cons['id'],
+            'instance_id': cons['instance_id'],
+            'time_hours': cons['time_hours'],
+            'date_time': cons['date_time'],
+            'cost': cost,
+            'resources': cons_resources
+        })
+    return total_amount, consumption_ids, details
+
+
+# Contexto de cada proceso de costeo: la tabla de tarifas y las instancias se envian una vez por proceso
+_worker_context = {}
+
+
+def init_costing_worker(rates: RateTable, instance_configs: Dict[Tuple[str, str], Optional[str]]):
+    _worker_context['rates'] = rates
+    _worker_context['instance_configs'] = instance_configs
+
+
+def cost_client_group(consumptions: List[Dict]) -> Tuple[float, List[str], List[Dict]]:
+    return cost_client_consumptions(consumptions, _worker_context['rates'], _worker_context['instance_configs'])
 
 
 class BillingService:
-    def __init__(self, storage: XMLStorage):
+    def __init__(self, storage: XMLStorage, workers: int = 0):
         self.storage = storage
+        # Procesos para costear clientes en paralelo (0 o 1 = en serie)
+        self.workers = workers
 
     def parse_date(self, date_str: str) -> datetime:
         # Convierte string de fecha en formato dd/mm/yyyy a datetime
@@ -30,59 +106,117 @@ class BillingService:
         except:
             return False
 
-    def calculate_consumption_cost(self, consumption: Dict) -> Tuple[float, Dict]:
+    def calculate_consumption_cost(self, consumption: Dict, rates: RateTable = None) -> Tuple[float, Dict]:
         # Calcula el costo de un consumo individual y retorna: (costo_total, detalle_por_recurso)
+        # La tarifa por hora de la configuracion viene precalculada, el costo es tarifa x horas
+        if rates is None:
+            rates = self.storage.get_rate_table()
+
         # Obtener instancia
         instance = self.storage.get_instance_by_id(
             consumption['nit'], consumption['instance_id'])
         if not instance:
             return 0.0, {}
 
-        # Obtener configuración
-        config = self.storage.get_configuration_by_id(
-            instance['configuration_id'])
-        if not config:
+        # Obtener tarifa de la configuración
+        entry = rates.get(instance['configuration_id'])
+        if entry is None:
             return 0.0, {}
 
-        # Calcular costo por recurso
-        time_hours = float(consumption['time_hours'])
-        total_cost = 0.0
-        resource_details = {}
-
-        for config_res in config['resources']:
-            resource = self.storage.get_resource_by_id(
-                config_res['resource_id'])
-            if resource:
-                quantity = config_res['quantity']
-                cost_per_hour = resource['value_per_hour']
-                resource_cost = quantity * cost_per_hour * time_hours
-
-                total_cost += resource_cost
-                resource_details[resource['id']] = {
-                    'name': resource['name'],
-                    'quantity': quantity,
-                    'cost_per_hour': cost_per_hour,
-                    'time_hours': time_hours,
-                    'total_cost': resource_cost
-                }
+        hourly_rate, breakdown = entry
+        time_hours = consumption_hours(consumption)
+        return hourly_rate * time_hours, resource_details(breakdown, time_hours)
 
-        return total_cost, resource_details
+    def instance_configurations(self, consumptions: List[Dict]) -> Dict[Tuple[str, str], Optional[str]]:
+        # Configuracion de cada instancia usada en la corrida (None si la instancia no existe)
+        instance_configs = {}
+        for cons in consumptions:
+            key = (cons['nit'], cons['instance_id'])
+            if key not in instance_configs:
+                instance = self.storage.get_instance_by_id(*key)
+                instance_configs[key] = instance['configuration_id'] if instance else None
+        return instance_configs
 
-    def generate_invoices(self, start_date: str, end_date: str) -> List[Dict]:
+    def generate_invoices(self, start_date: str, end_date: str, incremental: bool = False) -> List[Dict]:
         # Genera facturas para todos los clientes según consumos en el rango de fechas
         # Retorna lista de facturas generadas
-        # Obtener consumos no facturados
-        unbilled = self.storage.get_unbilled_consumptions()
+        return self.run_billing(start_date, end_date, incremental)['invoices']
+
+    def run_billing(self, start_date: str, end_date: str, incremental: bool = False) -> Dict:
+        # Corrida de facturacion completa: retorna las facturas y estadisticas de la corrida
+        # En modo incremental solo se revisan uno a uno los consumos ingresados despues de la marca de agua;
+        # los pendientes de corridas anteriores (arrastre) se buscan por fecha en el indice
+        stats = {
+            'mode': 'incremental' if incremental else 'full',
+            'examined': 0,
+            'skipped': self.storage.count_unbilled_consumptions(),
+            'billed': 0,
+            'workers': 1
+        }
+
+        # Los limites del rango se parsean una sola vez por corrida
+        start_ordinal = parse_date_ordinal(start_date)
+        end_ordinal = parse_date_ordinal(end_date)
+        if start_ordinal is None or end_ordinal is None:
+            return {'invoices': [], 'stats': stats}
+
+        billing_state = None
+        if incremental:
+            previous_state = self.storage.get_billing_state()
+            consumptions_in_range, examined, billing_state = self.select_incremental(
+                start_ordinal, end_ordinal, previous_state)
+            # Consumos que quedan pendientes para las siguientes corridas
+            stats['carry_over'] = max(stats['skipped'] - len(consumptions_in_range), 0)
+            if billing_state == previous_state:
+                billing_state = None  # Sin cambios, no hace falta escribir el estado
+        else:
+            # Obtener consumos no facturados del rango desde el indice por fecha
+            consumptions_in_range = self.storage.get_unbilled_consumptions_in_range(
+                start_ordinal, end_ordinal)
+            examined = len(consumptions_in_range)
+        stats['examined'] = examined
+        stats['skipped'] = max(stats['skipped'] - examined, 0)
+        stats['billed'] = len(consumptions_in_range)
 
-        # Filtrar por rango de fechas
-        consumptions_in_range = []
-        for cons in unbilled:
-            if self.is_date_in_range(cons['date_time'], start_date, end_date):
+        invoices, records = [], []
+        if consumptions_in_range:
+            invoices, records, stats['workers'] = self.build_invoices(
+                consumptions_in_range, end_date)
+
+        # Todas las facturas, consumos facturados y la marca de agua de la corrida en una sola escritura
+        # El almacenamiento descarta las facturas que una corrida concurrente ya facturo y numera el resto
+        if records or billing_state is not None:
+            stored = self.storage.add_invoices(records, billing_state=billing_state)
+            numbers = {record['client_nit']: record['invoice_number'] for record in stored}
+            invoices = [dict(invoice, invoice_number=numbers[invoice['client_nit']])
+                        for invoice in invoices if invoice['client_nit'] in numbers]
+            stats['billed'] = sum(invoice['consumptions_count'] for invoice in invoices)
+        return {'invoices': invoices, 'stats': stats}
+
+    def select_incremental(self, start_ordinal: int, end_ordinal: int, state: Dict) -> Tuple[List[Dict], int, Dict]:
+        # Consumos a facturar en modo incremental: (consumos del rango, revisados, nuevo estado)
+        # El arrastre son los consumos bajo la marca de agua que siguen sin facturar (fuera del rango de una
+        # corrida anterior o de una factura descartada por otra corrida): no se guarda una lista de IDs,
+        # se toman del indice por fecha los del rango, asi el estado es solo la marca de agua y no crece
+        # Los de fecha invalida nunca entran en un rango y nunca se facturan
+        watermark = state['watermark']
+        candidates, last_id = self.storage.get_unbilled_consumptions_since(watermark)
+        carried = [cons for cons in self.storage.get_unbilled_consumptions_in_range(start_ordinal, end_ordinal)
+                   if int(cons['id']) <= watermark]
+
+        consumptions_in_range = list(carried)
+        for cons in candidates:
+            ordinal = parse_date_ordinal(cons['date_time'])
+            if ordinal is not None and start_ordinal <= ordinal <= end_ordinal:
                 consumptions_in_range.append(cons)
+        consumptions_in_range.sort(key=lambda cons: int(cons['id']))
 
-        if not consumptions_in_range:
-            return []
+        new_state = {'watermark': max(watermark, last_id)}
+        return consumptions_in_range, len(carried) + len(candidates), new_state
 
+    def build_invoices(self, consumptions_in_range: List[Dict], end_date: str) -> Tuple[List[Dict], List[Dict], int]:
+        # Costea los consumos y arma las facturas por cliente
+        # Retorna (facturas con detalle, registros a guardar en storage, procesos usados)
         # Agrupar por cliente
         clients_consumptions = {}
         for cons in consumptions_in_range:
@@ -91,41 +225,39 @@ class BillingService:
                 clients_consumptions[nit] = []
             clients_consumptions[nit].append(cons)
 
-        # Generar facturas
+        # Costear cada cliente, en serie o repartiendo los clientes entre procesos
+        # map conserva el orden de los clientes, los resultados se unen igual que en serie
+        rates = self.storage.get_rate_table()
+        instance_configs = self.instance_configurations(consumptions_in_range)
+        groups = list(clients_consumptions.values())
+        workers = min(self.workers, len(groups))
+        if workers > 1:
+            chunksize = max(len(groups) // (workers * 4), 1)
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_costing_worker,
+                                     initargs=(rates, instance_configs)) as executor:
+                costed = list(executor.map(
+                    cost_client_group, groups, chunksize=chunksize))
+        else:
+            workers = 1
+            costed = [cost_client_consumptions(group, rates, instance_configs)
+                      for group in groups]
+
+        # Generar facturas, una por cliente en el orden de los clientes
         invoices = []
-        existing_invoices = self.storage.get_invoices()
-        next_invoice_number = len(existing_invoices) + 1
-
-        for nit, consumptions in clients_consumptions.items():
-            total_amount = 0.0
-            consumption_ids = []
-            details = []
-
-            for cons in consumptions:
-                cost, resource_details = self.calculate_consumption_cost(cons)
-                total_amount += cost
-                consumption_ids.append(cons['id'])
-                details.append({
-                    'consumption_id': cons['id'],
-                    'instance_id': cons['instance_id'],
-                    'time_hours': cons['time_hours'],
-                    'date_time': cons['date_time'],
-                    'cost': cost,
-                    'resources': resource_details
-                })
-
-            # Crear factura
-            invoice_number = f"FAC-{next_invoice_number:06d}"
-            next_invoice_number += 1
-
-            # Guardar en storage
-            self.storage.add_invoice(
-                invoice_number=invoice_number,
-                client_nit=nit,
-                issue_date=end_date,
-                total_amount=total_amount,
-                consumption_ids=consumption_ids
-            )
+        records = []
+
+        for (nit, consumptions), (total_amount, consumption_ids, details) in zip(clients_consumptions.items(), costed):
+            # Crear factura (el numero se asigna al guardarla, dentro de la escritura)
+            invoice_number = None
+
+            # Se guarda junto con el resto de la corrida
+            records.append({
+                'invoice_number': invoice_number,
+                'client_nit': nit,
+                'issue_date': end_date,
+                'total_amount': total_amount,
+                'consumption_ids': consumption_ids
+            })
 
             invoices.append({
                 'invoice_number': invoice_number,
@@ -136,7 +268,7 @@ class BillingService:
                 'details': details
             })
 
-        return invoices
+        return invoices, records, workers
 
     def get_invoice_detail(self, invoice_number: str) -> Dict:
         # Obtiene el detalle completo de una factura
@@ -0,0 +1,97 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+
+class PDFCache:
+    # Cache en disco de PDFs generados, la llave es el numero de factura mas el hash de sus datos
+    # Si los datos cambian (catalogo, cliente) el hash cambia y el PDF se vuelve a generar
+    # El tamano total se limita a max_bytes desalojando los archivos usados hace mas tiempo (LRU por mtime)
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.metrics = {'hits': 0, 'misses': 0, 'evictions': 0}
+        if self.enabled:
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def entry_name(self, invoice_number: str, payload: Dict) -> str:
+        # Nombre del archivo en cache: numero de factura (saneado) y hash de los datos del reporte
+        digest = hashlib.sha256(json.dumps(
+            payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        return f"{self.safe_prefix(invoice_number)}-{digest[:32]}.pdf"
+
+    def safe_prefix(self, invoice_number: str) -> str:
+        return re.sub(r'[^A-Za-z0-9_-]', '_', str(invoice_number))
+
+    def get(self, name: str) -> Optional[bytes]:
+        # Contenido del PDF en cache o None; cada acierto lo marca como usado recientemente
+        # Se leen los bytes y no se entrega la ruta: otra peticion u otro proceso puede desalojar el archivo
+        if not self.enabled:
+            return None
+        path = self.directory / name
+        try:
+            os.utime(path)
+            with open(path, 'rb') as f:
+                pdf = f.read()
+        except FileNotFoundError:
+            self.metrics['misses'] += 1
+            return None
+        self.metrics['hits'] += 1
+        return pdf
+
+    def contains(self, name: str) -> bool:
+        # Indica si el PDF esta en cache sin leerlo; puede desalojarse antes de pedirlo con get
+        return self.enabled and (self.directory / name).is_file()
+
+    def put(self, name: str, pdf: bytes):
+        # Guarda un PDF recien generado (escritura atomica) y aplica el limite de tamano
+        if not self.enabled:
+            return
+        path = self.directory / name
+        temp_path = path.with_name(
+            f'.{name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        with open(temp_path, 'wb') as f:
+            f.write(pdf)
+        os.replace(temp_path, path)
+
+        # Las versiones anteriores de la misma factura ya no se van a pedir
+        prefix = name.rsplit('-', 1)[0] + '-'
+        for old_path in self.directory.glob(f'{prefix}*.pdf'):
+            if old_path.name != name and old_path.name.rsplit('-', 1)[0] + '-' == prefix:
+                self.remove(old_path)
+
+        self.evict(keep=path)
+
+    def evict(self, keep: Path = None):
+        # Desaloja los PDFs menos usados hasta respetar max_bytes
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith('.pdf'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+                total += stat.st_size
+
+        entries.sort()
+        for _, size, entry_path in entries:
+            if total <= self.max_bytes:
+                break
+            if keep is not None and entry_path == str(keep):
+                continue
+            self.remove(Path(entry_path))
+            total -= size
+
+    def remove(self, path: Path):
+        try:
+            path.unlink()
+            self.metrics['evictions'] += 1
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,84 @@
+import io
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Tuple
+from services.report_cache import PDFCache
+
+
+def render_invoice_pdf(invoice_data: Dict) -> bytes:
+    # Genera el PDF de una factura (se ejecuta en los procesos de exportacion)
+    from services.reports import generate_invoice_detail_pdf
+    return generate_invoice_detail_pdf(invoice_data).getvalue()
+
+
+def iter_rendered(datas: List[Dict], workers: int) -> Iterator[bytes]:
+    # Genera los PDFs en orden; con varios procesos solo hay una ventana acotada de trabajos en vuelo,
+    # por lo que nunca se retienen todos los PDFs en memoria
+    if workers <= 1 or len(datas) <= 1:
+        for invoice_data in datas:
+            yield render_invoice_pdf(invoice_data)
+        return
+
+    executor = ProcessPoolExecutor(max_workers=min(workers, len(datas)))
+    try:
+        in_flight = deque()
+        pending = iter(datas)
+        for invoice_data in pending:
+            in_flight.append(executor.submit(render_invoice_pdf, invoice_data))
+            if len(in_flight) >= workers * 2:
+                break
+        while in_flight:
+            pdf = in_flight.popleft().result()
+            next_data = next(pending, None)
+            if next_data is not None:
+                in_flight.append(executor.submit(
+                    render_invoice_pdf, next_data))
+            yield pdf
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ZipStream(io.RawIOBase):
+    # Destino no buscable para ZipFile: acumula lo escrito hasta que el generador lo entrega
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_invoice_zip(items: List[Tuple[str, Dict]], cache: PDFCache, workers: int) -> Iterator[bytes]:
+    # Produce un ZIP con el PDF de cada factura (numero, datos del reporte) a medida que se generan
+    # Los PDFs en cache se leen de disco, los demas se generan en un pool de procesos y se guardan en cache
+    names = [cache.entry_name(number, invoice_data)
+             for number, invoice_data in items]
+    cached = [cache.contains(name) for name in names]
+    rendered = iter_rendered([invoice_data for (_, invoice_data), in_cache in zip(items, cached)
+                              if not in_cache], workers)
+
+    stream = ZipStream()
+    with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for (number, invoice_data), name, in_cache in zip(items, names, cached):
+            if in_cache:
+                pdf = cache.get(name)
+                if pdf is None:
+                    # Desalojado despues de consultarlo, se genera aqui mismo
+                    pdf = render_invoice_pdf(invoice_data)
+            else:
+                pdf = next(rendered)
+                cache.put(name, pdf)
+
+            archive.writestr(
+                f'factura_{cache.safe_prefix(number)}.pdf', pdf)
+            yield stream.drain()
+    yield stream.drain()
@@ -0,0 +1,150 @@
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+JOB_ID = re.compile(r'[0-9a-f]{32}')
+# Identifica a este proceso aunque un reinicio reutilice su pid (contenedores)
+PROCESS_TOKEN = uuid.uuid4().hex
+
+
+class ReportJobQueue:
+    # Cola de trabajos de reportes: la peticion encola el render y responde de inmediato con el id del trabajo
+    # Un pool de hilos genera el archivo en directory; los clientes consultan el estado y luego lo descargan
+    # El estado de cada trabajo se guarda en JSON en directory/<id>.job junto al archivo, asi cualquier proceso
+    # (varios workers del servidor) lo responde y sobrevive a un reinicio
+    # Se conservan los ultimos `keep` trabajos terminados y ninguno mas antiguo que max_age segundos
+    def __init__(self, directory: Path, workers: int, keep: int = 100, max_age: float = 86400):
+        self.directory = directory
+        self.keep = keep
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(
+            max_workers=max(1, workers), thread_name_prefix='report-job')
+        # Los trabajos de ejecuciones anteriores se conservan; solo se podan por cantidad y antiguedad
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.prune()
+
+    def submit(self, kind: str, download_name: str, mimetype: str, render: Callable[[], bytes]) -> Dict:
+        # Encola un render (funcion que devuelve los bytes del archivo) y devuelve el estado inicial
+        job_id = uuid.uuid4().hex
+        extension = os.path.splitext(download_name)[1]
+        job = {
+            'id': job_id,
+            'kind': kind,
+            'status': 'pending',
+            'error': None,
+            'download_name': download_name,
+            'mimetype': mimetype,
+            'created_at': time.time(),
+            'finished_at': None,
+            'file': f'{job_id}{extension}',
+            'owner': [os.getpid(), PROCESS_TOKEN]
+        }
+        self.save(job)
+        initial = self.public(job)
+        self.executor.submit(self.run, job, render)
+        return initial
+
+    def run(self, job: Dict, render: Callable[[], bytes]):
+        job['status'] = 'running'
+        self.save(job)
+        try:
+            data = render()
+            self.write_atomic(self.directory / job['file'], data)
+            status, error = 'done', None
+        except Exception as e:
+            status, error = 'error', str(e)
+
+        job['status'] = status
+        job['error'] = error
+        job['finished_at'] = time.time()
+        self.save(job)
+        self.prune()
+
+    def record_path(self, job_id: str) -> Path:
+        return self.directory / f'{job_id}.job'
+
+    def write_atomic(self, path: Path, data: bytes):
+        # El archivo se escribe en un temporal y se reemplaza: otro proceso nunca lo lee a medias
+        temp_path = path.with_name(f'.{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def save(self, job: Dict):
+        self.write_atomic(self.record_path(job['id']), json.dumps(job).encode('utf-8'))
+
+    def load(self, job_id: str) -> Optional[Dict]:
+        # Estado guardado de un trabajo, None si el id no es valido o no existe
+        if not isinstance(job_id, str) or not JOB_ID.fullmatch(job_id):
+            return None
+        try:
+            with open(self.record_path(job_id), encoding='utf-8') as f:
+                job = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if job['status'] in ('pending', 'running') and not self.owner_alive(*job['owner']):
+            # El proceso que lo generaba termino (reinicio o caida): el trabajo ya no va a terminar
+            job['status'] = 'error'
+            job['error'] = 'El proceso que generaba el reporte termino antes de completarlo'
+        return job
+
+    def owner_alive(self, pid: int, token: str) -> bool:
+        # El proceso que encolo el trabajo sigue vivo
+        if pid == os.getpid():
+            return token == PROCESS_TOKEN
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except OSError:
+            return True  # Existe pero pertenece a otro usuario
+        return True
+
+    def finished_jobs(self) -> List[Dict]:
+        # Trabajos terminados guardados en el directorio, del mas antiguo al mas reciente
+        finished = []
+        for entry in self.directory.glob('*.job'):
+            job = self.load(entry.stem)
+            if job is not None and job['status'] in ('done', 'error'):
+                finished.append(job)
+        finished.sort(key=lambda job: job['finished_at'] or job['created_at'])
+        return finished
+
+    def prune(self):
+        # Elimina los trabajos terminados (estado y archivo) por encima de keep o con mas de max_age segundos
+        # Los pendientes y en curso no se tocan; los de un proceso que termino cuentan como terminados
+        with self.lock:
+            finished = self.finished_jobs()
+            cutoff = time.time() - self.max_age
+            excess = max(0, len(finished) - self.keep)
+            expired = [job for position, job in enumerate(finished)
+                       if position < excess or (job['finished_at'] or job['created_at']) < cutoff]
+            for job in expired:
+                for path in (self.directory / job['file'], self.record_path(job['id'])):
+                    try:
+                        path.unlink()
+                    except FileNotFoundError:
+                        pass  # Otro proceso ya lo elimino
+
+    def status(self, job_id: str) -> Optional[Dict]:
+        job = self.load(job_id)
+        return self.public(job) if job else None
+
+    def artifact(self, job_id: str) -> Optional[Dict]:
+        # Trabajo terminado con su ruta de archivo, None si no existe o aun no termina
+        job = self.load(job_id)
+        if not job or job['status'] != 'done':
+            return None
+        job['path'] = self.directory / job['file']
+        return job
+
+    def public(self, job: Dict) -> Dict:
+        # Estado visible para los clientes (sin rutas ni datos internos)
+        return {key: value for key, value in job.items() if key not in ('file', 'owner')}
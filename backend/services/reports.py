@@ -8,6 +8,121 @@ from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph,
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
 
 
+class ReportTheme:
+    # Estilos de parrafo y de tabla de los reportes, se construyen una sola vez por proceso
+    # Los TableStyle no se modifican al aplicarlos, asi que cada render solo crea sus filas
+    def __init__(self):
+        styles = getSampleStyleSheet()
+        self.normal = styles['Normal']
+        self.title = ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=24,
+            textColor=colors.HexColor('#1e40af'),
+            spaceAfter=30,
+            alignment=TA_CENTER
+        )
+        self.heading = ParagraphStyle(
+            'CustomHeading',
+            parent=styles['Heading2'],
+            fontSize=14,
+            textColor=colors.HexColor('#1e40af'),
+            spaceAfter=12,
+            spaceBefore=12
+        )
+        self.right = ParagraphStyle(
+            'right', parent=self.normal, alignment=TA_RIGHT)
+        self.footer = ParagraphStyle('footer', parent=self.normal,
+                                     alignment=TA_CENTER, fontSize=8, textColor=colors.grey)
+
+        self.company_table = TableStyle([
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#334155')),
+        ])
+
+        # Factura detallada
+        self.invoice_info_table = TableStyle([
+            ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
+            ('ALIGN', (1, 0), (1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+        ])
+        self.client_table = TableStyle([
+            ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
+            ('ALIGN', (1, 0), (1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+        ])
+        self.consumption_table = TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#f1f5f9')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.HexColor('#475569')),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('ALIGN', (1, 0), (1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 9),
+            ('FONTSIZE', (0, 1), (-1, -1), 8),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#cbd5e1')),
+        ])
+        self.resource_table = TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#e2e8f0')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.HexColor('#1e293b')),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 9),
+            ('FONTSIZE', (0, 1), (-1, -1), 8),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
+            ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#cbd5e1')),
+        ])
+        self.invoice_total_table = TableStyle([
+            ('ALIGN', (3, 0), (3, 0), 'RIGHT'),
+            ('ALIGN', (4, 0), (4, 0), 'CENTER'),
+            ('FONTNAME', (3, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (3, 0), (-1, 0), 12),
+            ('TEXTCOLOR', (3, 0), (-1, 0), colors.HexColor('#1e40af')),
+            ('BACKGROUND', (4, 0), (4, 0), colors.HexColor('#e0e7ff')),
+            ('BOX', (4, 0), (4, 0), 2, colors.HexColor('#1e40af')),
+        ])
+
+        # Analisis de ventas
+        self.period_table = TableStyle([
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (0, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 11),
+            ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+        ])
+        self.analysis_table = TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e40af')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('ALIGN', (2, 0), (3, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 11),
+            ('FONTSIZE', (0, 1), (-1, -1), 9),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#cbd5e1')),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1),
+             [colors.white, colors.HexColor('#f8fafc')]),
+        ])
+        self.sales_total_table = TableStyle([
+            ('ALIGN', (0, 0), (0, 0), 'RIGHT'),
+            ('ALIGN', (1, 0), (1, 0), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 14),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.HexColor('#1e40af')),
+            ('BACKGROUND', (1, 0), (1, 0), colors.HexColor('#e0e7ff')),
+            ('BOX', (1, 0), (1, 0), 2, colors.HexColor('#1e40af')),
+        ])
+
+
+# Tema compartido por todos los renders del proceso
+THEME = ReportTheme()
+
+
 def generate_invoice_detail_pdf(invoice_data):
 
     buffer = BytesIO()
@@ -18,25 +133,10 @@ def generate_invoice_detail_pdf(invoice_data):
     # Contenedor de elementos
     elements = []
 
-    # Estilos
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=colors.HexColor('#1e40af'),
-        spaceAfter=30,
-        alignment=TA_CENTER
-    )
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading2'],
-        fontSize=14,
-        textColor=colors.HexColor('#1e40af'),
-        spaceAfter=12,
-        spaceBefore=12
-    )
-    normal_style = styles['Normal']
+    # Estilos compartidos
+    title_style = THEME.title
+    heading_style = THEME.heading
+    normal_style = THEME.normal
 
     # Titulo
     title = Paragraph("FACTURA DETALLADA", title_style)
@@ -50,12 +150,7 @@ def generate_invoice_detail_pdf(invoice_data):
         ["Guatemala, Guatemala"],
     ]
     company_table = Table(company_data, colWidths=[6*inch])
-    company_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#334155')),
-    ]))
+    company_table.setStyle(THEME.company_table)
     elements.append(company_table)
     elements.append(Spacer(1, 20))
 
@@ -67,13 +162,7 @@ def generate_invoice_detail_pdf(invoice_data):
         ["NIT Cliente:", invoice.get('nit', 'N/A')],
     ]
     invoice_info_table = Table(invoice_info_data, colWidths=[2*inch, 4*inch])
-    invoice_info_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
-        ('ALIGN', (1, 0), (1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-    ]))
+    invoice_info_table.setStyle(THEME.invoice_info_table)
     elements.append(invoice_info_table)
     elements.append(Spacer(1, 20))
 
@@ -87,13 +176,7 @@ def generate_invoice_detail_pdf(invoice_data):
         ["Email:", client.get('email', 'N/A')],
     ]
     client_table = Table(client_data, colWidths=[1.5*inch, 4.5*inch])
-    client_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
-        ('ALIGN', (1, 0), (1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-    ]))
+    client_table.setStyle(THEME.client_table)
     elements.append(client_table)
     elements.append(Spacer(1, 20))
 
@@ -126,17 +209,7 @@ def generate_invoice_detail_pdf(invoice_data):
                 ])
             
             consumption_table = Table(consumption_data, colWidths=[4*inch, 2*inch])
-            consumption_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#f1f5f9')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.HexColor('#475569')),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('ALIGN', (1, 0), (1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 9),
-                ('FONTSIZE', (0, 1), (-1, -1), 8),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
-                ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#cbd5e1')),
-            ]))
+            consumption_table.setStyle(THEME.consumption_table)
             elements.append(consumption_table)
             elements.append(Spacer(1, 10))
 
@@ -162,23 +235,14 @@ def generate_invoice_detail_pdf(invoice_data):
 
             resource_table = Table(resource_data, colWidths=[
                                    1.5*inch, 0.8*inch, 0.8*inch, 1*inch, 1*inch, 1*inch])
-            resource_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#e2e8f0')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.HexColor('#1e293b')),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 9),
-                ('FONTSIZE', (0, 1), (-1, -1), 8),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
-                ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#cbd5e1')),
-            ]))
+            resource_table.setStyle(THEME.resource_table)
             elements.append(resource_table)
 
         # Subtotal de la instancia
         instance_subtotal = instance.get('subtotal', 0.0)
         grand_total += instance_subtotal
         subtotal_text = Paragraph(f"<b>Subtotal Instancia: ${instance_subtotal:.2f}</b>",
-                                  ParagraphStyle('right', parent=normal_style, alignment=TA_RIGHT))
+                                  THEME.right)
         elements.append(Spacer(1, 6))
         elements.append(subtotal_text)
         elements.append(Spacer(1, 12))
@@ -190,23 +254,14 @@ def generate_invoice_detail_pdf(invoice_data):
     ]
     total_table = Table(total_data, colWidths=[
                         2*inch, 1*inch, 1*inch, 1*inch, 1*inch])
-    total_table.setStyle(TableStyle([
-        ('ALIGN', (3, 0), (3, 0), 'RIGHT'),
-        ('ALIGN', (4, 0), (4, 0), 'CENTER'),
-        ('FONTNAME', (3, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (3, 0), (-1, 0), 12),
-        ('TEXTCOLOR', (3, 0), (-1, 0), colors.HexColor('#1e40af')),
-        ('BACKGROUND', (4, 0), (4, 0), colors.HexColor('#e0e7ff')),
-        ('BOX', (4, 0), (4, 0), 2, colors.HexColor('#1e40af')),
-    ]))
+    total_table.setStyle(THEME.invoice_total_table)
     elements.append(total_table)
 
     # Pie de pagina
     elements.append(Spacer(1, 40))
     footer_text = Paragraph(
         "Gracias por confiar en Tecnologías Chapinas, S.A.<br/>Este documento es una representación impresa de una factura electrónica.",
-        ParagraphStyle('footer', parent=normal_style,
-                       alignment=TA_CENTER, fontSize=8, textColor=colors.grey)
+        THEME.footer
     )
     elements.append(footer_text)
 
@@ -225,24 +280,9 @@ def generate_sales_analysis_pdf(analysis_data, analysis_type):
 
     elements = []
 
-    # Estilos
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=colors.HexColor('#1e40af'),
-        spaceAfter=30,
-        alignment=TA_CENTER
-    )
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading2'],
-        fontSize=14,
-        textColor=colors.HexColor('#1e40af'),
-        spaceAfter=12,
-        spaceBefore=12
-    )
+    # Estilos compartidos
+    title_style = THEME.title
+    heading_style = THEME.heading
 
     # Titulo
     report_title = "ANÁLISIS DE VENTAS POR CATEGORÍAS/CONFIGURACIONES" if analysis_type == 'categories' else "ANÁLISIS DE VENTAS POR RECURSOS"
@@ -257,12 +297,7 @@ def generate_sales_analysis_pdf(analysis_data, analysis_type):
         [f"Generado: {datetime.now().strftime('%d/%m/%Y %H:%M')}"],
     ]
     company_table = Table(company_data, colWidths=[6*inch])
-    company_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#334155')),
-    ]))
+    company_table.setStyle(THEME.company_table)
     elements.append(company_table)
     elements.append(Spacer(1, 20))
 
@@ -273,12 +308,7 @@ def generate_sales_analysis_pdf(analysis_data, analysis_type):
         [f"Desde: {date_range.get('start', 'N/A')} - Hasta: {date_range.get('end', 'N/A')}"]
     ]
     period_table = Table(period_data, colWidths=[6*inch])
-    period_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (0, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 11),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-    ]))
+    period_table.setStyle(THEME.period_table)
     elements.append(period_table)
     elements.append(Spacer(1, 20))
 
@@ -306,23 +336,11 @@ def generate_sales_analysis_pdf(analysis_data, analysis_type):
         # Crear tabla
         analysis_table = Table(table_data, colWidths=[
                                2.5*inch, 2*inch, 1*inch, 1*inch])
-        analysis_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e40af')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('ALIGN', (2, 0), (3, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 11),
-            ('FONTSIZE', (0, 1), (-1, -1), 9),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#cbd5e1')),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1),
-             [colors.white, colors.HexColor('#f8fafc')]),
-        ]))
+        analysis_table.setStyle(THEME.analysis_table)
         elements.append(analysis_table)
     else:
         no_data_text = Paragraph(
-            "No se encontraron datos para el período seleccionado.", styles['Normal'])
+            "No se encontraron datos para el período seleccionado.", THEME.normal)
         elements.append(no_data_text)
 
     # Total de ingresos
@@ -332,23 +350,14 @@ def generate_sales_analysis_pdf(analysis_data, analysis_type):
         ["TOTAL DE INGRESOS:", f"${total_revenue:.2f}"]
     ]
     total_table = Table(total_data, colWidths=[4.5*inch, 1.5*inch])
-    total_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (0, 0), 'RIGHT'),
-        ('ALIGN', (1, 0), (1, 0), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 14),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.HexColor('#1e40af')),
-        ('BACKGROUND', (1, 0), (1, 0), colors.HexColor('#e0e7ff')),
-        ('BOX', (1, 0), (1, 0), 2, colors.HexColor('#1e40af')),
-    ]))
+    total_table.setStyle(THEME.sales_total_table)
     elements.append(total_table)
 
     # Pie de pagina
     elements.append(Spacer(1, 40))
     footer_text = Paragraph(
         f"Reporte generado el {datetime.now().strftime('%d/%m/%Y a las %H:%M')}<br/>Tecnologías Chapinas, S.A. - Todos los derechos reservados",
-        ParagraphStyle(
-            'footer', parent=styles['Normal'], alignment=TA_CENTER, fontSize=8, textColor=colors.grey)
+        THEME.footer
     )
     elements.append(footer_text)
 
@@ -0,0 +1,111 @@
+import csv
+import io
+import json
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from models.storage import XMLStorage
+
+
+SALES_EXPORT_FIELDS = ('name', 'description', 'revenue', 'percentage')
+
+
+def iter_sales_json(analysis_data: Dict, analysis_type: str) -> Iterator[str]:
+    # Serializa el analisis como JSON elemento por elemento, sin armar el documento completo
+    header = {
+        'type': analysis_type,
+        'date_range': analysis_data.get('date_range', {}),
+        'total_revenue': analysis_data.get('total_revenue', 0.0)
+    }
+    yield json.dumps(header, ensure_ascii=False)[:-1] + ', "items": ['
+    for position, item in enumerate(analysis_data.get('items', [])):
+        row = {field: item.get(field) for field in SALES_EXPORT_FIELDS}
+        yield (', ' if position else '') + json.dumps(row, ensure_ascii=False)
+    yield ']}'
+
+
+def iter_sales_csv(analysis_data: Dict) -> Iterator[str]:
+    # Serializa el analisis como CSV (una fila por elemento), por bloques de filas
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(SALES_EXPORT_FIELDS)
+    for position, item in enumerate(analysis_data.get('items', []), 1):
+        writer.writerow([item.get(field) for field in SALES_EXPORT_FIELDS])
+        if position % 500 == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+class SalesService:
+    # Analisis de ventas por categoria/configuracion y por recurso sobre el cubo de ingresos
+    def __init__(self, storage: XMLStorage):
+        self.storage = storage
+
+    def analyze(self, start_ordinal: int, end_ordinal: int) -> Optional[Dict[str, List[Dict]]]:
+        # Ambos desgloses de las facturas emitidas en el rango, None si no hay facturas
+        revenue_cube = self.storage.get_revenue_cube()
+        if not revenue_cube.has_invoices(start_ordinal, end_ordinal):
+            return None
+        return self.analyze_cells(revenue_cube.cells_in_range(start_ordinal, end_ordinal))
+
+    def analyze_cells(self, cells: Iterable[Tuple[str, str, Optional[str], float]]) -> Dict[str, List[Dict]]:
+        # Una sola pasada sobre las celdas calcula el desglose por categorias y por recursos
+        # Configuraciones, categorias y recursos se buscan una vez por peticion
+        configs = {}
+        categories = {}
+        resources = {}
+        category_revenue = {}
+        resource_revenue = {}
+
+        for category_id, config_id, resource_id, revenue in cells:
+            if config_id not in configs:
+                configs[config_id] = self.storage.get_configuration_by_id(
+                    config_id)
+            if category_id not in categories:
+                categories[category_id] = self.storage.get_category_by_id(
+                    category_id)
+            config = configs[config_id]
+            category = categories[category_id]
+
+            if config and category:
+                key = f"{category.get('name', 'N/A')} - {config.get('name', 'N/A')}"
+                if key not in category_revenue:
+                    category_revenue[key] = {
+                        'name': key,
+                        'description': config.get('description', 'N/A'),
+                        'revenue': 0.0
+                    }
+                category_revenue[key]['revenue'] += revenue
+
+            if resource_id is None:
+                continue
+            if resource_id not in resources:
+                resources[resource_id] = self.storage.get_resource_by_id(
+                    resource_id)
+            resource = resources[resource_id]
+            if resource:
+                key = resource.get('name', 'N/A')
+                if key not in resource_revenue:
+                    resource_revenue[key] = {
+                        'name': key,
+                        'description': resource.get('type', 'N/A'),
+                        'revenue': 0.0
+                    }
+                resource_revenue[key]['revenue'] += revenue
+
+        return {
+            'categories': self.summarize(list(category_revenue.values())),
+            'resources': self.summarize(list(resource_revenue.values()))
+        }
+
+    def summarize(self, analysis_items: List[Dict]) -> List[Dict]:
+        # Calcula porcentajes y ordena por ingresos descendente
+        total_revenue = sum(item['revenue'] for item in analysis_items)
+        for item in analysis_items:
+            if total_revenue > 0:
+                item['percentage'] = (item['revenue'] / total_revenue) * 100
+            else:
+                item['percentage'] = 0.0
+
+        analysis_items.sort(key=lambda x: x['revenue'], reverse=True)
+        return analysis_items
@@ -0,0 +1,28 @@
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+SAMPLE_DB = BACKEND_DIR / 'instance' / 'data' / 'db.xml'
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    # Base vacia en un directorio temporal (XMLStorage la crea al iniciar)
+    return tmp_path / 'db.xml'
+
+
+@pytest.fixture
+def sample_db(tmp_path):
+    # Copia de la base de ejemplo del repositorio, nunca se modifica la original
+    path = tmp_path / 'db.xml'
+    shutil.copy(SAMPLE_DB, path)
+    return path
+
+
+def consumption(nit: str, instance_id: str = '1', hours: str = '1.0', date: str = '01/01/2024 10:00'):
+    return {'nit': nit, 'instance_id': instance_id, 'time_hours': hours, 'date_time': date}
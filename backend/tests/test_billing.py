@@ -0,0 +1,153 @@
+import threading
+
+import pytest
+
+from models.domain import Category, Client, Configuration, ConfigurationResource, Instance, Resource
+from models.sqlite_storage import SQLiteStorage
+from models.storage import XMLStorage
+from services.billing import BillingService
+from conftest import consumption
+
+
+def billable_storage(path, consumptions, storage_class=XMLStorage):
+    # Un recurso, una configuracion y un cliente con una instancia vigente, mas sus consumos
+    if storage_class is XMLStorage:
+        storage = XMLStorage(path, durability='none', binary_snapshot=False)
+    else:
+        storage = storage_class(path, durability='none')
+    storage.add_resources([Resource('1', 'CPU', 'CPU', 'Nucleo', 'HARDWARE', 2.0)])
+    storage.add_categories([Category('1', 'General', '', '', [
+        Configuration('1', 'Basica', '', [ConfigurationResource('1', 1)])])])
+    storage.add_clients([Client('1-K', 'Cliente', 'c', 'p', instances=[
+        Instance('1', '1', 'Instancia', '01/01/2024')])])
+    storage.add_consumptions(consumptions)
+    return storage
+
+
+def test_invalid_hours_raise_validation_error(db_path):
+    storage = billable_storage(db_path, [consumption('1-K'), consumption('1-K', hours='abc')])
+    unbilled = storage.get_unbilled_consumptions_in_range(0, 10 ** 7)
+
+    with pytest.raises(ValueError, match="Horas invalidas en el consumo 1: 'abc'"):
+        BillingService(storage).build_invoices(unbilled, '31/01/2024')
+
+
+def test_invoice_total_is_rate_times_hours(db_path):
+    storage = billable_storage(db_path, [consumption('1-K', hours=str(h)) for h in range(1, 6)])
+    unbilled = storage.get_unbilled_consumptions_in_range(0, 10 ** 7)
+
+    invoices, records, _ = BillingService(storage).build_invoices(unbilled, '31/01/2024')
+    assert records[0]['total_amount'] == 30.0
+    assert records[0]['consumption_ids'] == [str(n) for n in range(5)]
+    assert invoices[0]['consumptions_count'] == 5
+
+
+@pytest.mark.parametrize('storage_class', [XMLStorage, SQLiteStorage])
+def test_concurrent_runs_do_not_bill_twice(tmp_path, monkeypatch, storage_class):
+    storage = billable_storage(tmp_path / 'db', [consumption('1-K') for _ in range(5)], storage_class)
+    service = BillingService(storage)
+
+    # Las dos corridas leen los consumos sin facturar antes de que cualquiera guarde
+    barrier = threading.Barrier(2)
+    add_invoices = storage.add_invoices
+
+    def add_after_both_read(*args, **kwargs):
+        barrier.wait(timeout=5)
+        return add_invoices(*args, **kwargs)
+
+    monkeypatch.setattr(storage, 'add_invoices', add_after_both_read)
+    runs = []
+    threads = [threading.Thread(target=lambda: runs.append(service.run_billing('01/01/2024', '31/01/2024')))
+               for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    invoices = storage.get_invoices()
+    assert len(invoices) == 1
+    assert invoices[0]['invoice_number'] == 'FAC-000001'
+    assert sorted(len(run['invoices']) for run in runs) == [0, 1]
+    assert sorted(run['stats']['billed'] for run in runs) == [0, 5]
+    assert storage.count_unbilled_consumptions() == 0
+
+
+def test_invoices_are_numbered_inside_the_write(db_path):
+    storage = billable_storage(db_path, [consumption('1-K')])
+    service = BillingService(storage)
+    unbilled = storage.get_unbilled_consumptions_in_range(0, 10 ** 7)
+    _, records, _ = service.build_invoices(unbilled, '31/01/2024')
+
+    # Otra factura se guarda entre el armado y el guardado de la corrida
+    storage.add_invoice('MANUAL-1', '1-K', '15/01/2024', 0.0, [])
+    stored = storage.add_invoices(records)
+    assert [invoice['invoice_number'] for invoice in stored] == ['FAC-000002']
+
+
+@pytest.mark.parametrize('storage_class', [XMLStorage, SQLiteStorage])
+def test_incremental_run_advances_the_watermark(tmp_path, storage_class):
+    storage = billable_storage(tmp_path / 'db', [consumption('1-K') for _ in range(3)], storage_class)
+    service = BillingService(storage)
+
+    first = service.run_billing('01/01/2024', '31/01/2024', incremental=True)
+    assert first['stats']['billed'] == 3
+    assert storage.get_billing_state() == {'watermark': 2}
+
+    storage.add_consumptions([consumption('1-K'), consumption('1-K')])
+    second = service.run_billing('01/01/2024', '31/01/2024', incremental=True)
+    assert second['stats']['examined'] == 2
+    assert second['stats']['billed'] == 2
+    assert storage.get_billing_state() == {'watermark': 4}
+
+    # Sin consumos nuevos no se revisa nada ni se escribe el estado
+    third = service.run_billing('01/01/2024', '31/01/2024', incremental=True)
+    assert third['invoices'] == [] and third['stats']['examined'] == 0
+
+
+@pytest.mark.parametrize('storage_class', [XMLStorage, SQLiteStorage])
+def test_incremental_run_bills_carried_over_consumptions(tmp_path, storage_class):
+    storage = billable_storage(tmp_path / 'db', [
+        consumption('1-K', date='10/01/2024 10:00'),
+        consumption('1-K', date='10/02/2024 10:00'),
+        consumption('1-K', date='fecha invalida'),
+        consumption('1-K', date='20/02/2024 10:00')], storage_class)
+    service = BillingService(storage)
+
+    january = service.run_billing('01/01/2024', '31/01/2024', incremental=True)
+    assert january['stats']['billed'] == 1
+    assert january['stats']['carry_over'] == 3
+    # El estado es solo la marca de agua: los pendientes no se guardan como lista de IDs
+    assert storage.get_billing_state() == {'watermark': 3}
+
+    # Febrero ya quedo bajo la marca de agua y se toma del indice por fecha
+    february = service.run_billing('01/02/2024', '29/02/2024', incremental=True)
+    assert february['stats']['billed'] == 2
+    assert sorted(storage.get_invoices()[-1]['consumption_ids']) == ['1', '3']
+    # El de fecha invalida sigue pendiente pero nunca se factura
+    assert storage.count_unbilled_consumptions() == 1
+
+
+@pytest.mark.parametrize('storage_class', [XMLStorage, SQLiteStorage])
+def test_incremental_run_keeps_consumptions_of_a_rejected_invoice(tmp_path, monkeypatch, storage_class):
+    storage = billable_storage(tmp_path / 'db', [consumption('1-K') for _ in range(3)], storage_class)
+    service = BillingService(storage)
+    add_invoices = storage.add_invoices
+
+    # Otra corrida factura el consumo 0 entre el armado y el guardado de esta
+    def add_after_concurrent_run(records, **kwargs):
+        add_invoices([{'invoice_number': None, 'client_nit': '1-K', 'issue_date': '31/01/2024',
+                       'total_amount': 2.0, 'consumption_ids': ['0']}])
+        return add_invoices(records, **kwargs)
+
+    monkeypatch.setattr(storage, 'add_invoices', add_after_concurrent_run)
+    rejected = service.run_billing('01/01/2024', '31/01/2024', incremental=True)
+    monkeypatch.setattr(storage, 'add_invoices', add_invoices)
+    assert rejected['invoices'] == []
+    assert rejected['stats']['billed'] == 0
+    assert storage.get_billing_state() == {'watermark': 2}
+
+    # Los consumos 1 y 2 quedaron bajo la marca de agua sin facturar: la siguiente corrida los factura
+    retry = service.run_billing('01/01/2024', '31/01/2024', incremental=True)
+    assert [invoice['invoice_number'] for invoice in retry['invoices']] == ['FAC-000002']
+    assert sorted(storage.get_invoices()[-1]['consumption_ids']) == ['1', '2']
+    assert storage.count_unbilled_consumptions() == 0
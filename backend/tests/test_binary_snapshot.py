@@ -0,0 +1,42 @@
+import time
+
+from models.domain import Resource
+from models.storage import XMLStorage
+
+
+def add_resource(storage, n):
+    # Cada cambio del catalogo guarda el XML (version nueva para la copia binaria)
+    storage.add_resources([Resource(str(n), f'Recurso {n}', 'R', 'Unidad', 'HARDWARE', 1.0)])
+
+
+def wait_writes(storage, count):
+    for _ in range(300):
+        if storage.metrics['binary_writes'] >= count:
+            return
+        time.sleep(0.01)
+
+
+def test_binary_snapshot_waits_until_shutdown(db_path):
+    storage = XMLStorage(db_path, durability='none', binary_idle=60)
+    for n in range(5):
+        add_resource(storage, n)
+    assert storage.metrics['binary_writes'] == 0
+
+    storage.flush_binary()
+    assert storage.metrics['binary_writes'] == 1
+    reloaded = XMLStorage(db_path, durability='none')
+    assert len(reloaded.get_resources()) == 5
+    assert reloaded.metrics['binary_loads'] == 1
+
+
+def test_binary_snapshot_after_idle_or_every_n_saves(db_path):
+    storage = XMLStorage(db_path, durability='none', binary_idle=60, binary_every=3)
+    for n in range(3):
+        add_resource(storage, n)
+    wait_writes(storage, 1)
+    assert storage.metrics['binary_writes'] == 1
+
+    storage.binary_idle = 0.05
+    add_resource(storage, 3)
+    wait_writes(storage, 2)
+    assert storage.metrics['binary_writes'] == 2
@@ -0,0 +1,23 @@
+from models.domain import Resource
+from models.storage import XMLStorage
+
+
+def resources(start: int, count: int):
+    return [Resource(str(n), f'Recurso {n}', f'R{n}', 'Unidad', 'HARDWARE', 1.5)
+            for n in range(start, start + count)]
+
+
+def test_bulk_write_saves_once(db_path):
+    storage = XMLStorage(db_path, durability='none', binary_snapshot=False)
+    saves = storage.metrics['saves']
+
+    def upload():
+        for start in range(0, 500, 100):
+            storage.add_resources(resources(start, 100))
+        return 'ok'
+
+    assert storage.bulk_write(upload) == 'ok'
+    assert storage.metrics['saves'] == saves + 1
+    assert len(storage.get_resources()) == 500
+    reloaded = XMLStorage(db_path, durability='none', binary_snapshot=False)
+    assert len(reloaded.get_resources()) == 500
@@ -0,0 +1,132 @@
+import threading
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from models.domain import Resource
+from models.indexes import ForkableDict
+from models.storage import XMLStorage
+from conftest import consumption
+
+
+def test_forkable_dict_fork_keeps_the_original():
+    original = ForkableDict({str(n): n for n in range(10)})
+    forked = original.fork()
+    forked['10'] = 10
+    forked['3'] = 'tres'
+    del forked['5']
+
+    assert list(original.items()) == [(str(n), n) for n in range(10)]
+    assert len(original) == 10
+    assert '5' not in forked and forked.get('5') is None
+    assert len(forked) == 10
+    assert list(forked.keys()) == ['0', '1', '2', '3', '4', '6', '7', '8', '9', '10']
+    assert forked['3'] == 'tres'
+    with pytest.raises(KeyError):
+        forked.pop('5')
+
+
+def test_forkable_dict_flattens_long_chains():
+    version = ForkableDict({})
+    for n in range(500):
+        version = version.fork()
+        version[n] = n
+        if n % 3 == 0:
+            del version[n // 2]
+    expected = {n: n for n in range(500)}
+    for n in range(0, 500, 3):
+        expected.pop(n // 2, None)
+
+    assert dict(version.items()) == expected
+    assert len(version) == len(expected)
+    assert len(version.changes) <= 64
+
+
+def test_pinned_reader_does_not_see_appended_consumptions_or_invoices(db_path):
+    storage = XMLStorage(db_path, durability='none', binary_snapshot=False)
+    storage.add_consumptions([consumption('1-K'), consumption('1-K')])
+
+    with storage.read_snapshot():
+        storage.add_consumptions([consumption('2-K')])
+        storage.add_invoice('FAC-000001', '1-K', '31/01/2024', 2.0, ['0', '1'])
+        assert storage.get_summary()['consumptions'] == 2
+        assert storage.get_invoices() == []
+        assert storage.count_unbilled_consumptions() == 2
+
+    assert storage.get_summary()['consumptions'] == 3
+    assert [invoice['invoice_number'] for invoice in storage.get_invoices()] == ['FAC-000001']
+    assert storage.count_unbilled_consumptions() == 1
+
+
+def test_failed_append_leaves_nothing_behind(db_path):
+    storage = XMLStorage(db_path, durability='none', binary_snapshot=False)
+    storage.add_consumptions([consumption('1-K')])
+
+    # El segundo consumo no tiene NIT: el primero ya se agrego a la seccion compartida cuando falla
+    with pytest.raises(KeyError):
+        storage.add_consumptions([consumption('2-K'), {'instance_id': '1'}])
+    assert storage.get_summary()['consumptions'] == 1
+
+    storage.compact()
+    saved = ET.parse(db_path).getroot().find('consumptions')
+    assert [cons_node.get('nit') for cons_node in saved] == ['1-K']
+
+
+def test_published_version_is_not_modified_by_writes(db_path):
+    storage = XMLStorage(db_path, durability='none', binary_snapshot=False)
+    storage.add_resources([Resource('1', 'CPU', 'CPU', 'Nucleo', 'HARDWARE', 1.0)])
+    published = storage.snapshot()
+
+    storage.add_resources([Resource('1', 'CPU', 'CPU', 'Nucleo', 'HARDWARE', 5.0),
+                           Resource('2', 'RAM', 'RAM', 'GB', 'HARDWARE', 1.0)])
+    assert storage.snapshot() is not published
+    resources = published.tree.getroot().find('resources')
+    assert [(res.get('id'), res.findtext('value_per_hour')) for res in resources] == [('1', '1.0')]
+    assert list(published.index.resources.keys()) == ['1']
+
+
+def test_readers_see_whole_versions_during_writes(db_path):
+    storage = XMLStorage(db_path, durability='none', binary_snapshot=False)
+    done = threading.Event()
+    errors = []
+
+    def write():
+        for n in range(100):
+            storage.add_consumptions([consumption('1-K'), consumption('1-K')])
+        done.set()
+
+    def read():
+        # Cada lectura ve una version completa: los dos consumos de cada lote o ninguno
+        seen = 0
+        while not done.is_set():
+            with storage.read_snapshot():
+                count = storage.get_summary()['consumptions']
+                listed = len(storage.get_all_data()['consumptions'])
+            if count != listed or count % 2 or count < seen:
+                errors.append((seen, count, listed))
+            seen = count
+            # Sin fijar la version, get_all_data tambien arma su respuesta con una sola
+            data = storage.get_all_data()
+            if len(data['consumptions']) != data['summary']['consumptions']:
+                errors.append(data['summary'])
+
+    threads = [threading.Thread(target=write)] + [threading.Thread(target=read) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert storage.get_summary()['consumptions'] == 200
+
+
+def test_index_of_an_older_version_keeps_its_sizes(db_path):
+    storage = XMLStorage(db_path, durability='none', binary_snapshot=False)
+    storage.add_consumptions([consumption('1-K') for _ in range(3)])
+    older = storage.snapshot()
+    for _ in range(5):
+        storage.add_consumptions([consumption('2-K')])
+
+    # Las versiones siguientes agregaron a la lista de consumos que comparten con la anterior
+    assert storage.get_index(older.tree) is older.index
+    assert len(storage.get_index(older.tree).consumptions) == 3
+    assert len(storage.get_index().consumptions) == 8
@@ -0,0 +1,80 @@
+import multiprocessing
+import os
+import signal
+import time
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from models.domain import Resource
+from models.locking import fcntl
+from models.storage import XMLStorage
+from conftest import consumption
+
+
+def upload_forever(path, journal_limit):
+    storage = XMLStorage(path, journal_limit=journal_limit, durability='none', binary_snapshot=False)
+    n = 0
+    while True:
+        storage.add_consumptions([consumption(f'{n}-K'), consumption(f'{n}-K')])
+        n += 1
+
+
+@pytest.mark.skipif(fcntl is None, reason='flock no disponible')
+@pytest.mark.parametrize('journal_limit', [5000, 7])
+def test_killed_writer_leaves_a_loadable_database(db_path, journal_limit):
+    # El proceso muere en cualquier punto: agregando al diario, compactando o reemplazando db.xml
+    XMLStorage(db_path, durability='none', binary_snapshot=False)
+    context = multiprocessing.get_context('fork')
+    writer = context.Process(target=upload_forever, args=(db_path, journal_limit))
+    writer.start()
+    time.sleep(0.5)
+    os.kill(writer.pid, signal.SIGKILL)
+    writer.join()
+
+    restarted = XMLStorage(db_path, durability='none', binary_snapshot=False)
+    consumptions = restarted.get_all_data()['consumptions']
+    assert consumptions
+    assert [cons['id'] for cons in consumptions] == [str(n) for n in range(len(consumptions))]
+
+    restarted.add_consumptions([consumption('nuevo')])
+    reloaded = XMLStorage(db_path, durability='none', binary_snapshot=False)
+    ids = [cons['id'] for cons in reloaded.get_all_data()['consumptions']]
+    assert ids == [str(n) for n in range(len(consumptions) + 1)]
+
+
+def test_failed_save_keeps_the_previous_file(db_path, monkeypatch):
+    storage = XMLStorage(db_path, durability='none', binary_snapshot=False)
+    storage.add_resources([Resource('1', 'CPU', 'CPU', 'Nucleo', 'HARDWARE', 1.0)])
+    saved = db_path.read_bytes()
+
+    # La escritura del XML se interrumpe a medias
+    def interrupted_write(self, f, *args, **kwargs):
+        f.write(b'<database><resources>')
+        raise OSError('disco lleno')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(ET.ElementTree, 'write', interrupted_write)
+        with pytest.raises(OSError, match='disco lleno'):
+            storage.add_resources([Resource('2', 'RAM', 'RAM', 'GB', 'HARDWARE', 1.0)])
+
+    assert db_path.read_bytes() == saved
+    assert [path.name for path in db_path.parent.iterdir() if path.suffix == '.tmp'] == []
+    assert [res['id'] for res in storage.get_resources()] == ['1']
+    storage.add_resources([Resource('2', 'RAM', 'RAM', 'GB', 'HARDWARE', 1.0)])
+    reloaded = XMLStorage(db_path, durability='none', binary_snapshot=False)
+    assert [res['id'] for res in reloaded.get_resources()] == ['1', '2']
+
+
+def test_leftover_temp_files_are_ignored(db_path):
+    storage = XMLStorage(db_path, durability='none', binary_snapshot=False)
+    storage.add_consumptions([consumption('1-K')])
+    # Temporales de un proceso que murio antes de reemplazar db.xml y el diario
+    (db_path.parent / f'.{db_path.name}.99999.1.tmp').write_bytes(b'<database><consum')
+    (db_path.parent / f'.{storage.journal_path.name}.99999.1.tmp').write_bytes(b'{"generation"')
+
+    restarted = XMLStorage(db_path, durability='none', binary_snapshot=False)
+    restarted.add_consumptions([consumption('2-K')])
+    restarted.compact()
+    reloaded = XMLStorage(db_path, durability='none', binary_snapshot=False)
+    assert [cons['nit'] for cons in reloaded.get_all_data()['consumptions']] == ['1-K', '2-K']
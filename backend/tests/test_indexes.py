@@ -0,0 +1,29 @@
+import random
+from datetime import date
+
+from models.storage import XMLStorage
+from models.validators import parse_date_ordinal
+from conftest import consumption
+
+
+def test_unbilled_range_matches_a_full_scan(db_path):
+    # Indice por fecha en baldes por mes contra un recorrido completo de los pendientes
+    rng = random.Random(7)
+    storage = XMLStorage(db_path, durability='none', binary_snapshot=False)
+    dates = [f'{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.choice((2023, 2024))} 10:00'
+             for _ in range(400)]
+    storage.add_consumptions([consumption('1-K', date=text) for text in dates])
+    storage.add_consumptions([consumption('1-K', date='sin fecha')])
+    storage.add_invoice('FAC-000001', '1-K', '31/12/2024', 0.0,
+                        [str(cons_id) for cons_id in rng.sample(range(400), 150)])
+
+    unbilled = storage.get_unbilled_consumptions()
+    for _ in range(50):
+        start, end = sorted(rng.randint(date(2022, 12, 1).toordinal(), date(2025, 1, 31).toordinal())
+                            for _ in range(2))
+        expected = [cons['id'] for cons in unbilled
+                    if parse_date_ordinal(cons['date_time']) is not None
+                    and start <= parse_date_ordinal(cons['date_time']) <= end]
+        found = [cons['id'] for cons in storage.get_unbilled_consumptions_in_range(start, end)]
+        assert found == expected
+    assert len(storage.get_unbilled_consumptions_in_range(0, 10 ** 7)) == 250
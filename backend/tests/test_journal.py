@@ -0,0 +1,61 @@
+import json
+import xml.etree.ElementTree as ET
+
+from models.storage import XMLStorage
+from conftest import consumption
+
+
+def consumption_nits(storage):
+    return [cons['nit'] for cons in storage.get_all_data()['consumptions']]
+
+
+def test_journal_survives_reload(db_path):
+    storage = XMLStorage(db_path, durability='none')
+    storage.add_consumptions([consumption('1-K'), consumption('2-K')])
+
+    reloaded = XMLStorage(db_path, durability='none')
+    assert consumption_nits(reloaded) == ['1-K', '2-K']
+
+
+def test_journal_is_compacted_at_limit(db_path):
+    storage = XMLStorage(db_path, journal_limit=3, durability='none')
+    storage.add_consumptions([consumption(f'{n}-K') for n in range(4)])
+
+    assert storage.metrics['compactions'] == 1
+    assert len(ET.parse(db_path).getroot().find('consumptions')) == 4
+    reloaded = XMLStorage(db_path, durability='none')
+    assert consumption_nits(reloaded) == [f'{n}-K' for n in range(4)]
+
+
+def test_stale_journal_is_reset_before_append(db_path):
+    # Corte entre reemplazar db.xml (generacion 2) y reiniciar el diario (aun generacion 1)
+    storage = XMLStorage(db_path, durability='none')
+    storage.add_consumptions([consumption('1-K'), consumption('2-K')])
+    storage.compact()
+    tree = ET.parse(db_path)
+    tree.getroot().set('journal_generation', '2')
+    tree.write(db_path, encoding='utf-8', xml_declaration=True)
+    stale = [json.dumps({'generation': 1}), json.dumps(
+        {'id': '0', 'nit': '1-K', 'instance_id': '1', 'time_hours': '1.0', 'date_time': '01/01/2024 10:00'})]
+    storage.journal_path.write_text('\n'.join(stale) + '\n', encoding='utf-8')
+
+    restarted = XMLStorage(db_path, durability='none')
+    assert consumption_nits(restarted) == ['1-K', '2-K']
+    restarted.add_consumptions([consumption('3-K')])
+    assert consumption_nits(restarted) == ['1-K', '2-K', '3-K']
+
+    reloaded = XMLStorage(db_path, durability='none')
+    assert consumption_nits(reloaded) == ['1-K', '2-K', '3-K']
+
+
+def test_incomplete_journal_line_is_skipped(db_path):
+    storage = XMLStorage(db_path, durability='none')
+    storage.add_consumptions([consumption('1-K')])
+    with open(storage.journal_path, 'a', encoding='utf-8') as journal:
+        journal.write('{"id": "1", "nit": "2-')  # Escritura interrumpida
+
+    restarted = XMLStorage(db_path, durability='none')
+    assert consumption_nits(restarted) == ['1-K']
+    restarted.add_consumptions([consumption('3-K')])
+    assert consumption_nits(XMLStorage(db_path, durability='none')) == [
+        '1-K', '3-K']
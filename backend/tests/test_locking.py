@@ -0,0 +1,169 @@
+import multiprocessing
+import threading
+import time
+
+import pytest
+
+from models.locking import FileLock, WriteQueue, fcntl
+from models.storage import XMLStorage
+from conftest import consumption
+
+pytestmark = pytest.mark.skipif(fcntl is None, reason='flock no disponible')
+
+
+def hold_exclusive(path, acquired, release):
+    with FileLock(path).exclusive():
+        acquired.set()
+        release.wait(timeout=10)
+
+
+def test_exclusive_lock_excludes_other_process(tmp_path):
+    path = tmp_path / 'db.lock'
+    context = multiprocessing.get_context('fork')
+    acquired, release = context.Event(), context.Event()
+    holder = context.Process(target=hold_exclusive, args=(path, acquired, release))
+    holder.start()
+    try:
+        assert acquired.wait(timeout=10)
+        entered = threading.Event()
+
+        def read():
+            with FileLock(path).shared():
+                entered.set()
+
+        reader = threading.Thread(target=read)
+        reader.start()
+        # Mientras el otro proceso escribe nadie lee
+        assert not entered.wait(timeout=0.3)
+        release.set()
+        assert entered.wait(timeout=10)
+        reader.join()
+    finally:
+        release.set()
+        holder.join()
+
+
+def test_exclusive_lock_excludes_threads_of_the_same_process(tmp_path):
+    lock = FileLock(tmp_path / 'db.lock')
+    events = []
+    acquired = threading.Event()
+
+    def first():
+        with lock.exclusive():
+            acquired.set()
+            time.sleep(0.2)
+            events.append('first')
+
+    def second():
+        acquired.wait(timeout=5)
+        with lock.exclusive():
+            events.append('second')
+
+    threads = [threading.Thread(target=first), threading.Thread(target=second)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert events == ['first', 'second']
+
+
+def test_shared_locks_are_held_together(tmp_path):
+    lock = FileLock(tmp_path / 'db.lock')
+    # Ambos lectores llegan a la barrera con el bloqueo compartido tomado
+    barrier = threading.Barrier(2)
+    errors = []
+
+    def read():
+        with lock.shared():
+            try:
+                barrier.wait(timeout=5)
+            except threading.BrokenBarrierError as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=read) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+
+def blocking_queue():
+    # Cola cuyo primer lote espera a `release`: las mutaciones que llegan mientras tanto se juntan
+    batches = []
+    started, release = threading.Event(), threading.Event()
+
+    def run_batch(batch):
+        batches.append(len(batch))
+        started.set()
+        release.wait(timeout=5)
+        for item in batch:
+            try:
+                item['result'] = item['fn']()
+            except Exception as e:
+                item['error'] = e
+
+    return WriteQueue(run_batch), batches, started, release
+
+
+def test_write_queue_coalesces_waiting_writes():
+    queue, batches, started, release = blocking_queue()
+    results = {}
+
+    def submit(n):
+        results[n] = queue.submit(lambda: n * 10)
+
+    first = threading.Thread(target=submit, args=(0,))
+    first.start()
+    assert started.wait(timeout=5)
+    waiting = [threading.Thread(target=submit, args=(n,)) for n in range(1, 6)]
+    for thread in waiting:
+        thread.start()
+    while len(queue.pending) < 5:
+        time.sleep(0.01)
+    release.set()
+    for thread in [first] + waiting:
+        thread.join()
+
+    assert batches == [1, 5]
+    assert results == {n: n * 10 for n in range(6)}
+
+
+def test_write_queue_reports_each_error_to_its_caller():
+    queue, _, _, release = blocking_queue()
+    release.set()
+
+    def fail():
+        raise ValueError('invalido')
+
+    with pytest.raises(ValueError, match='invalido'):
+        queue.submit(fail)
+    assert queue.submit(lambda: 'ok') == 'ok'
+    assert queue.leader is None
+
+
+def test_write_queue_runs_nested_writes_in_the_current_batch():
+    queue, batches, _, release = blocking_queue()
+    release.set()
+
+    assert queue.submit(lambda: queue.submit(lambda: 'anidada')) == 'anidada'
+    assert batches == [1]
+
+
+def test_storage_writes_from_many_threads_are_batched(db_path):
+    storage = XMLStorage(db_path, durability='none', binary_snapshot=False)
+    storage.add_consumptions([consumption('0-K')])
+
+    def upload(worker):
+        for n in range(20):
+            storage.add_consumptions([consumption(f'{worker}-{n}')])
+
+    threads = [threading.Thread(target=upload, args=(worker,)) for worker in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    ids = [cons['id'] for cons in storage.get_all_data()['consumptions']]
+    assert sorted(ids, key=int) == [str(n) for n in range(161)]
+    assert storage.metrics['write_batches'] + storage.metrics['coalesced_writes'] == 161
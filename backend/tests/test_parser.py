@@ -0,0 +1,126 @@
+import xml.etree.ElementTree as ET
+from io import BytesIO
+
+import pytest
+
+from models import parser
+
+
+def consumptions_xml(items):
+    return '<listadoConsumos>' + ''.join(items) + '</listadoConsumos>'
+
+
+def consumo(nit, instance='1', time='1.5', date='01/01/2024 10:00', extra=''):
+    return (f'<consumo nitCliente="{nit}" idInstancia="{instance}">'
+            f'<tiempo>{time}</tiempo><fechaHora>{date}</fechaHora>{extra}</consumo>')
+
+
+def stream_consumptions(xml_text):
+    return list(parser.iter_consumptions_xml(BytesIO(xml_text.encode('utf-8'))))
+
+
+@pytest.mark.parametrize('items', [
+    [],
+    [consumo('110339-0')],
+    # NIT invalido al inicio, en medio y al final
+    [consumo('123'), consumo('110339-0'), consumo('abc'), consumo('110339-0', '2'), consumo('')],
+    # Fecha con texto alrededor, sin tiempo ni fecha
+    [consumo('110339-0', date='Guatemala, 01/02/2024 08:30 hrs'),
+     '<consumo nitCliente="110339-0" idInstancia="3"/>'],
+    # Consumos anidados dentro de otro elemento o de un consumo: ninguno de los dos los toma
+    [consumo('110339-0', extra=consumo('110339-0', '9')),
+     '<otros>' + consumo('110339-0', '8') + '</otros>'],
+])
+def test_streaming_consumptions_match_the_full_parser(items):
+    xml_text = consumptions_xml(items)
+    assert stream_consumptions(xml_text) == parser.parse_consumptions_xml(xml_text)
+
+
+def test_streaming_consumptions_match_on_a_large_file():
+    items = [consumo('110339-0' if n % 7 else '1', str(n % 5), str(n), f'{n % 28 + 1:02d}/01/2024 10:00')
+             for n in range(2500)]
+    xml_text = consumptions_xml(items)
+    parsed = parser.parse_consumptions_xml(xml_text)
+    assert stream_consumptions(xml_text) == parsed
+    assert len(parsed) == 2500 - len(range(0, 2500, 7))
+
+
+def test_streaming_consumptions_fail_on_malformed_xml():
+    with pytest.raises(ET.ParseError):
+        stream_consumptions(consumptions_xml([consumo('110339-0')])[:-5])
+
+
+def recurso(res_id, name='CPU'):
+    return (f'<recurso id="{res_id}"><nombre>{name}</nombre><abreviatura>C</abreviatura>'
+            f'<metrica>Nucleo</metrica><tipo>HARDWARE</tipo><valorXhora>{res_id}.5</valorXhora></recurso>')
+
+
+def categoria(cat_id, configurations=2):
+    configs = ''.join(
+        f'<configuracion id="{cat_id}{n}"><nombre>Config {n}</nombre><descripcion>d</descripcion>'
+        f'<recursosConfiguracion><recurso id="{n}">{n + 1}</recurso><recurso id="9">0.5</recurso>'
+        f'</recursosConfiguracion></configuracion>' for n in range(configurations))
+    return (f'<categoria id="{cat_id}"><nombre>Cat {cat_id}</nombre><descripcion>d</descripcion>'
+            f'<cargaTrabajo>w</cargaTrabajo><listaConfiguraciones>{configs}</listaConfiguraciones></categoria>')
+
+
+def cliente(nit, instances=1):
+    items = ''.join(
+        f'<instancia id="{n}"><idConfiguracion>1</idConfiguracion><nombre>Inst {n}</nombre>'
+        f'<fechaInicio>inicio 01/01/2024</fechaInicio><estado>Vigente</estado></instancia>'
+        for n in range(instances))
+    return (f'<cliente nit="{nit}"><nombre>Cliente</nombre><usuario>u</usuario><clave>c</clave>'
+            f'<direccion>d</direccion><correoElectronico>e@x.com</correoElectronico>'
+            f'<listaInstancias>{items}</listaInstancias></cliente>')
+
+
+def configurations_xml(resources=(), categories=(), clients=(), extra=''):
+    return ('<archivoConfiguraciones>'
+            f'<listaRecursos>{"".join(resources)}</listaRecursos>'
+            f'<listaCategorias>{"".join(categories)}</listaCategorias>'
+            f'<listaClientes>{"".join(clients)}</listaClientes>{extra}'
+            '</archivoConfiguraciones>')
+
+
+def stream_configurations(xml_text, batch_size):
+    # Une los lotes del parser incremental en las mismas listas que produce parse_configurations_xml
+    streamed = {'resources': [], 'categories': [], 'clients': []}
+    for kind, items in parser.iter_configurations_xml(BytesIO(xml_text.encode('utf-8')), batch_size):
+        assert 0 < len(items) <= batch_size
+        streamed[kind].extend(items)
+    return streamed['resources'], streamed['categories'], streamed['clients']
+
+
+SAMPLE_CONFIGURATION = configurations_xml(
+    resources=[recurso(n) for n in range(1, 6)],
+    categories=[categoria(n, configurations=n) for n in range(1, 4)],
+    # NIT invalido al inicio, en medio y al final: cae en distintas posiciones de los lotes
+    clients=[cliente('1'), cliente('110339-0', 2), cliente('abc'), cliente('4440000-1', 3), cliente('')],
+    # Listas anidadas fuera del primer nivel: ninguno de los dos parsers las toma
+    extra=f'<otros><listaRecursos>{recurso(99)}</listaRecursos></otros>')
+
+
+@pytest.mark.parametrize('batch_size', [1, 2, 3, 4, 5, 7, 500])
+def test_streaming_configurations_match_the_full_parser(batch_size):
+    resources, categories, clients, counts = parser.parse_configurations_xml(SAMPLE_CONFIGURATION)
+    assert stream_configurations(SAMPLE_CONFIGURATION, batch_size) == (resources, categories, clients)
+    assert (counts['resources'], counts['categories'], counts['clients']) == (5, 3, 2)
+
+
+def test_streaming_configurations_ignore_repeated_lists():
+    # parse_configurations_xml solo lee la primera lista de cada tipo
+    xml_text = configurations_xml(resources=[recurso(1)], extra=f'<listaRecursos>{recurso(2)}</listaRecursos>')
+    resources, categories, clients, _ = parser.parse_configurations_xml(xml_text)
+    assert stream_configurations(xml_text, 10) == (resources, categories, clients)
+
+
+@pytest.mark.parametrize('xml_text', [
+    configurations_xml(resources=[recurso(1), recurso('x')]),
+    configurations_xml(categories=[categoria('x')]),
+    configurations_xml(clients=[cliente('110339-0').replace('<instancia id="0">', '<instancia id="x">')]),
+])
+def test_invalid_ids_fail_in_both_parsers(xml_text):
+    with pytest.raises(ValueError):
+        parser.parse_configurations_xml(xml_text)
+    with pytest.raises(ValueError):
+        stream_configurations(xml_text, 1)
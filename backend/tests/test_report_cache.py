@@ -0,0 +1,64 @@
+import os
+
+from services.report_cache import PDFCache
+
+KB = 1024
+
+
+def touch(cache, name, seconds):
+    # Fija la fecha de uso de una entrada (el LRU ordena por mtime)
+    os.utime(cache.directory / name, ns=(seconds * 10 ** 9, seconds * 10 ** 9))
+
+
+def test_entry_name_is_a_hash_of_the_report_data():
+    cache = PDFCache(None, 0)
+    data = {'invoice': {'number': 'FAC-1', 'total': 10.0}, 'instances': [{'id': '1'}]}
+    reordered = {'instances': [{'id': '1'}], 'invoice': {'total': 10.0, 'number': 'FAC-1'}}
+
+    assert cache.entry_name('FAC-1', data) == cache.entry_name('FAC-1', reordered)
+    changed = dict(data, invoice={'number': 'FAC-1', 'total': 11.0})
+    assert cache.entry_name('FAC-1', data) != cache.entry_name('FAC-1', changed)
+    assert cache.entry_name('../FAC 1', data).startswith('___FAC_1-')
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = PDFCache(tmp_path, max_bytes=3 * KB)
+    for n, used_at in ((1, 100), (2, 300), (3, 200)):
+        cache.put(f'F{n}-a.pdf', b'x' * KB)
+        touch(cache, f'F{n}-a.pdf', used_at)
+    # Un acierto marca la entrada como usada recientemente
+    assert cache.get('F1-a.pdf') == b'x' * KB
+
+    cache.put('F4-a.pdf', b'y' * KB)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['F1-a.pdf', 'F2-a.pdf', 'F4-a.pdf']
+    assert cache.metrics['evictions'] == 1
+
+
+def test_new_version_of_an_invoice_replaces_the_previous_one(tmp_path):
+    cache = PDFCache(tmp_path, max_bytes=10 * KB)
+    cache.put('FAC-1-old.pdf', b'old')
+    cache.put('FAC-10-other.pdf', b'other')
+    cache.put('FAC-1-new.pdf', b'new')
+
+    assert cache.get('FAC-1-old.pdf') is None
+    assert cache.get('FAC-1-new.pdf') == b'new'
+    assert cache.get('FAC-10-other.pdf') == b'other'
+
+
+def test_entry_evicted_by_another_process_is_a_miss(tmp_path):
+    cache = PDFCache(tmp_path, max_bytes=10 * KB)
+    cache.put('FAC-1-a.pdf', b'pdf')
+    assert cache.contains('FAC-1-a.pdf')
+
+    # Otro worker lo desaloja entre la consulta y la lectura
+    (tmp_path / 'FAC-1-a.pdf').unlink()
+    assert cache.get('FAC-1-a.pdf') is None
+    assert cache.metrics['misses'] == 1
+
+
+def test_disabled_cache_stores_nothing(tmp_path):
+    cache = PDFCache(tmp_path / 'reports', max_bytes=0)
+    cache.put('FAC-1-a.pdf', b'pdf')
+    assert not cache.contains('FAC-1-a.pdf')
+    assert cache.get('FAC-1-a.pdf') is None
+    assert not (tmp_path / 'reports').exists()
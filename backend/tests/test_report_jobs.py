@@ -0,0 +1,73 @@
+import json
+import time
+
+from services.report_jobs import ReportJobQueue
+
+
+def wait_finished(queue, job_id):
+    for _ in range(200):
+        job = queue.status(job_id)
+        if job['status'] in ('done', 'error'):
+            return job
+        time.sleep(0.01)
+    raise AssertionError('El trabajo no termino')
+
+
+def test_job_status_is_shared_through_the_directory(tmp_path):
+    # Dos colas sobre el mismo directorio hacen de dos workers del servidor
+    first = ReportJobQueue(tmp_path, workers=1)
+    job = first.submit('ventas', 'ventas.csv', 'text/csv', lambda: b'a,b\n')
+    assert job['status'] == 'pending'
+    wait_finished(first, job['id'])
+
+    second = ReportJobQueue(tmp_path, workers=1)
+    assert second.status(job['id'])['status'] == 'done'
+    assert second.artifact(job['id'])['path'].read_bytes() == b'a,b\n'
+    assert 'owner' not in second.status(job['id'])
+
+
+def test_failed_render_reports_its_error(tmp_path):
+    queue = ReportJobQueue(tmp_path, workers=1)
+
+    def render():
+        raise ValueError('sin datos')
+
+    job = wait_finished(queue, queue.submit('factura', 'factura.pdf', 'application/pdf', render)['id'])
+    assert job['status'] == 'error' and job['error'] == 'sin datos'
+    assert queue.artifact(job['id']) is None
+
+
+def test_pending_job_of_a_finished_process_is_an_error(tmp_path):
+    job_id = 'a' * 32
+    (tmp_path / f'{job_id}.job').write_text(json.dumps({
+        'id': job_id, 'kind': 'factura', 'status': 'running', 'error': None,
+        'download_name': 'factura.pdf', 'mimetype': 'application/pdf',
+        'created_at': time.time(), 'finished_at': None,
+        'file': f'{job_id}.pdf', 'owner': [2 ** 22 + 1, 'otro proceso']}))
+
+    queue = ReportJobQueue(tmp_path, workers=1)
+    assert queue.status(job_id)['status'] == 'error'
+
+
+def test_prune_by_keep_and_age(tmp_path):
+    queue = ReportJobQueue(tmp_path, workers=1, keep=2)
+    ids = []
+    for n in range(4):
+        ids.append(queue.submit('ventas', 'ventas.json', 'application/json', lambda: b'{}')['id'])
+        wait_finished(queue, ids[-1])
+    assert [queue.status(job_id) is not None for job_id in ids] == [False, False, True, True]
+    assert not (tmp_path / f'{ids[0]}.job').exists() and not (tmp_path / f'{ids[0]}.json').exists()
+    assert queue.artifact(ids[3])['path'].read_bytes() == b'{}'
+
+    # Al reiniciar no se borra nada que no haya vencido
+    restarted = ReportJobQueue(tmp_path, workers=1, keep=2)
+    assert restarted.status(ids[3])['status'] == 'done'
+    expired = ReportJobQueue(tmp_path, workers=1, keep=2, max_age=0)
+    assert expired.status(ids[3]) is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_invalid_job_id(tmp_path):
+    queue = ReportJobQueue(tmp_path, workers=1)
+    assert queue.status('../../etc/passwd') is None
+    assert queue.artifact('no-existe') is None
@@ -0,0 +1,126 @@
+import sqlite3
+import threading
+from datetime import date
+
+import pytest
+
+from models.domain import Category, Client, Configuration, ConfigurationResource, Instance, Resource
+from models.sqlite_storage import SQLiteStorage
+from models.storage import XMLStorage
+from conftest import consumption
+
+
+def test_concurrent_consumption_batches_get_unique_ids(tmp_path):
+    storage = SQLiteStorage(tmp_path / 'db.sqlite3', durability='none')
+    errors = []
+
+    def upload(worker):
+        try:
+            for n in range(50):
+                storage.add_consumptions([consumption(f'{worker}-{n}')])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=upload, args=(worker,))
+               for worker in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    consumptions = storage.get_all_data()['consumptions']
+    assert len(consumptions) == 300
+    assert len({cons['id'] for cons in consumptions}) == 300
+
+
+def test_rate_cache_sees_price_change_from_another_process(tmp_path):
+    # Dos instancias sobre el mismo archivo hacen de dos workers
+    path = tmp_path / 'db.sqlite3'
+    first = SQLiteStorage(path, durability='none')
+    second = SQLiteStorage(path, durability='none')
+    first.add_resources([Resource('1', 'CPU', 'CPU', 'Nucleo', 'HARDWARE', 1.0)])
+    first.add_categories([Category('1', 'General', '', '', [
+        Configuration('1', 'Basica', '', [ConfigurationResource('1', 1)])])])
+
+    assert second.get_rate_table().hourly_rate('1') == 1.0
+    first.add_resources([Resource('1', 'CPU', 'CPU', 'Nucleo', 'HARDWARE', 99.0)])
+    assert second.get_rate_table().hourly_rate('1') == 99.0
+    assert first.get_rate_table().hourly_rate('1') == 99.0
+
+
+def test_revenue_cube_sees_invoices_from_another_process(tmp_path):
+    path = tmp_path / 'db.sqlite3'
+    first = SQLiteStorage(path, durability='none')
+    second = SQLiteStorage(path, durability='none')
+    first.add_resources([Resource('1', 'CPU', 'CPU', 'Nucleo', 'HARDWARE', 2.0)])
+    first.add_categories([Category('1', 'General', '', '', [
+        Configuration('1', 'Basica', '', [ConfigurationResource('1', 1)])])])
+    first.add_clients([Client('1-K', 'Cliente', 'c', 'p', instances=[
+        Instance('1', '1', 'Instancia', '01/01/2024')])])
+    first.add_consumptions([consumption('1-K')])
+
+    january = (date(2024, 1, 1).toordinal(), date(2024, 1, 31).toordinal())
+    assert not second.get_revenue_cube().has_invoices(*january)
+    first.add_invoices([{'invoice_number': 'FAC-000001', 'client_nit': '1-K', 'issue_date': '31/01/2024',
+                         'total_amount': 2.0, 'consumption_ids': ['0']}])
+    assert second.get_revenue_cube().has_invoices(*january)
+
+
+DUPLICATED_IDS_XML = """<database>
+<resources>
+  <resource id="1"><name>CPU</name><abbreviation>C</abbreviation><metric>Nucleo</metric><type>HARDWARE</type><value_per_hour>1.0</value_per_hour></resource>
+  <resource id="1"><name>CPU repetido</name><abbreviation>C</abbreviation><metric>Nucleo</metric><type>HARDWARE</type><value_per_hour>9.0</value_per_hour></resource>
+</resources>
+<categories>
+  <category id="1"><name>General</name><description/><workload/><configurations>
+    <configuration id="1"><name>Basica</name><description/><resources><resource id="1">1</resource></resources></configuration>
+  </configurations></category>
+  <category id="1"><name>Repetida</name><description/><workload/><configurations>
+    <configuration id="1"><name>Basica repetida</name><description/><resources><resource id="1">5</resource></resources></configuration>
+    <configuration id="2"><name>Extra</name><description/><resources><resource id="1">2</resource></resources></configuration>
+  </configurations></category>
+</categories>
+<clients>
+  <client nit="1-K"><name>Cliente</name><username/><password/><address/><email/><instances>
+    <instance id="1"><configuration_id>1</configuration_id><name>Instancia</name><start_date>01/01/2024</start_date><status>Vigente</status><end_date/></instance>
+  </instances></client>
+  <client nit="1-K"><name>Repetido</name><username/><password/><address/><email/><instances>
+    <instance id="1"><configuration_id>2</configuration_id><name>Otra</name><start_date>01/01/2024</start_date><status>Vigente</status><end_date/></instance>
+  </instances></client>
+</clients>
+<consumptions/>
+<invoices/>
+</database>"""
+
+
+def test_import_with_duplicated_ids_keeps_the_first_like_xml(tmp_path):
+    xml_path = tmp_path / 'db.xml'
+    xml_path.write_text(DUPLICATED_IDS_XML, encoding='utf-8')
+    xml_storage = XMLStorage(xml_path, durability='none', binary_snapshot=False)
+    storage = SQLiteStorage(tmp_path / 'db.sqlite3', durability='none')
+    storage.import_xml(xml_path)
+
+    for source in (xml_storage, storage):
+        assert source.get_resource_by_id('1')['value_per_hour'] == 1.0
+        assert source.get_category_by_id('1')['name'] == 'General'
+        assert source.get_configuration_by_id('1')['name'] == 'Basica'
+        assert source.get_configuration_by_id('2')['category_id'] == '1'
+        assert source.get_instance_by_id('1-K', '1')['name'] == 'Instancia'
+
+
+def test_failed_import_keeps_the_previous_content(tmp_path):
+    storage = SQLiteStorage(tmp_path / 'db.sqlite3', durability='none')
+    storage.add_resources([Resource('1', 'CPU', 'CPU', 'Nucleo', 'HARDWARE', 1.0)])
+    storage.add_consumptions([consumption('1-K')])
+    before = storage.get_all_data()
+
+    # Una factura sin numero viola NOT NULL a mitad de la importacion
+    xml_path = tmp_path / 'db.xml'
+    xml_path.write_text(DUPLICATED_IDS_XML.replace(
+        '<invoices/>', '<invoices><invoice nit="1-K"><issue_date>31/01/2024</issue_date></invoice></invoices>'),
+        encoding='utf-8')
+    with pytest.raises(sqlite3.IntegrityError):
+        storage.import_xml(xml_path)
+
+    assert storage.get_all_data() == before
@@ -0,0 +1,81 @@
+import multiprocessing
+import threading
+
+import pytest
+
+from models.domain import Resource
+from models.locking import fcntl
+from models.sqlite_storage import SQLiteStorage
+from models.storage import XMLStorage
+from services.billing import BillingService
+from conftest import consumption
+
+# 4 procesos (workers del servidor) x 4 hilos escribiendo y facturando sobre el mismo archivo
+PROCESSES = 4
+THREADS = 4
+WRITES = 10
+
+pytestmark = pytest.mark.skipif(fcntl is None, reason='flock no disponible')
+
+
+def open_storage(path, storage_class):
+    if storage_class is XMLStorage:
+        return XMLStorage(path, journal_limit=50, durability='none', binary_snapshot=False)
+    return storage_class(path, durability='none')
+
+
+def stress_worker(path, storage_class, process):
+    storage = open_storage(path, storage_class)
+    service = BillingService(storage)
+    errors = []
+
+    def run(thread):
+        try:
+            for n in range(WRITES):
+                resource_id = f'{process}-{thread}-{n}'
+                storage.add_resources([Resource(resource_id, resource_id, 'R', 'Nucleo', 'HARDWARE', 1.0)])
+                storage.add_consumptions([consumption(resource_id), consumption(resource_id)])
+            # Las corridas de todos los hilos y procesos compiten por los mismos consumos
+            service.run_billing('01/01/2024', '31/01/2024')
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(thread,)) for thread in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+
+
+@pytest.mark.parametrize('storage_class', [XMLStorage, SQLiteStorage])
+def test_processes_and_threads_write_and_bill_the_same_file(tmp_path, storage_class):
+    path = tmp_path / 'db'
+    open_storage(path, storage_class)
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=stress_worker, args=(path, storage_class, process))
+               for process in range(PROCESSES)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert [worker.exitcode for worker in workers] == [0] * PROCESSES
+
+    storage = open_storage(path, storage_class)
+    BillingService(storage).run_billing('01/01/2024', '31/01/2024')
+    writes = PROCESSES * THREADS * WRITES
+
+    assert len(storage.get_resources()) == writes
+    # Ningun id de consumo repetido, aunque los lotes llegaron de procesos distintos
+    consumptions = storage.get_all_data()['consumptions']
+    assert len(consumptions) == 2 * writes
+    assert len({cons['id'] for cons in consumptions}) == 2 * writes
+
+    # Cada consumo quedo en una sola factura y los numeros no se repiten
+    invoices = storage.get_invoices()
+    billed = [cons_id for invoice in invoices for cons_id in invoice['consumption_ids']]
+    assert sorted(billed) == sorted(cons['id'] for cons in consumptions)
+    assert sorted(invoice['invoice_number'] for invoice in invoices) == [
+        f'FAC-{n:06d}' for n in range(1, len(invoices) + 1)]
+    assert storage.count_unbilled_consumptions() == 0
@@ -26,6 +26,11 @@ urlpatterns = [
     # Nuevas rutas Semana 4 - Reportes
     path('reporte/factura/', views.report_invoice, name='report_invoice'),
     path('reporte/ventas/', views.report_sales, name='report_sales'),
+    path('reporte/trabajo/<str:job_id>/', views.report_job, name='report_job'),
+    path('reporte/trabajo/<str:job_id>/estado/', views.report_job_status,
+         name='report_job_status'),
+    path('reporte/trabajo/<str:job_id>/descargar/', views.report_job_download,
+         name='report_job_download'),
     path('ayuda/', views.help_page, name='help'),
     path('documentacion/', views.documentation_page, name='documentation'),
 ]
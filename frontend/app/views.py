@@ -1,5 +1,5 @@
 from django.shortcuts import render, redirect
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.contrib import messages
 import requests
 import json
@@ -622,24 +622,21 @@ def report_invoice(request):
             })
 
         try:
-            from django.http import HttpResponse
-            response = requests.get(
-                f'{BACKEND_URL}/reporte/factura/{invoice_id}', timeout=10)
+            # El backend encola el reporte y responde de inmediato; el PDF se descarga al terminar
+            response = requests.post(
+                f'{BACKEND_URL}/reporte/trabajos',
+                json={'report': 'factura', 'invoice_id': invoice_id},
+                timeout=10)
 
-            if response.status_code == 200:
-                # Retornar PDF
-                pdf_response = HttpResponse(
-                    response.content, content_type='application/pdf')
-                pdf_response[
-                    'Content-Disposition'] = f'attachment; filename="factura_{invoice_id}.pdf"'
-                return pdf_response
+            if response.status_code == 202:
+                return redirect('report_job', job_id=response.json()['job']['id'])
             else:
                 # Recargar pagina con error
                 invoices_response = requests.get(f'{BACKEND_URL}/facturas')
                 invoices = invoices_response.json().get(
                     'invoices', []) if invoices_response.status_code == 200 else []
                 return render(request, 'report_invoice.html', {
-                    'error': 'Error al generar reporte PDF',
+                    'error': response.json().get('error', 'Error al generar reporte PDF'),
                     'invoices': invoices
                 })
         except Exception as e:
@@ -675,27 +672,23 @@ def report_sales(request):
             start_date_formatted = start_date_obj.strftime('%d/%m/%Y')
             end_date_formatted = end_date_obj.strftime('%d/%m/%Y')
 
-            from django.http import HttpResponse
+            # El backend encola el reporte y responde de inmediato; el PDF se descarga al terminar
             response = requests.post(
-                f'{BACKEND_URL}/reporte/ventas',
+                f'{BACKEND_URL}/reporte/trabajos',
                 json={
+                    'report': 'ventas',
                     'type': analysis_type,
                     'start_date': start_date_formatted,
                     'end_date': end_date_formatted
                 },
-                timeout=30
+                timeout=10
             )
 
-            if response.status_code == 200:
-                # Retornar PDF
-                pdf_response = HttpResponse(
-                    response.content, content_type='application/pdf')
-                pdf_response[
-                    'Content-Disposition'] = f'attachment; filename="analisis_ventas_{analysis_type}.pdf"'
-                return pdf_response
+            if response.status_code == 202:
+                return redirect('report_job', job_id=response.json()['job']['id'])
             else:
                 return render(request, 'report_sales.html', {
-                    'error': 'Error al generar reporte de ventas'
+                    'error': response.json().get('error', 'Error al generar reporte de ventas')
                 })
         except Exception as e:
             return render(request, 'report_sales.html', {
@@ -703,6 +696,65 @@ def report_sales(request):
             })
 
 
+def report_job(request, job_id):
+    """Pagina de espera de un reporte encolado, consulta el estado hasta que el archivo esta listo"""
+    job = None
+    error = None
+    try:
+        response = requests.get(
+            f'{BACKEND_URL}/reporte/trabajos/{job_id}', timeout=5)
+        if response.status_code == 200:
+            job = response.json().get('job')
+            if job.get('status') == 'error':
+                error = job.get('error') or 'Error al generar el reporte'
+        else:
+            error = response.json().get('error', 'Trabajo no encontrado')
+    except Exception as e:
+        error = str(e)
+
+    return render(request, 'report_job.html', {
+        'job_id': job_id,
+        'job': job,
+        'error': error
+    })
+
+
+def report_job_status(request, job_id):
+    """Estado de un reporte encolado (JSON para el polling de la pagina de espera)"""
+    try:
+        response = requests.get(
+            f'{BACKEND_URL}/reporte/trabajos/{job_id}', timeout=5)
+        return JsonResponse(response.json(), status=response.status_code)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=502)
+
+
+def report_job_download(request, job_id):
+    """Descarga el archivo de un reporte terminado"""
+    try:
+        response = requests.get(
+            f'{BACKEND_URL}/reporte/trabajos/{job_id}/archivo', timeout=10, stream=True)
+        if response.status_code != 200:
+            return render(request, 'report_job.html', {
+                'job_id': job_id,
+                'job': None,
+                'error': response.json().get('error', 'Error al descargar el reporte')
+            })
+
+        file_response = StreamingHttpResponse(
+            response.iter_content(chunk_size=64 * 1024),
+            content_type=response.headers.get('Content-Type', 'application/pdf'))
+        file_response['Content-Disposition'] = response.headers.get(
+            'Content-Disposition', f'attachment; filename="reporte_{job_id}"')
+        return file_response
+    except Exception as e:
+        return render(request, 'report_job.html', {
+            'job_id': job_id,
+            'job': None,
+            'error': str(e)
+        })
+
+
 def help_page(request):
     """Pagina de ayuda con informacion del estudiante"""
     return render(request, 'help.html')